@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+"""
+Generates a synthetic curated index in the same structure as
+applications-en.json, for measuring performance with large catalogues.
+
+Usage:
+    generate_index.py <number of apps> <output directory> [seed]
+"""
+
+import json
+import os
+import random
+import sys
+
+CATEGORIES = ["accessories", "development", "education", "games", "graphics",
+              "internet", "multimedia", "office", "servers", "system", "universal-access"]
+SYLLABLES = ["ba", "ke", "lo", "mi", "nu", "ra", "so", "ti", "ve", "zu", "pho", "gra",
+             "off", "ice", "tex", "edit", "net", "play", "cal", "dev", "term", "view"]
+LICENSES = ["GPL-2.0", "GPL-3.0", "LGPL-2.1", "MIT", "BSD-3-Clause", "Apache-2.0", "MPL-2.0"]
+SOURCES = ["main", "universe", "multiverse", "restricted", "partner"]
+ARCHES = ["i386", "amd64", "armhf", "arm64"]
+CODENAMES = ["bionic", "focal", "groovy"]
+
+
+def generate_index(count, seed=1):
+    """
+    Returns a dictionary of an index with 'count' applications.
+    The same seed always generates the same index.
+    """
+    rand = random.Random(seed)
+    vocabulary = ["".join(rand.choice(SYLLABLES) for i in range(rand.randint(2, 4))) for i in range(20000)]
+
+    def _words(number):
+        return " ".join(rand.choice(vocabulary) for i in range(number))
+
+    apps = {}
+    for position in range(0, count):
+        app_id = "app{0:06d}".format(position)
+        name = _words(rand.randint(1, 3)).title()
+        package = name.lower().replace(" ", "-")
+        backend = rand.choice(["apt", "apt", "apt", "snap"])
+        nonfree = position % 9 == 0
+
+        apps[app_id] = {
+            "category": rand.choice(CATEGORIES),
+            "name": name,
+            "summary": _words(rand.randint(5, 12)).capitalize(),
+            "description": "<p>{0}.</p><p>{1}.</p>".format(_words(rand.randint(20, 60)).capitalize(), _words(rand.randint(10, 30)).capitalize()),
+            "backend": backend,
+            "icon": "",
+            "nonfree": nonfree,
+            "free_license": None if nonfree else rand.choice(LICENSES),
+            "arch": rand.sample(ARCHES, rand.randint(1, len(ARCHES))),
+            "releases": rand.sample(CODENAMES, rand.randint(1, len(CODENAMES))),
+            "developer": _words(2).title(),
+            "developer_url": "https://{0}.example.com".format(package),
+            "website_url": "https://{0}.example.org".format(package),
+            "support_url": "https://{0}.example.org/support".format(package),
+            "apt_source": rand.choice(SOURCES) if backend == "apt" else None,
+            "apt_packages": [package] + [package + "-" + rand.choice(["data", "common", "plugins"]) for i in range(rand.randint(0, 2))] if backend == "apt" else [],
+            "snap_name": package if backend == "snap" else None,
+            "launch_cmd": package,
+            "tags": _words(rand.randint(2, 6)).split(),
+            "screenshots": ["https://{0}.example.com/screenshot-{1}.png".format(package, number) for number in range(rand.randint(0, 4))],
+            "version": "{0}.{1}.{2}".format(rand.randint(0, 9), rand.randint(0, 30), rand.randint(0, 99))
+        }
+
+    return {
+        "stats": {
+            "compiled": 1577836800,
+            "revision": 1
+        },
+        "distro": {
+            "name": "Synthetic",
+            "info_url": "https://example.com",
+            "support_url": "https://example.com/support"
+        },
+        "apps": apps
+    }
+
+
+def write_index(count, output_dir, seed=1):
+    """
+    Writes applications-en.json to a directory. Returns the path.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, "applications-en.json")
+    with open(path, "w") as f:
+        json.dump(generate_index(count, seed), f, ensure_ascii=False)
+    return path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__.strip())
+        sys.exit(1)
+
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    print("Generated: " + write_index(int(sys.argv[1]), sys.argv[2], seed))
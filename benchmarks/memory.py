@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+"""
+Compares the memory used by the curated index when its applications are kept
+as dictionaries (as loaded from JSON) and as compact records (AppRecord).
+
+Usage:
+    memory.py [--sizes 10000,50000] [--output memory-results.json]
+"""
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, ".."))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import pylib
+import generate_index
+
+
+def measure(load):
+    """
+    Returns (bytes still allocated by the loaded object, peak bytes while loading).
+    """
+    gc.collect()
+    tracemalloc.start()
+    loaded = load()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del loaded
+    return current, peak
+
+
+def _load_dicts(json_path):
+    with open(json_path, "r") as f:
+        return json.load(f)["apps"]
+
+
+def _load_records(json_path):
+    return pylib.index.JSONIndex(json_path)
+
+
+def run_size(size, work_dir):
+    json_path = generate_index.write_index(size, os.path.join(work_dir, str(size)))
+    results = []
+    for name, load in [("dict", _load_dicts), ("records", _load_records)]:
+        current, peak = measure(lambda: load(json_path))
+        results.append({
+            "name": name,
+            "size": size,
+            "bytes": current,
+            "bytes_per_app": round(current / size, 1),
+            "peak_bytes": peak
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory used by the curated index")
+    parser.add_argument("--sizes", default="10000,50000", help="Comma separated index sizes")
+    parser.add_argument("--output", help="Where to save the results")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="boutique-memory-")
+    results = []
+    try:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            size_results = run_size(size, work_dir)
+            results += size_results
+            dicts, records = size_results
+            print("{0} applications:".format(size))
+            for result in size_results:
+                print("  {0:<8} {1:>8.1f} MiB  {2:>8.1f} bytes/app  (peak {3:.1f} MiB)".format(
+                    result["name"], result["bytes"] / 1048576, result["bytes_per_app"], result["peak_bytes"] / 1048576))
+            print("  records use {0:.0%} of the memory of dictionaries".format(records["bytes"] / dicts["bytes"]))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results}, f, indent=4)
+        print("Results saved: " + args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+"""
+Measures Software Boutique's hot paths against synthetic indexes of different
+sizes. Runs without GTK or WebKit, and writes the results as JSON so they can
+be compared between commits.
+
+Usage:
+    run.py [--sizes 1000,10000] [--repeat 5] [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, ".."))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import pylib
+import generate_index
+
+
+class Arguments(object):
+    """
+    Same as the command line arguments of the main application.
+    """
+    arch = None
+    codename = None
+    locale = None
+    no_apt = True
+    no_snap = True
+    verbose = False
+    inspect = False
+    profile = None
+
+
+class FakeWebView(object):
+    """
+    Records the JavaScript that would have been run on the page.
+    """
+    def __init__(self):
+        self.scripts = []
+
+    def send_data(self, function, data, coalesce=False):
+        self.scripts.append("{0}({1})".format(function, data))
+
+
+class FakeApp(object):
+    """
+    Does the same work as SoftwareBoutique's incoming_request() and send_data(),
+    with a fake WebView.
+    """
+    def __init__(self):
+        self.dbg = pylib.common.Debugging()
+        self.version = "benchmark"
+        self.webview = FakeWebView()
+        self.controller = None
+
+    def set_view_variable(self, variable, data):
+        if type(data) == dict:
+            data = json.dumps(data, ensure_ascii=False)
+        self.webview.scripts.append("{0} = {1};".format(variable, data))
+
+    def incoming_request(self, raw):
+        data = json.loads(raw)
+        return self.controller.dispatcher.dispatch(data["request"], data)
+
+    def send_data(self, function, data, coalesce=False):
+        if not isinstance(data, str):
+            data = json.dumps(data, ensure_ascii=False)
+        self.webview.send_data(function, data, coalesce)
+        return True
+
+    def reply(self, request_id, data):
+        self.send_data("recv_reply", data)
+
+
+def measure(function, repeat):
+    """
+    Returns the time in milliseconds for each run of 'function'.
+    """
+    runs = []
+    for i in range(0, repeat):
+        start = time.perf_counter()
+        function()
+        runs.append((time.perf_counter() - start) * 1000)
+    return runs
+
+
+def summarise(name, size, runs, operations=1):
+    """
+    Params:
+        operations  Number of operations in each run, to report the time per operation.
+    """
+    runs = [run / operations for run in runs]
+    return {
+        "name": name,
+        "size": size,
+        "unit": "ms",
+        "runs": [round(run, 4) for run in runs],
+        "min": round(min(runs), 4),
+        "median": round(statistics.median(runs), 4),
+        "mean": round(statistics.mean(runs), 4)
+    }
+
+
+def run_size(size, repeat, work_dir):
+    """
+    Runs all benchmarks for an index of 'size' applications.
+    """
+    results = []
+    data_dir = os.path.join(work_dir, str(size))
+    index_dir = os.path.join(data_dir, "index")
+    json_path = generate_index.write_index(size, index_dir)
+    print("Index with {0} applications: {1}".format(size, json_path))
+
+    # Index loading
+    json_only_dir = os.path.join(work_dir, "{0}-json".format(size))
+    os.makedirs(json_only_dir)
+    shutil.copy(json_path, json_only_dir)
+    results.append(summarise("index_load_json", size, measure(lambda: pylib.index.open_index(json_only_dir).close(), repeat)))
+
+    results.append(summarise("index_compile", size, measure(lambda: pylib.index.compile_index_files([json_path]), 1)))
+    results.append(summarise("index_load_binary", size, measure(lambda: pylib.index.open_index(index_dir).close(), repeat)))
+
+    # Controller start up
+    pylib.common.get_data_source = lambda: data_dir
+    app = FakeApp()
+    controllers = []
+
+    def _controller_init():
+        controllers.append(pylib.controller.SoftwareBoutiqueController(app, Arguments()))
+
+    results.append(summarise("controller_init", size, measure(_controller_init, repeat)))
+    for controller in controllers:
+        controller.facets_ready.wait()
+        controller.search_ready.wait()
+    for controller in controllers[1:]:
+        controller.shutdown()
+
+    controller = controllers[0]
+    app.controller = controller
+
+    # Category listing (first page, and every page)
+    categories = controller.index.get_categories()
+    category = max(categories, key=lambda name: len(controller.index.get_category(name)))
+
+    # Responses are cached, so clear them to measure building the response.
+    def _category_first_page():
+        controller.responses.clear()
+        controller._request_category_list({"category": category, "element": "benchmark"})
+
+    def _category_first_page_cached():
+        controller._request_category_list({"category": category, "element": "benchmark"})
+
+    def _category_all_pages():
+        controller.responses.clear()
+        app.webview.scripts = []
+        cursor = 0
+        while cursor is not None:
+            controller._request_category_list({"category": category, "element": "benchmark", "cursor": cursor})
+            cursor = json.loads(app.webview.scripts[-1][len("populate_app_list("):-1])["next_cursor"]
+
+    results.append(summarise("category_list_first_page", size, measure(_category_first_page, repeat)))
+    results.append(summarise("category_list_all_pages", size, measure(_category_all_pages, repeat)))
+    results.append(summarise("category_list_cached", size, measure(_category_first_page_cached, repeat)))
+
+    # Filtering categories by architecture, release and hiding proprietary software.
+    facet_index = pylib.facets.build_facet_index(controller.index)
+
+    def _category_filter():
+        facet_index._results = {}
+        for name in categories:
+            facet_index.filter(name, "amd64", "focal", None, True)
+
+    results.append(summarise("facet_index_build", size, measure(lambda: pylib.facets.build_facet_index(controller.index), repeat)))
+    results.append(summarise("category_filter", size, measure(_category_filter, repeat), len(categories)))
+
+    # Application details
+    rand = random.Random(1)
+    app_ids = rand.sample(controller.index.get_app_ids(), min(200, size))
+
+    def _app_info():
+        controller.responses.clear()
+        for app_id in app_ids:
+            controller._app_info({"id": "curated:" + app_id})
+
+    def _app_info_cached():
+        for app_id in app_ids:
+            controller._app_info({"id": "curated:" + app_id})
+
+    results.append(summarise("app_info", size, measure(_app_info, repeat), len(app_ids)))
+    results.append(summarise("app_info_cached", size, measure(_app_info_cached, repeat), len(app_ids)))
+
+    # Serialising a full category for the view
+    payload = {
+        "category": category,
+        "element": "benchmark",
+        "apps": [controller._get_list_item(app_id, controller.index.get_app(app_id)) for app_id in controller.index.get_category(category)]
+    }
+    results.append(summarise("send_data_json_dumps", size, measure(lambda: json.dumps(payload, ensure_ascii=False), repeat)))
+
+    # Search
+    queries = ["ke", "nu ra", "playice", "editnet", "zz"]
+
+    def _search():
+        controller.responses.clear()
+        for query in queries:
+            controller._search({"query": query, "element": "benchmark"})
+
+    results.append(summarise("search", size, measure(_search, repeat), len(queries)))
+
+    # Request from the view, through the controller, to the JavaScript run on the page.
+    requests = [json.dumps({"request": "app_info", "id": "curated:" + app_id, "request_id": n}) for n, app_id in enumerate(app_ids[:50])]
+
+    def _round_trip():
+        controller.responses.clear()
+        for raw in requests:
+            app.incoming_request(raw).wait()
+
+    results.append(summarise("ipc_round_trip", size, measure(_round_trip, repeat), len(requests)))
+
+    controller.shutdown()
+    app.webview.scripts = []
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Print the change in median times from a previous run.
+    """
+    previous = {}
+    for result in baseline["results"]:
+        previous[(result["name"], result["size"])] = result["median"]
+
+    print("\n{0:<26} {1:>7} {2:>12} {3:>12} {4:>8}".format("Benchmark", "Size", "Before (ms)", "After (ms)", "Change"))
+    for result in results["results"]:
+        before = previous.get((result["name"], result["size"]))
+        if before is None:
+            continue
+        change = ((result["median"] - before) / before * 100) if before else 0
+        print("{0:<26} {1:>7} {2:>12.4f} {3:>12.4f} {4:>+7.1f}%".format(result["name"], result["size"], before, result["median"], change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for Software Boutique")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma separated index sizes, e.g. 1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs for each benchmark")
+    parser.add_argument("--output", default="benchmark-results.json", help="Where to save the results")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results of a previous run to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the application's messages")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        pylib.common.Debugging().output = open(os.devnull, "w")
+
+    work_dir = tempfile.mkdtemp(prefix="boutique-benchmark-")
+
+    # Caches and preferences are written here instead of the user's home.
+    os.environ["HOME"] = work_dir
+
+    results = {
+        "commit": get_commit(),
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": []
+    }
+
+    try:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            for result in run_size(size, args.repeat, work_dir):
+                results["results"].append(result)
+                print("  {0:<26} median {1:>10.4f} ms".format(result["name"], result["median"]))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print("Results saved: " + args.output)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
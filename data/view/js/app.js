@@ -14,6 +14,9 @@ var CATEGORIES = [];
 
 // Global variables
 var GENERIC_ICON_PATH = "ui/generic-package.svg";
+var APP_LIST_OBSERVER = null;
+var APP_ROW_OBSERVER = null;
+var APP_LIST_DATA = {};     // App ID => data for each row of the current list, to render it again.
 
 
 /*************************************************
@@ -37,14 +40,18 @@ function view_error_app_id(id) {
     });
 }
 
-function request_category_list(category_id, element_id) {
+function request_category_list(category_id, element_id, cursor) {
     //
     // Fetches an application list for a specific category or section (e.g. installed)
+    // Lists arrive in pages. Pass the cursor from the last page to fetch the next.
     //
-    show_loading();
+    if (cursor === undefined) {
+        show_loading();
+    }
     send_data("request_category_list", {
         "category": category_id,
-        "element": element_id
+        "element": element_id,
+        "cursor": cursor
     });
 }
 
@@ -98,9 +105,23 @@ function populate_app_list(data) {
     // category         games / fixes / themes  ID of the category.
     // element          123456789               ID randomly generated by view initiating the request.
     // apps             [{1..},{2..}]           List consisting of data describing the applications in JSON format.
+    // cursor           0                       Position of this page in the list. 0 is the first page.
+    // next_cursor      40                      Position of the next page, or null if this is the last.
+    // total            250                     Number of applications in the list.
 
-    _populate_app_list(data.category, data.element, data.apps);
-    hide_loading();
+    // The user may have moved to another page while this was requested.
+    if ($("#" + data.element).length === 0) {
+        return;
+    }
+
+    if (data.cursor > 0) {
+        _append_app_list(data.element, data.apps);
+    } else {
+        _populate_app_list(data.category, data.element, data.apps);
+        hide_loading();
+    }
+
+    _observe_app_list_end(data.category, data.element, data.next_cursor);
 }
 
 function open_app_details(data) {
@@ -117,6 +138,79 @@ function open_app_details(data) {
     hide_loading();
 }
 
+function update_installed_state(data) {
+    //
+    // Applications were installed or removed, so update them if they are shown.
+    //
+    // Variable         Example                 Description
+    // ---------------- ----------------------- -----------------------------------
+    // request          update_installed_state  Required
+    // apps             {"curated:caja": true}  App IDs and whether they are now installed.
+
+    for (var app_id in data.apps) {
+        var installed = data.apps[app_id];
+        if (APP_LIST_DATA[app_id] !== undefined) {
+            APP_LIST_DATA[app_id].installed = installed;
+        }
+
+        // Rows scrolled far out of view are rendered again from the data above.
+        var element = $(`app[data-app-id="${app_id}"]`).not(".recycled");
+        element.toggleClass("installed", installed);
+
+        if (element.hasClass("compact")) {
+            element.children("button").remove();
+            element.append(_get_app_buttons(app_id, installed));
+        } else {
+            element.find("button-group").html(_get_app_buttons(app_id, installed));
+        }
+
+        if (CURRENT_PAGE === "details" && CURRENT_PAGE_DATA.id === app_id) {
+            CURRENT_PAGE_DATA.installed = installed;
+            $(".app-details-page button-group").html(_get_app_buttons(app_id, installed));
+        }
+    }
+}
+
+function update_screenshot_thumbnail(data) {
+    //
+    // A thumbnail for a screenshot on the details page is ready.
+    //
+    // Variable         Example                 Description
+    // ---------------- ----------------------- -----------------------------------
+    // request          update_screenshot_thumbnail Required
+    // id               curated:caja            App ID the screenshot belongs to.
+    // index            0                       Position of the screenshot.
+    // thumbnail        /path/to/thumbnail.jpg  Path to show, or the original screenshot if it failed.
+
+    if (CURRENT_PAGE !== "details" || CURRENT_PAGE_DATA.id !== data.id)
+        return;
+
+    CURRENT_PAGE_DATA.thumbnails[data.index] = data.thumbnail;
+    $(".app-details-page .app-screenshot img").eq(data.index).attr("src", data.thumbnail).removeClass("loading");
+}
+
+// Screenshots loaded ahead of being shown in the gallery.
+var PREFETCHED_SCREENSHOTS = {};
+
+function prefetch_screenshots(instance) {
+    //
+    // When the gallery opens or moves, start loading and decoding the
+    // screenshots either side of the current one.
+    //
+    var index = instance.currIndex;
+    [index - 1, index + 1].forEach(function(i) {
+        var item = instance.group[i];
+        if (item === undefined || PREFETCHED_SCREENSHOTS[item.src] !== undefined)
+            return;
+
+        var image = new Image();
+        image.src = item.src;
+        if (image.decode)
+            image.decode().catch(function() {});
+        PREFETCHED_SCREENSHOTS[item.src] = image;
+    });
+}
+
 
 /*************************************************
  * Internal view functions to update the page.
@@ -195,6 +289,118 @@ function _populate_app_list(category_id, element_id, data) {
     }
 
     $("#" + element_id).html(content);
+    _observe_app_rows(element_id, data, true);
+}
+
+function _append_app_list(element_id, apps) {
+    //
+    // Adds the next page of applications to a list already shown.
+    //
+    var element = $("#" + element_id);
+    var groups = {};
+
+    for (a = 0; a < apps.length; a++) {
+        var app = apps[a];
+        if (groups[app.backend] === undefined) {
+            groups[app.backend] = [];
+        }
+        groups[app.backend].push(_get_app_item(app));
+    }
+
+    for (var backend in groups) {
+        var group = element.find(`group[data-backend="${backend}"] apps`);
+        if (group.length > 0) {
+            group.append(groups[backend].join(""));
+        } else {
+            element.append(_get_app_group(backend, groups[backend]));
+        }
+    }
+
+    _observe_app_rows(element_id, apps, false);
+}
+
+function _observe_app_rows(element_id, apps, new_list) {
+    //
+    // Rows far outside the visible area are emptied, keeping their height so
+    // nothing moves, and rendered again when the user scrolls back. This way,
+    // the page doesn't grow with how far the user scrolls through a long list.
+    //
+    if (new_list === true) {
+        APP_LIST_DATA = {};
+        if (APP_ROW_OBSERVER !== null) {
+            APP_ROW_OBSERVER.disconnect();
+        }
+    }
+
+    if (APP_ROW_OBSERVER === null) {
+        APP_ROW_OBSERVER = new IntersectionObserver(function(entries) {
+            entries.forEach(function(entry) {
+                var row = entry.target;
+                var app = APP_LIST_DATA[row.getAttribute("data-app-id")];
+                if (app === undefined) {
+                    return;
+                }
+
+                if (entry.isIntersecting && row.classList.contains("recycled")) {
+                    var restored = $(_get_app_item(app))[0];
+                    restored.setAttribute("data-observed", "");
+                    APP_ROW_OBSERVER.unobserve(row);
+                    row.replaceWith(restored);
+                    APP_ROW_OBSERVER.observe(restored);
+                } else if (!entry.isIntersecting && !row.classList.contains("recycled")) {
+                    row.style.height = row.offsetHeight + "px";
+                    row.classList.add("recycled");
+                    row.innerHTML = "";
+                }
+            });
+        }, {
+            root: document.querySelector("content"),
+            rootMargin: "300% 0px 300% 0px"
+        });
+    }
+
+    for (var i = 0; i < apps.length; i++) {
+        APP_LIST_DATA[apps[i].id] = apps[i];
+    }
+
+    $("#" + element_id).find("app:not([data-observed])").each(function() {
+        this.setAttribute("data-observed", "");
+        APP_ROW_OBSERVER.observe(this);
+    });
+}
+
+function _observe_app_list_end(category_id, element_id, cursor) {
+    //
+    // Only the first screen of applications is rendered at first. Watch for
+    // the user scrolling near the end of the list, then request the next page.
+    //
+    if (APP_LIST_OBSERVER !== null) {
+        APP_LIST_OBSERVER.disconnect();
+        APP_LIST_OBSERVER = null;
+    }
+
+    var element = $("#" + element_id);
+    element.children("app-list-end").remove();
+
+    if (cursor === null || cursor === undefined) {
+        return;
+    }
+
+    element.append("<app-list-end></app-list-end>");
+
+    APP_LIST_OBSERVER = new IntersectionObserver(function(entries) {
+        if (entries[0].isIntersecting === false) {
+            return;
+        }
+        APP_LIST_OBSERVER.disconnect();
+        APP_LIST_OBSERVER = null;
+        request_category_list(category_id, element_id, cursor);
+    }, {
+        root: document.querySelector("content"),
+        rootMargin: "0px 0px 100% 0px"
+    });
+
+    APP_LIST_OBSERVER.observe(element.children("app-list-end")[0]);
 }
 
 function _get_app_buttons(app_id, installed) {
@@ -230,42 +436,57 @@ function _get_app_buttons(app_id, installed) {
     return output;
 }
 
-function _get_app_list_generic(apps) {
+function _get_app_item(app) {
     //
-    // Returns HTML for application lists used on browse, search and installed pages.
+    // Returns HTML for an application in a list.
     //
     var compact_list = SETTINGS.compact_list;
-    var enabled_apt = SETTINGS.backends.apt;
-    var enabled_snap = SETTINGS.backends.snap;
-    var content = [];
+    var output = "";
+    if (compact_list === true) {
+        output += `<app class="compact ${app.installed === true ? "installed" : ""}" data-app-id="${app.id}" onclick="info_app('${app.id}')" tabindex="0">
+            <install-check>${get_svg("fa-check-circle")}</install-check>
+            <img src="${app.icon ? app.icon : GENERIC_ICON_PATH}"/>
+            <name>${app.name}</name>
+            ${_get_app_buttons(app.id, app.installed)};
+        </app>`;
 
-    function __add_app(app) {
-        var output = "";
-        if (compact_list === true) {
-            output += `<app class="compact ${app.installed === true ? "installed" : ""}" onclick="info_app('${app.id}')" tabindex="0">
-                <install-check>${get_svg("fa-check-circle")}</install-check>
+    } else {
+        output += `<app class="default ${app.installed === true ? "installed" : ""}" data-app-id="${app.id}" tabindex="0">
+            <install-check>${get_svg("fa-check-circle")}</install-check>
+            <left>
                 <img src="${app.icon ? app.icon : GENERIC_ICON_PATH}"/>
+            </left>
+            <right>
                 <name>${app.name}</name>
-                ${_get_app_buttons(app.id, app.installed)};
-            </app>`;
-
-        } else {
-            output += `<app class="default ${app.installed === true ? "installed" : ""}" tabindex="0">
-                <install-check>${get_svg("fa-check-circle")}</install-check>
-                <left>
-                    <img src="${app.icon ? app.icon : GENERIC_ICON_PATH}"/>
-                </left>
-                <right>
-                    <name>${app.name}</name>
-                    <summary>${app.summary}</summary>
-                    <button-group>
-                        ${_get_app_buttons(app.id, app.installed)}
-                    </button-group>
-                </right>
-            </app>`;
-        }
-        return output;
+                <summary>${app.summary}</summary>
+                <button-group>
+                    ${_get_app_buttons(app.id, app.installed)}
+                </button-group>
+            </right>
+        </app>`;
     }
+    return output;
+}
+
+function _get_app_group(backend, apps_html) {
+    //
+    // Returns HTML for a group of applications from the same source.
+    //
+    return `<group data-backend="${backend}">
+            <h2>${get_string("group_" + backend + "_title")}</h2>
+            <p>${get_string("group_" + backend + "_text")}</p>
+            <apps class="${SETTINGS.compact_list == true ? "compact" : ""}">${apps_html.join("")}</apps>
+        </group>`;
+}
+
+function _get_app_list_generic(apps) {
+    //
+    // Returns HTML for application lists used on browse, search and installed pages.
+    //
+    var enabled_curated = SETTINGS.index.available;
+    var enabled_apt = SETTINGS.backends.apt;
+    var enabled_snap = SETTINGS.backends.snap;
+    var content = [];
 
     var backends = [
         ["curated", enabled_curated],
@@ -284,16 +505,12 @@ function _get_app_list_generic(apps) {
                 app = apps[a];
                 if (app.backend == backend) {
                     count++;
-                    group_html.push(__add_app(app));
+                    group_html.push(_get_app_item(app));
                 }
             }
 
             if (count > 0) {
-                content.push(`<group>
-                        <h2>${get_string("group_" + backend + "_title")}</h2>
-                        <p>${get_string("group_" + backend + "_text")}</p>
-                        <apps class="${compact_list == true ? "compact" : ""}">${group_html.join("")}</apps>
-                    </group>`);
+                content.push(_get_app_group(backend, group_html));
             }
         }
     }
@@ -369,6 +586,7 @@ function _open_app_details(data) {
     //      "launch_cmd": "app1",
     //      "tags": [],
     //      "screenshots": ["/path/to/image1", "/path/to/image2"],
+    //      "thumbnails": ["/path/to/thumbnail1", null], /* null while still being created */
     //      "version": "20.04.1-ubuntu0",
     //      "installed": true,
     //      "install_date": [2019, 12, 31, 23, 59] /* [YYYY, MM, DD, HH, MM], */
@@ -390,9 +608,12 @@ function set_page_details(data) {
         screenshots = "";
         for (s = 0; s < data.screenshots.length; s++) {
             var path = data.screenshots[s];
-            screenshots += `<a class="app-screenshot" href="${path}" data-fancybox="gallery"><img src="${path}"/></a>`;
+            var thumbnail = data.thumbnails[s];
+            var image = thumbnail ? `<img src="${thumbnail}"/>` : `<img class="loading"/>`;
+            screenshots += `<a class="app-screenshot" href="${path}" data-fancybox="gallery">${image}</a>`;
         }
     }
+    PREFETCHED_SCREENSHOTS = {};
 
     var developer_link = "";
     if (data.developer != null) {
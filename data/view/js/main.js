@@ -1,16 +1,47 @@
 /**********************************************
  * View -> Controller | such as for user input
 **********************************************/
-function send_data(request, json) {
+var REQUEST_ID = 0;
+var REQUEST_CALLBACKS = {};
+
+function send_data(request, json, callback) {
     //
     // Sends JSON data to the Controller.
     //
     //  request     String of the Python function to run.
     //  json        JSON data.
+    //  callback    (Optional) Function to run with the controller's reply.
+    //
+    // Returns the ID of this request.
     //
+    REQUEST_ID++;
     json["request"] = request;
+    json["request_id"] = REQUEST_ID;
+
+    if (callback !== undefined) {
+        REQUEST_CALLBACKS[REQUEST_ID] = callback;
+    }
+
     var data = JSON.stringify(json);
-    document.title = data;
+    if (window.webkit && window.webkit.messageHandlers && window.webkit.messageHandlers.boutique) {
+        window.webkit.messageHandlers.boutique.postMessage(data);
+    } else {
+        // Older WebKit - controller is listening for title changes.
+        document.title = data;
+    }
+
+    return REQUEST_ID;
+}
+
+function recv_reply(request_id, data) {
+    //
+    // Controller replied to a request that was sent with a callback.
+    //
+    var callback = REQUEST_CALLBACKS[request_id];
+    if (callback !== undefined) {
+        delete REQUEST_CALLBACKS[request_id];
+        callback(data);
+    }
 }
 
 /***********************************************
@@ -33,6 +64,17 @@ function recv_data(data) {
         case "open_app_details":
             open_app_details(data);
             break;
+        case "update_installed_state":
+            update_installed_state(data);
+            break;
+        case "update_screenshot_thumbnail":
+            update_screenshot_thumbnail(data);
+            break;
+
+        // search.js
+        case "populate_search_results":
+            populate_search_results(data);
+            break;
     }
 }
 
@@ -30,7 +30,7 @@ function queue_add_item(backend, operation, app_id) {
     send_data("queue_add_item", {
         "backend": backend,             // Either: 'snapd', 'apt', 'index'
         "operation": operation,         // Either: 'install', 'remove'
-        "id": id                        // App name / package name / or index ID, depending on backend parameter.
+        "id": app_id                    // App name / package name / or index ID, depending on backend parameter.
     });
 }
 
@@ -62,8 +62,43 @@ function update_queue_state(data) {
     // details_text     app_progress            Display this text for the details. Optional, can be blank.
     // value            5                       Current value for progress bar. If -1, for indeterminate.
     // value_end        10                      Total value for progress bar. If 0, will be hidden.
+    // rate             102400                  Transfer rate in bytes per second, or null if not transferring.
+    // eta              30                      Estimated seconds remaining, or null if unknown.
 
-    _update_queue_state(data.state, data.action_text, data.details_text, data.value, data.value_end);
+    var details_text = data.details_text;
+
+    if (data.rate != null && data.rate > 0) {
+        var transfer_text = get_string("queue_transfer_rate").replace("1", _format_size(data.rate));
+        if (data.eta != null) {
+            transfer_text += ", " + get_string("queue_time_remaining").replace("1", _format_duration(data.eta));
+        }
+        details_text = details_text ? details_text + " (" + transfer_text + ")" : transfer_text;
+    }
+
+    _update_queue_state(data.state, data.action_text, details_text, data.value, data.value_end);
+}
+
+function _format_size(bytes) {
+    //
+    // Returns a human readable size, e.g. "1.5 MB"
+    //
+    var units = ["B", "KB", "MB", "GB"];
+    var unit = 0;
+    while (bytes >= 1024 && unit < units.length - 1) {
+        bytes = bytes / 1024;
+        unit++;
+    }
+    return (unit === 0 ? bytes : bytes.toFixed(1)) + " " + units[unit];
+}
+
+function _format_duration(seconds) {
+    //
+    // Returns a short duration, e.g. "45 s" or "3 min"
+    //
+    if (seconds < 60) {
+        return seconds + " s";
+    }
+    return Math.ceil(seconds / 60) + " min";
 }
 
 function update_queue_list(data) {
@@ -79,7 +114,7 @@ function update_queue_list(data) {
     QUEUE = data.queue;
 
     _update_queue_button();
-    if (CURRENT_TAB === "queue") {
+    if (CURRENT_PAGE === "queue") {
         set_page_queue();
     }
 }
@@ -107,7 +142,6 @@ function set_page_queue() {
                         ${html_app_data}
                         <progress class="active-item-progress" value="${cur_value}" max="${cur_total}"></progress>
                         <div class="status busy">${get_svg("loading")}</div>
-                        ${html_remove_button}
                     </div>
                 `);
                 break;
@@ -179,7 +213,6 @@ function set_page_queue() {
                         ${html_app_data}
                         <div class="status-text">${status_text}</div>
                         <div class="status busy">${get_svg("loading")}</div>
-                        ${html_remove_button}
                     </div>
                 `);
                 break;
@@ -232,7 +265,7 @@ function _update_queue_button() {
     // Run when the queue length has changed.
     //
     var button_text = get_string("queue").replace("0", QUEUE.length);
-    $("#tab-button-queue span").html(button_text);
+    $("#nav-button-queue span").html(button_text);
 
     // TODO: Queue length should reflect pending tasks.
 }
@@ -250,12 +283,6 @@ function _update_queue_state(icon, action_text, details_text, value, value_end)
     // value            5                       Current value for progress bar. If -1, for indeterminate.
     // value_end        10                      Total value for progress bar. If 0, will be hidden.
     //
-    var icon = data.icon;
-    var action_text = data.action_text;
-    var details_text = data.details_text;
-    var value = data.value;
-    var value_end = data.value_end;
-
     var old_action_text = $("#progress-text").html();
 
     if (old_action_text !== action_text) {
@@ -283,7 +310,7 @@ function _update_queue_state(icon, action_text, details_text, value, value_end)
         $("#progress-text").html(action_text);
     }
 
-    if (details_text.length > 0) {
+    if (details_text && details_text.length > 0) {
         $("#progress-subtext").show().html(details_text);
     } else {
         $("#progress-subtext").hide().html(" ");
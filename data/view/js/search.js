@@ -0,0 +1,59 @@
+//
+// Search - finds applications as the user types.
+//
+
+/*************************************************
+ * Send request to the controller.
+*************************************************/
+function search_query(query) {
+    //
+    // Request results for the search terms.
+    //
+    send_data("search", {
+        "query": query,
+        "element": "search-results"
+    });
+}
+
+/*************************************************
+ * Received update from the controller.
+*************************************************/
+function populate_search_results(data) {
+    //
+    // Presents the applications that matched the query.
+    //
+    // Variable         Example                 Description
+    // ---------------- ----------------------- -----------------------------------
+    // request          populate_search_results Required
+    // query            caja                    Search terms that were requested.
+    // element          search-results          ID of the element to populate.
+    // apps             [{1..},{2..}]           List of matching applications, see _populate_app_list()
+
+    // Results may arrive after the user has typed something else.
+    if (CURRENT_PAGE !== "search" || data.query !== $("#search-input").val()) {
+        return;
+    }
+
+    if (data.query.trim().length === 0) {
+        $("#" + data.element).html("");
+    } else if (data.apps.length === 0) {
+        $("#" + data.element).html(`<empty>${get_svg("fa-search")}<span>${get_string("search_no_results")}</span></empty>`);
+    } else {
+        $("#" + data.element).html(_get_app_list_generic(data.apps));
+    }
+}
+
+/*************************************************
+ * Internal view functions to update the page.
+*************************************************/
+function set_page_search() {
+    $("content").html(`
+        <div class="search-page">
+            <toolbar>
+                <input id="search-input" type="search" placeholder="${get_string("search_placeholder")}" oninput="search_query(this.value)"/>
+            </toolbar>
+            <app-list id="search-results"></app-list>
+        </div>
+    `);
+    $("#search-input").focus();
+}
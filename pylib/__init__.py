@@ -1,7 +1,43 @@
-from . import common
-from . import controller
-from . import preferences
-from . import locales
-from .views import app_window
-from .views import notification
-from .views import web_view
+"""
+Software Boutique's modules.
+
+Modules are imported when they are first used (e.g. pylib.controller), so
+command line options such as --version and --help do not have to wait for
+GTK and WebKit to load.
+"""
+
+import importlib
+
+_MODULES = [
+    "appstream",
+    "aptcache",
+    "common",
+    "controller",
+    "delta",
+    "dispatch",
+    "facets",
+    "headless",
+    "index",
+    "installed",
+    "locales",
+    "prefetch",
+    "preferences",
+    "profiler",
+    "progress",
+    "records",
+    "responses",
+    "search",
+    "snapd",
+    "transaction",
+    "views"
+]
+
+
+def __getattr__(name):
+    if name in _MODULES:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module '{0}' has no attribute '{1}'".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + _MODULES)
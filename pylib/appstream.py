@@ -0,0 +1,362 @@
+"""
+Reads the AppStream metadata that distributions ship for their repositories.
+
+Collections are found under /usr/share/app-info, /var/lib/app-info and
+/var/cache/app-info, as XML (xmls/*.xml.gz) or DEP-11 YAML (yaml/*.yml.gz).
+They can be tens of megabytes, so they are read one component at a time and
+only the fields shown by the view are kept:
+
+    {
+        "id": "org.mate.Caja",
+        "package": "caja",
+        "name": "Caja",
+        "summary": "Browse the file system",
+        "icon": "/var/lib/app-info/icons/.../64x64/caja.png",  (or a theme icon name)
+        "screenshots": ["https://..."],
+        "launch_cmd": "gtk-launch caja"
+    }
+
+The components from each file are cached to disk with the file's
+modification time and size. On later launches, only files that changed are
+read again.
+"""
+
+import gzip
+import os
+import pickle
+import threading
+import xml.etree.ElementTree as ElementTree
+import zlib
+
+try:
+    import yaml
+    _YAMLLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+except ImportError:
+    yaml = None
+
+# Increment when the structure of the cache changes.
+CACHE_VERSION = 1
+
+COLLECTION_DIRS = ["/usr/share/app-info", "/var/lib/app-info", "/var/cache/app-info"]
+
+# Preferred size of cached icons, as in the curated index.
+ICON_SIZE = 64
+
+# Attribute for the language of translated elements in the XML.
+_XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+# A damaged or unexpected collection skips only that file.
+_READ_ERRORS = (OSError, EOFError, ValueError, TypeError, AttributeError, zlib.error, ElementTree.ParseError)
+if yaml:
+    _READ_ERRORS += (yaml.YAMLError,)
+
+
+def get_sources(dirs=None):
+    """
+    Returns the paths of the AppStream collections on the system, sorted.
+    """
+    paths = []
+    for folder in dirs or COLLECTION_DIRS:
+        for subfolder, extensions in [("xmls", (".xml", ".xml.gz")), ("yaml", (".yml", ".yml.gz", ".yaml", ".yaml.gz"))]:
+            path = os.path.join(folder, subfolder)
+            try:
+                filenames = os.listdir(path)
+            except OSError:
+                continue
+            for filename in filenames:
+                if filename.endswith(extensions):
+                    paths.append(os.path.join(path, filename))
+    return sorted(paths)
+
+
+def _open(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _get_stamp(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _pick_translation(values, locales):
+    """
+    Returns the value for the first locale available, or the untranslated value.
+
+    Params:
+        values      Dictionary of locale => text. Untranslated text is "C" (or None).
+        locales     Locales in order of preference, e.g. ["pt_BR", "pt"]
+    """
+    for locale in locales:
+        if locale in values:
+            return values[locale]
+    return values.get("C", values.get(None))
+
+
+def _get_cached_icon(collection_dir, origin, name, width=None, height=None):
+    """
+    Icons shipped with a collection are at <dir>/icons/<origin>/<width>x<height>/<name>
+    """
+    sizes = ["{0}x{1}".format(width, height)] if width else []
+    sizes += ["{0}x{0}".format(ICON_SIZE), "128x128", "48x48"]
+    for size in sizes:
+        path = os.path.join(collection_dir, "icons", origin or "", size, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _get_collection_dir(path):
+    # e.g. /var/lib/app-info/yaml/foo.yml.gz => /var/lib/app-info
+    return os.path.dirname(os.path.dirname(path))
+
+
+def _make_component(component_id, package, names, summaries, icon, screenshots, launchable, locales):
+    if not component_id:
+        return None
+    return {
+        "id": component_id,
+        "package": package,
+        "name": _pick_translation(names, locales),
+        "summary": _pick_translation(summaries, locales),
+        "icon": icon,
+        "screenshots": screenshots,
+        "launch_cmd": "gtk-launch " + launchable[:-8] if launchable and launchable.endswith(".desktop") else None
+    }
+
+
+def parse_xml(path, locales):
+    """
+    Yields the components of an XML collection, one at a time.
+    """
+    collection_dir = _get_collection_dir(path)
+    origin = None
+    root = None
+
+    with _open(path) as f:
+        for event, element in ElementTree.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                    origin = element.get("origin")
+                continue
+
+            if element.tag != "component":
+                continue
+
+            names = {}
+            summaries = {}
+            stock_icon = None
+            cached_icon = None
+            screenshots = []
+            launchable = None
+
+            for child in element:
+                if child.tag == "name":
+                    names[child.get(_XML_LANG, "C")] = child.text
+                elif child.tag == "summary":
+                    summaries[child.get(_XML_LANG, "C")] = child.text
+                elif child.tag == "icon":
+                    if child.get("type") == "stock":
+                        stock_icon = child.text
+                    elif child.get("type") == "cached" and not cached_icon and child.text:
+                        cached_icon = _get_cached_icon(collection_dir, origin, child.text, child.get("width"), child.get("height"))
+                elif child.tag == "launchable" and child.get("type") == "desktop-id":
+                    launchable = child.text
+                elif child.tag == "screenshots":
+                    for screenshot in child:
+                        for image in screenshot.iter("image"):
+                            if image.get("type") == "source" and image.text:
+                                screenshots.append(image.text.strip())
+
+            component = _make_component(element.findtext("id"), element.findtext("pkgname"), names, summaries,
+                                        cached_icon or stock_icon, screenshots, launchable, locales)
+            if component:
+                yield component
+
+            # Discard what was read, so memory use doesn't grow with the file.
+            element.clear()
+            if root is not None:
+                root.clear()
+
+
+def _read_yaml_documents(f):
+    """
+    Yields the documents of a YAML stream as text, one at a time.
+    """
+    lines = []
+    for line in f:
+        line = line.decode("utf-8", "replace")
+        if line.startswith("---"):
+            if lines:
+                yield "".join(lines)
+            lines = []
+            continue
+        lines.append(line)
+    if lines:
+        yield "".join(lines)
+
+
+def parse_yaml(path, locales):
+    """
+    Yields the components of a DEP-11 (YAML) collection, one at a time.
+    """
+    if not yaml:
+        return
+
+    collection_dir = _get_collection_dir(path)
+    origin = None
+    media_url = ""
+
+    with _open(path) as f:
+        for text in _read_yaml_documents(f):
+            try:
+                document = yaml.load(text, Loader=_YAMLLoader)
+            except yaml.YAMLError:
+                continue
+            if type(document) != dict:
+                continue
+
+            # The first document describes the collection.
+            if document.get("File") == "DEP-11":
+                origin = document.get("Origin")
+                media_url = document.get("MediaBaseUrl") or ""
+                continue
+
+            icon = None
+            icons = document.get("Icon") or {}
+            for cached in icons.get("cached") or []:
+                if type(cached) != dict or not cached.get("name"):
+                    continue
+                icon = _get_cached_icon(collection_dir, origin, cached.get("name"), cached.get("width"), cached.get("height"))
+                if icon:
+                    break
+            if not icon:
+                icon = icons.get("stock")
+
+            screenshots = []
+            for screenshot in document.get("Screenshots") or []:
+                url = (screenshot.get("source-image") or {}).get("url")
+                if url:
+                    screenshots.append(url if "://" in url else media_url.rstrip("/") + "/" + url.lstrip("/"))
+
+            launchables = (document.get("Launchable") or {}).get("desktop-id") or []
+            component = _make_component(document.get("ID"), document.get("Package"),
+                                        document.get("Name") or {}, document.get("Summary") or {},
+                                        icon, screenshots, launchables[0] if launchables else None, locales)
+            if component:
+                yield component
+
+
+def parse_collection(path, locales):
+    """
+    Returns a list of the components in a collection file.
+    """
+    if ".xml" in os.path.basename(path):
+        return list(parse_xml(path, locales))
+    return list(parse_yaml(path, locales))
+
+
+class AppStreamCatalogue(object):
+    """
+    Components from all of the system's AppStream collections.
+    """
+    def __init__(self, dbg, cache_path, locales=None, dirs=None):
+        """
+        Params:
+            dbg             Debugging() object
+            cache_path      File to cache the components, e.g. ~/.cache/software-boutique/appstream.cache
+            locales         Locales in order of preference, for names and summaries.
+            dirs            Folders containing collections, if not the system's.
+        """
+        self.dbg = dbg
+        self.cache_path = cache_path
+        self.locales = list(locales or [])
+        self.dirs = dirs
+        self.components = {}
+        self.packages = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.components)
+
+    def _load_cache(self):
+        """
+        Returns a dictionary of path => (stamp, components) from a previous run.
+        """
+        try:
+            with open(self.cache_path, "rb") as f:
+                version, locales, files = pickle.load(f)
+        except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+            return {}
+
+        if version != CACHE_VERSION or locales != self.locales:
+            return {}
+        return files
+
+    def _save_cache(self, files):
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump((CACHE_VERSION, self.locales, files), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            self.dbg.stdout("Failed to save AppStream cache: " + str(e), self.dbg.warning, 1)
+
+    def load(self):
+        """
+        Read the collections, using the cache for files that haven't changed.
+        Returns the number of files that were read again.
+        """
+        cached = self._load_cache()
+        files = {}
+        parsed = 0
+
+        for path in get_sources(self.dirs):
+            try:
+                stamp = _get_stamp(path)
+            except OSError:
+                continue
+
+            if path in cached and cached[path][0] == stamp:
+                files[path] = cached[path]
+                continue
+
+            try:
+                files[path] = (stamp, parse_collection(path, self.locales))
+                parsed += 1
+            except _READ_ERRORS as e:
+                self.dbg.stdout("Failed to read AppStream collection {0}: {1}".format(path, str(e)), self.dbg.warning, 1)
+
+        if parsed or set(files.keys()) != set(cached.keys()):
+            self._save_cache(files)
+
+        components = {}
+        packages = {}
+        for path in sorted(files.keys()):
+            for component in files[path][1]:
+                if component["id"] in components:
+                    continue
+                components[component["id"]] = component
+                if component["package"]:
+                    packages.setdefault(component["package"], component["id"])
+
+        with self._lock:
+            self.components = components
+            self.packages = packages
+
+        self.dbg.stdout("AppStream: {0} components from {1} collections ({2} read, {3} cached)".format(
+            len(components), len(files), parsed, len(files) - parsed), self.dbg.success, 1)
+        return parsed
+
+    def get(self, component_id):
+        return self.components.get(component_id)
+
+    def get_by_package(self, package):
+        """
+        Returns the component for a package, or None.
+        """
+        component_id = self.packages.get(package)
+        return self.components.get(component_id) if component_id else None
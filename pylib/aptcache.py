@@ -0,0 +1,355 @@
+"""
+Catalogue of the packages available from the system's apt repositories.
+
+apt keeps a Packages file for each repository in /var/lib/apt/lists, which
+together can list hundreds of thousands of packages. Reading them all takes
+seconds, so each file is parsed once (several at a time, in separate
+processes) and only these fields are kept:
+
+    (name, version, summary, section, installed size in KiB)
+
+The packages from each file are cached to disk with the file's modification
+time and size. On later launches, only lists that changed since (e.g. after
+"apt update") are parsed again.
+
+Packages are searched with a SearchIndex of their names and summaries, which
+is also cached until the lists change.
+"""
+
+import concurrent.futures
+import gzip
+import multiprocessing
+import os
+import pickle
+import re
+import sys
+import threading
+
+from . import search as Search
+
+LISTS_DIR = "/var/lib/apt/lists"
+
+# Increment when the structure of the cache changes.
+CACHE_VERSION = 1
+
+# Fields of each package.
+NAME = 0
+VERSION = 1
+SUMMARY = 2
+SECTION = 3
+INSTALLED_SIZE = 4
+
+# e.g. deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages
+_LIST_ARCH_PATTERN = re.compile(r"_binary-([^_]+)_Packages")
+
+
+def get_lists(lists_dir=LISTS_DIR):
+    """
+    Returns the paths of the Packages files apt has downloaded, sorted.
+    """
+    try:
+        filenames = os.listdir(lists_dir)
+    except OSError:
+        return []
+    return sorted([os.path.join(lists_dir, filename) for filename in filenames
+                   if filename.endswith(("_Packages", "_Packages.gz"))])
+
+
+def get_list_arch(path):
+    """
+    Returns the architecture of a Packages file, e.g. "amd64", or None if unknown.
+    """
+    match = _LIST_ARCH_PATTERN.search(os.path.basename(path))
+    return match.group(1) if match else None
+
+
+def _get_stamp(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def parse_packages_file(path):
+    """
+    Returns a list of package tuples (see NAME...INSTALLED_SIZE) from a Packages file.
+    """
+    packages = []
+    name = None
+    version = None
+    summary = None
+    section = None
+    size = 0
+
+    if path.endswith(".gz"):
+        f = gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    else:
+        f = open(path, "r", encoding="utf-8", errors="replace")
+
+    with f:
+        for line in f:
+            if line.startswith("Package: "):
+                name = line[9:].strip()
+            elif line.startswith("Version: "):
+                version = line[9:].strip()
+            elif line.startswith("Description: ") or line.startswith("Description-en: "):
+                summary = line.split(": ", 1)[1].strip()
+            elif line.startswith("Section: "):
+                section = sys.intern(line[9:].strip())
+            elif line.startswith("Installed-Size: "):
+                try:
+                    size = int(line[16:])
+                except ValueError:
+                    size = 0
+            elif line == "\n":
+                if name:
+                    packages.append((name, version, summary, section, size))
+                name = None
+                version = None
+                summary = None
+                section = None
+                size = 0
+
+    if name:
+        packages.append((name, version, summary, section, size))
+
+    return packages
+
+
+def _get_version_order(char):
+    # dpkg sorts "~" before anything (even the end), then letters, then other characters.
+    if char == "~":
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def _compare_part(a, b):
+    """
+    Compares the upstream version or Debian revision of two versions, as dpkg does.
+    """
+    i = 0
+    j = 0
+    while i < len(a) or j < len(b):
+        # Non-digits are compared character by character.
+        while (i < len(a) and not a[i].isdigit()) or (j < len(b) and not b[j].isdigit()):
+            order_a = _get_version_order(a[i]) if i < len(a) and not a[i].isdigit() else 0
+            order_b = _get_version_order(b[j]) if j < len(b) and not b[j].isdigit() else 0
+            if order_a != order_b:
+                return -1 if order_a < order_b else 1
+            i += 1
+            j += 1
+
+        # Then a run of digits as a number.
+        start = i
+        while i < len(a) and a[i].isdigit():
+            i += 1
+        number_a = int(a[start:i] or 0)
+        start = j
+        while j < len(b) and b[j].isdigit():
+            j += 1
+        number_b = int(b[start:j] or 0)
+        if number_a != number_b:
+            return -1 if number_a < number_b else 1
+    return 0
+
+
+def _split_version(version):
+    epoch = 0
+    if ":" in version:
+        epoch, version = version.split(":", 1)
+        epoch = int(epoch) if epoch.isdigit() else 0
+    upstream, _, revision = version.rpartition("-") if "-" in version else (version, "", "")
+    return epoch, upstream, revision
+
+
+def compare_versions(a, b):
+    """
+    Returns -1, 0 or 1 if Debian version a is older, the same or newer than b.
+    """
+    epoch_a, upstream_a, revision_a = _split_version(a or "")
+    epoch_b, upstream_b, revision_b = _split_version(b or "")
+    if epoch_a != epoch_b:
+        return -1 if epoch_a < epoch_b else 1
+    return _compare_part(upstream_a, upstream_b) or _compare_part(revision_a, revision_b)
+
+
+class AptCatalogue(object):
+    """
+    The newest version of each package available from apt.
+    """
+    def __init__(self, dbg, cache_path, arch=None, lists_dir=LISTS_DIR, workers=None):
+        """
+        Params:
+            dbg             Debugging() object
+            cache_path      File to cache the lists, e.g. ~/.cache/software-boutique/apt.cache
+            arch            Only include lists for this architecture (and those for any), e.g. "amd64"
+            lists_dir       Folder containing apt's lists, if not the system's.
+            workers         Processes to parse lists with. Defaults to the number of CPUs.
+        """
+        self.dbg = dbg
+        self.cache_path = cache_path
+        self.arch = arch
+        self.lists_dir = lists_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.packages = {}
+        self.search_index = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.packages)
+
+    def _load_cache(self):
+        """
+        Returns a dictionary of path => (stamp, packages) from a previous run.
+        """
+        try:
+            with open(self.cache_path, "rb") as f:
+                version, lists = pickle.load(f)
+        except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+            return {}
+
+        if version != CACHE_VERSION:
+            return {}
+        return lists
+
+    def _save_cache(self, lists):
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump((CACHE_VERSION, lists), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            self.dbg.stdout("Failed to save apt cache: " + str(e), self.dbg.warning, 1)
+
+    def _parse_lists(self, paths):
+        """
+        Returns a dictionary of path => packages (or None if it failed) for lists that changed.
+        """
+        results = {}
+        if len(paths) < 2 or self.workers < 2:
+            for path in paths:
+                try:
+                    results[path] = parse_packages_file(path)
+                except (OSError, EOFError) as e:
+                    self.dbg.stdout("Failed to read {0}: {1}".format(path, str(e)), self.dbg.warning, 1)
+                    results[path] = None
+            return results
+
+        # New processes are started instead of forked, as forking copies the state of GTK's threads.
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(min(self.workers, len(paths)), mp_context=context) as pool:
+            futures = {pool.submit(parse_packages_file, path): path for path in paths}
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                try:
+                    results[path] = future.result()
+                except Exception as e:
+                    self.dbg.stdout("Failed to read {0}: {1}".format(path, str(e)), self.dbg.warning, 1)
+                    results[path] = None
+        return results
+
+    def load(self):
+        """
+        Read apt's lists, using the cache for those that haven't changed.
+        Returns the number of lists that were parsed again.
+        """
+        cached = self._load_cache()
+        lists = {}
+        changed = []
+
+        for path in get_lists(self.lists_dir):
+            try:
+                stamp = _get_stamp(path)
+            except OSError:
+                continue
+
+            if path in cached and cached[path][0] == stamp:
+                lists[path] = cached[path]
+            else:
+                changed.append((path, stamp))
+
+        if changed:
+            parsed = self._parse_lists([path for path, stamp in changed])
+            for path, stamp in changed:
+                if parsed.get(path) is not None:
+                    lists[path] = (stamp, parsed[path])
+
+        if changed or set(lists.keys()) != set(cached.keys()):
+            self._save_cache(lists)
+
+        packages = {}
+        arch_lists = 0
+        for path in sorted(lists.keys()):
+            list_arch = get_list_arch(path)
+            if self.arch and list_arch and list_arch not in ("all", self.arch):
+                continue
+            if list_arch == self.arch:
+                arch_lists += 1
+            for package in lists[path][1]:
+                existing = packages.get(package[NAME])
+                if not existing or compare_versions(package[VERSION], existing[VERSION]) > 0:
+                    packages[package[NAME]] = package
+
+        if self.arch and lists and not arch_lists:
+            self.dbg.stdout("apt has no lists for architecture '{0}', only packages for all architectures are shown.".format(self.arch), self.dbg.warning)
+
+        revision = (CACHE_VERSION, self.arch, tuple(sorted((path, lists[path][0]) for path in lists.keys())))
+        search_index = self._get_search_index(packages, revision)
+
+        with self._lock:
+            self.packages = packages
+            self.search_index = search_index
+
+        self.dbg.stdout("apt: {0} packages from {1} lists ({2} parsed, {3} cached)".format(
+            len(packages), len(lists), len(changed), len(lists) - len(changed)), self.dbg.success, 1)
+        return len(changed)
+
+    def _get_search_index(self, packages, revision):
+        """
+        Returns a SearchIndex of the packages, loading it from the cache if
+        the lists haven't changed, otherwise building and caching a new one.
+        """
+        cache_path = os.path.splitext(self.cache_path)[0] + "-search.cache"
+        search_index = Search.SearchIndex.load(cache_path, revision, trigrams=False)
+        if search_index:
+            return search_index
+
+        # Package names are matched exactly or by prefix. Trigrams of tens of thousands of "lib..." names would slow each keystroke.
+        search_index = Search.SearchIndex(trigrams=False)
+        search_index.revision = revision
+        for name in sorted(packages.keys()):
+            search_index.add(name, {"name": name, "summary": packages[name][SUMMARY]})
+        search_index.finalise()
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            search_index.save(cache_path)
+        except OSError as e:
+            self.dbg.stdout("Failed to save apt search index: " + str(e), self.dbg.warning, 1)
+        return search_index
+
+    def get(self, name):
+        """
+        Returns the package tuple for a package name, or None.
+        """
+        return self.packages.get(name)
+
+    def search(self, query, limit=50):
+        """
+        Returns package tuples that match every word of the query, best first.
+        A package named exactly as the query is always first.
+        """
+        with self._lock:
+            packages = self.packages
+            search_index = self.search_index
+        if not search_index:
+            return []
+
+        exact = packages.get(query.strip().lower())
+        results = [exact] if exact else []
+        for name, score in search_index.search(query, limit):
+            if len(results) >= limit:
+                break
+            if not exact or name != exact[NAME]:
+                results.append(packages[name])
+        return results
@@ -4,9 +4,8 @@ Common functions shared between Software Boutique and the Welcome application.
 
 import os
 import gettext
+import platform
 import sys
-import inspect
-import subprocess
 
 
 class Paths(object):
@@ -53,6 +52,9 @@ class Debugging(object):
     def __init__(self):
         self.verbose_level = 0
 
+        # Where messages are printed. Headless mode uses stderr, as stdout is for data.
+        self.output = sys.stdout
+
         # Colours for stdout
         self.error = '\033[91m'
         self.success = '\033[92m'
@@ -72,17 +74,17 @@ class Debugging(object):
         """
         if self.verbose_level >= verbosity:
             # Only colourise output if running in a real terminal.
-            if sys.stdout.isatty():
-                print(colour + msg + '\033[0m')
+            if self.output.isatty():
+                print(colour + msg + '\033[0m', file=self.output)
             else:
-                print(msg)
+                print(msg, file=self.output)
 
 
 def get_data_source():
     """
     Returns the path for the application's UI data files.
     """
-    current_folder = os.path.join(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))), "../data/")
+    current_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data/")
     try:
         snap_folder = os.path.join(os.environ["SNAP"], "usr", "share", "software-boutique")
     except KeyError:
@@ -122,6 +124,37 @@ def setup_translations(bin_path, i18n_app, locale_override=None):
     return t.gettext
 
 
+def get_locales(locale_override=None):
+    """
+    Returns the user's preferred locales for content, most preferred first,
+    using the same environment variables as gettext.
+
+    Params:
+        locale_override str     Locale to use instead, e.g. from --locale
+
+    Example: "pt_BR.UTF-8" => ["pt_BR", "pt"]
+    """
+    if locale_override:
+        languages = [locale_override]
+    else:
+        languages = []
+        for variable in ["LANGUAGE", "LC_ALL", "LC_MESSAGES", "LANG"]:
+            value = os.environ.get(variable)
+            if value:
+                languages = value.split(":")
+                break
+
+    locales = []
+    for language in languages:
+        code = language.split(".")[0].split("@")[0]
+        if not code or code in ["C", "POSIX"]:
+            continue
+        for candidate in [code, code.split("_")[0]]:
+            if candidate not in locales:
+                locales.append(candidate)
+    return locales
+
+
 def _parse_os_release():
     with open("/etc/os-release") as f:
         d = {}
@@ -144,17 +177,38 @@ def get_distro_version():
         return ""
 
 
-def get_distro_arch():
-    return "amd64"
-    # FIXME: Needs to be distro agnostic.
-    # return str(subprocess.Popen(["dpkg", "--print-architecture"], stdout=subprocess.PIPE).communicate()[0]).strip('\\nb\'')
+def get_distro_codename():
+    """
+    Returns the release's codename, e.g. "focal", or None if it isn't known.
+    """
+    try:
+        d = _parse_os_release()
+    except (OSError, ValueError):
+        return None
+    codename = d.get("UBUNTU_CODENAME") or d.get("VERSION_CODENAME")
+    return codename.replace("\"", "") if codename else None
+
+
+# Machine names (as in uname) and the architecture names used by the index.
+_ARCHITECTURES = {
+    "x86_64": "amd64",
+    "i386": "i386",
+    "i486": "i386",
+    "i586": "i386",
+    "i686": "i386",
+    "aarch64": "arm64",
+    "armv7l": "armhf",
+    "armv6l": "armhf",
+    "ppc64le": "ppc64el",
+    "s390x": "s390x",
+    "riscv64": "riscv64"
+}
 
 
-def spawn_thread(target, daemon=True, args=[]):
+def get_distro_arch():
     """
-    Creates another thread to run a function in the background.
+    Returns the system's architecture as named by the index, e.g. "amd64".
     """
-    newthread = Thread(target=target, args=(args))
-    if daemon:
-        newthread.daemon = True
-    newthread.start()
+    machine = platform.machine()
+    return _ARCHITECTURES.get(machine, machine)
+
@@ -5,12 +5,27 @@ the view.
 
 import os
 import json
+import re
+import threading
 import webbrowser
 
+from . import appstream as AppStream
+from . import aptcache as AptCache
 from . import common as Common
 from . import controller as Controller
+from . import dispatch as Dispatch
+from . import facets as Facets
+from . import index as Index
+from . import installed as Installed
+from . import prefetch as Prefetch
 from . import locales as Locales
 from . import preferences as Preferences
+from . import profiler as Profiler
+from . import progress as Progress
+from . import responses as Responses
+from . import search as Search
+from . import snapd as Snapd
+from . import transaction as Transaction
 
 Locales = Locales.LOCALES
 dbg = None
@@ -18,6 +33,17 @@ dbg = None
 # Minimum version of the curated index supported by this version of the program.
 __INDEX_MIN_VER__ = 7
 
+# Size of application icons in lists and on the details page.
+ICON_SIZE = 64
+
+# Applications sent for the first screen of a list, then for each page after as the user scrolls.
+FIRST_PAGE_SIZE = 40
+PAGE_SIZE = 100
+
+# Requests of one kind that may run at once, so a burst (e.g. typing a search)
+# leaves workers free for the others.
+VIEW_CONCURRENCY = 2
+
 
 class SoftwareBoutiqueController(object):
     """
@@ -30,11 +56,28 @@ class SoftwareBoutiqueController(object):
         self.app = app
         self.args = args
         self.data_source = Common.get_data_source()
-        self.send_data = app.send_data
         self.set_view_variable = app.set_view_variable
         self.dbg = app.dbg
-        self.pref = Preferences.Preferences(dbg, "preferences", "software-boutique")
+        self.dispatcher = Dispatch.Dispatcher(self.dbg, self._reply)
+        self._register_requests()
+        self.profiler = Profiler.Profiler()
+        self.pref = Preferences.get_preferences(self.dbg, "preferences", "software-boutique")
         self.index = None
+        self.search_index = None
+        self.search_ready = threading.Event()
+        self.facets = None
+        self.facets_ready = threading.Event()
+        self.appstream = None
+        self.appstream_ready = threading.Event()
+        self.apt_catalogue = None
+        self.apt_ready = threading.Event()
+
+        # Listings show software for this system, unless another was chosen at the command line.
+        self.arch = args.arch or Common.get_distro_arch()
+        self.codename = args.codename or Common.get_distro_codename()
+
+        # Lists and details already sent to the view, as JSON.
+        self.responses = Responses.ResponseCache(self.pref.read("response_cache_size", Responses.MAX_CACHE_SIZE))
 
         # FIXME: libboutique: Get status of apt, snap and appstream.
         self.available_backends = {
@@ -43,6 +86,54 @@ class SoftwareBoutiqueController(object):
             "appstream": False
         }
 
+        # One connection to snapd (kept open) is shared by everything that needs it.
+        self.snapd = None if args.no_snap else Snapd.SnapdClient()
+
+        # Which software is installed, parsed in the background on start up.
+        self.installed = Installed.InstalledState(snapd=self.snapd)
+        self.dispatcher.submit(self.installed.refresh)
+
+        # Downloads for queued items go to a shared cache.
+        span = self.profiler.span("Prepare backends")
+        self.prefetcher = Prefetch.Prefetcher(os.path.join(self.pref.folder_cache, "archives"),
+                                              self.pref.read("download_concurrency", 2),
+                                              self.pref.read("download_bandwidth", 0))
+
+        # Backends that process the queue
+        self.backends = {}
+        if not args.no_apt:
+            self.backends["apt"] = Transaction.AptBackend(self.prefetcher)
+        if not args.no_snap:
+            self.backends["snap"] = Transaction.SnapBackend(self.snapd)
+
+        # These checks run before the window appears, so they must be quick (snapd is probed with a short timeout).
+        for name in list(self.backends.keys()):
+            if self.backends[name].is_available():
+                self.available_backends[name] = True
+            else:
+                del self.backends[name]
+
+        # AppStream metadata from the distribution's repositories, read in the background (see below).
+        if AppStream.get_sources():
+            self.available_backends["appstream"] = True
+            self.appstream = AppStream.AppStreamCatalogue(self.dbg, os.path.join(self.pref.folder_cache, "appstream.cache"),
+                                                          Common.get_locales(args.locale))
+        else:
+            self.appstream_ready.set()
+
+        # Packages available from apt, for searching beyond the curated index.
+        if self.available_backends["apt"]:
+            self.apt_catalogue = AptCache.AptCatalogue(self.dbg, os.path.join(self.pref.folder_cache, "apt.cache"), self.arch)
+        else:
+            self.apt_ready.set()
+
+        self.progress = Progress.ProgressReporter(self._send_queue_state, self.pref.read("progress_rate", Progress.DEFAULT_RATE))
+        # The queue's worker runs for as long as there are items, so it has its own thread instead of a background worker.
+        self.queue = Transaction.TransactionQueue(self.backends, self._update_queue_list,
+                                                  self._on_queue_progress, self._on_queue_finished,
+                                                  None, self.prefetcher, self._on_queue_download)
+        span.end()
+
         # Is the index working?
         index_available = False
         index_timestamp = None
@@ -50,18 +141,22 @@ class SoftwareBoutiqueController(object):
         index_name = None
         index_info_url = None
         index_support_url = None
-        index_path = os.path.join(self.data_source, "index", "applications-en.json")
-        if os.path.exists(index_path):
+        index_dir = os.path.join(self.data_source, "index")
+        try:
+            with self.profiler.span("Load index"):
+                self.index = Index.open_index(index_dir, Common.get_locales(args.locale))
+        except Exception as e:
+            self.dbg.stdout("Failed to load index: " + str(e), self.dbg.error)
+
+        if self.index:
             try:
-                with open(index_path, "r") as f:
-                    self.index = json.load(f)
-                index_timestamp = self.index["stats"]["compiled"]
-                index_revision = self.index["stats"]["revision"]
-                index_name = self.index["distro"]["name"]
-                index_info_url = self.index["distro"]["info_url"]
-                index_support_url = self.index["distro"]["support_url"]
+                index_timestamp = self.index.stats["compiled"]
+                index_revision = self.index.stats["revision"]
+                index_name = self.index.distro["name"]
+                index_info_url = self.index.distro["info_url"]
+                index_support_url = self.index.distro["support_url"]
                 index_available = True
-                self.dbg.stdout("Index successfully loaded.", self.dbg.success)
+                self.dbg.stdout("Index successfully loaded: {0} ({1})".format(self.index.path, self.index.locale), self.dbg.success)
             except Exception as e:
                 self.dbg.stdout("Failed to load index: " + str(e), self.dbg.error)
         else:
@@ -93,6 +188,20 @@ class SoftwareBoutiqueController(object):
         }
         self.set_view_variable("SETTINGS", self.settings)
 
+        # Prepare filters and search in the background, as they may need to be (re)built.
+        if self.index:
+            self.dispatcher.submit(self._load_facet_index)
+            self.dispatcher.submit(self._load_search_index)
+        else:
+            self.facets_ready.set()
+            self.search_ready.set()
+
+        # Then the catalogues beyond the curated index, which take longer.
+        if self.appstream is not None:
+            self.dispatcher.submit(self._load_appstream)
+        if self.apt_catalogue is not None:
+            self.dispatcher.submit(self._load_apt_catalogue)
+
 
     ##################################################
     def _example(self):
@@ -135,42 +244,75 @@ class SoftwareBoutiqueController(object):
 
     ##################################################
 
+    def _register_requests(self):
+        """
+        Bind requests from the view to the functions that handle them.
+
+        Blocking requests run on a worker thread. Those that supersede each other
+        (e.g. changing category) cancel an older request that is still pending.
+        """
+        register = self.dispatcher.register
+
+        # Callbacks for queued items
+        register("update_queue_list", self._update_queue_list)
+        register("update_queue_state", self._update_queue_state)
+
+        # Queue requests
+        register("queue_add_item", self._queue_add_item)
+        register("queue_clear", self._queue_clear)
+        register("queue_drop_item", self._queue_drop_item)
+        register("queue_stop_active", self._queue_stop_active)
+
+        # App requests
+        register("request_category_list", self._request_category_list, blocking=True, concurrency=VIEW_CONCURRENCY, supersede="app_list")
+        register("app_info", self._app_info, blocking=True, concurrency=VIEW_CONCURRENCY, supersede="app_details")
+        register("app_launch", self._app_launch, blocking=True)
+        register("app_show_error", self._app_show_error)
+        register("app_reinstall", self._app_reinstall)
+        register("app_remove", self._app_remove)
+        register("app_install", self._app_install)
+        register("search", self._search, blocking=True, concurrency=VIEW_CONCURRENCY, supersede="search")
+
+        # General
+        register("open_uri", self._open_uri)
+        register("settings_set_key", self._settings_set_key)
+
     def process_view_request(self, request_name, data):
         """
         Processes a request sent from the view by matching the request to the
         function and passing the Python dictonary (data).
         """
-        bindings = {
-            # Callbacks for queued items
-            "update_queue_list": self._update_queue_list,
-            "update_queue_state": self._update_queue_state,
-
-            # Queue requests
-            "queue_clear": self._queue_clear,
-            "queue_drop_item": self._queue_drop_item,
-
-            # App requests
-            "request_category_list": self._request_category_list,
-            "app_info": self._app_info,
-            "app_launch": self._app_launch,
-            "app_show_error": self._app_show_error,
-            "app_reinstall": self._app_reinstall,
-            "app_remove": self._app_remove,
-            "app_install": self._app_install,
-
-            # General
-            "open_uri": self._open_uri,
-            "settings_set_key": self._settings_set_key
-        }
-
         try:
-            bindings[request_name](data)
+            self.dispatcher.dispatch(request_name, data)
         except KeyError as e:
-            dbg.stdout("Request failed: " + request_name, dbg.error)
-            dbg.stdout("Exception:", dbg.error)
+            self.dbg.stdout("Request failed: " + request_name, self.dbg.error)
+            self.dbg.stdout("Exception:", self.dbg.error)
             raise e
             return False
 
+    def send_data(self, function, data, coalesce=False):
+        """
+        Send data to the view. When responding to a request, its ID is included
+        so the view can match the response, unless the request was superseded
+        in which case the response is discarded.
+        """
+        context = self.dispatcher.current()
+        if context:
+            if context.is_cancelled():
+                return False
+            if context.request_id is not None and isinstance(data, Responses.SerializedData):
+                data = data.with_field("request_id", context.request_id)
+            elif context.request_id is not None and type(data) == dict:
+                data = dict(data, request_id=context.request_id)
+        return self.app.send_data(function, data, coalesce)
+
+    def _reply(self, context, reply):
+        """
+        Handlers returning a dictionary are replying directly to the request.
+        """
+        if context.request_id is not None:
+            self.app.reply(context.request_id, reply)
+
     def shutdown(self):
         """
         The user requested to quit Software Boutique. Gracefully stop all operations
@@ -178,6 +320,16 @@ class SoftwareBoutiqueController(object):
 
         If it is not possible to stop right now, return False.
         """
+        if self.queue.is_busy():
+            return False
+
+        self.dispatcher.shutdown()
+        self.prefetcher.shutdown()
+        if self.snapd:
+            self.snapd.close()
+        self.pref.flush()
+        if self.index:
+            self.index.close()
         return True
 
     def _open_uri(self, data):
@@ -204,11 +356,14 @@ class SoftwareBoutiqueController(object):
         Params:
             queue           List containing queue JSON data.
         """
-        self.send_data("update_queue_list", queue)
+        self.send_data("update_queue_list", {
+            "queue": queue
+        })
 
-    def _update_queue_state(self, state, action_text, details_text, value, value_end):
+    def _update_queue_state(self, state, action_text, details_text, value, value_end, measure=False):
         """
         Callback: When the current item in the queue has changed state.
+        Updates are rate limited, but the final (not "busy") state is always sent.
 
         Params:
             state           String of either: "ok", "busy", "error". Determines icon.
@@ -216,101 +371,500 @@ class SoftwareBoutiqueController(object):
             details_text    Optional string for action text, e.g. download size or verbose progress text.
             value           Value for progress bar, e.g. current download size. Use -1 for indeterminate.
             value_end       Max value for progress bar, e.g. total download size. Use 0 to hide progress.
+            measure         True if the values are bytes transferred, to include the rate and time remaining.
         """
-        self.send_data("update_queue_state", {
-            "state": state,
-            "action_text": action_text,
-            "details_text": details_text,
-            "value": value,
-            "value_end": value_end
-        })
+        self.progress.update(state, action_text, details_text, value, value_end, measure)
+
+    def _send_queue_state(self, data):
+        """
+        Callback: Progress is ready to be sent to the view.
+        """
+        self.send_data("update_queue_state", data, coalesce=True)
+
+    def _on_queue_progress(self, item, value, value_end, position, total):
+        """
+        Callback: The queue is processing an item.
+        """
+        strings = {
+            "install": "queue_installing",
+            "remove": "queue_removing",
+            "reinstall": "queue_reinstalling"
+        }
+        action_text = format_locale(Locales[strings[item.action]], {"XXX": item.name, "1": position, "2": total})
+        self._update_queue_state("busy", action_text, "", value, value_end)
+
+    def _on_queue_download(self, item, bytes_done, bytes_total, position, total):
+        """
+        Callback: The queue is waiting for an item's files to download.
+        """
+        action_text = format_locale(Locales["queue_downloading"], {"XXX": item.name, "1": position, "2": total})
+
+        if bytes_total:
+            megabyte = 1024 * 1024
+            details_text = format_locale(Locales["queue_progress"], {
+                "1": "{0:.1f}".format(bytes_done / megabyte),
+                "2": "{0:.1f}".format(bytes_total / megabyte)
+            })
+            self._update_queue_state("busy", action_text, details_text, bytes_done, bytes_total, measure=True)
+        else:
+            self._update_queue_state("busy", action_text, "", -1, 0)
+
+    def _on_queue_finished(self, items):
+        """
+        Callback: The queue has processed all items.
+        """
+        failed = [item for item in items if not item.success]
+        self._update_installed_state(items)
+
+        if failed:
+            self._update_queue_state("error", Locales["queue_error"],
+                format_locale(Locales["queue_error_state"], {"1": len(items) - len(failed), "2": len(failed)}), 0, -1)
+        else:
+            counts = {"install": 0, "reinstall": 0, "remove": 0}
+            for item in items:
+                counts[item.action] += 1
+            self._update_queue_state("ok", Locales["queue_success"],
+                format_locale(Locales["queue_success_state"], {"1": counts["install"], "2": counts["reinstall"], "3": counts["remove"]}), 0, -1)
+
+    def _update_installed_state(self, items):
+        """
+        After the queue has processed items, check what changed on the system
+        and inform the view of applications that are now (un)installed.
+
+        Items are compared with their state when queued, as other requests
+        (e.g. searching) may have refreshed the installed state in the meantime.
+        """
+        self.installed.refresh()
+
+        apps = {}
+        for item in items:
+            if not item.packages:
+                continue
+            installed = self.installed.is_installed(item.backend, item.packages[0])
+            if installed != item.was_installed:
+                apps[item.id] = installed
+
+        if apps:
+            self.send_data("update_installed_state", {
+                "apps": apps
+            })
+
+    def _get_queue_item(self, view_id, action):
+        """
+        Returns a QueueItem for an application, or None if the app cannot be found.
+
+        Params:
+            view_id     ID of the application used by the view, e.g. "curated:caja" or "apt:caja"
+            action      Either: "install", "remove", "reinstall"
+        """
+        backend, name = view_id.split(":", 1)
+
+        if backend != "curated":
+            return Transaction.QueueItem(view_id, name, "", backend, [name], action)
+
+        record = self.index.get_app(name) if self.index else None
+        if not record:
+            return None
+
+        backend = record.get("backend")
+        if backend == "snap":
+            packages = [record.get("snap_name")] if record.get("snap_name") else []
+        else:
+            packages = record.get("apt_packages", [])
+
+        if not packages:
+            return None
+
+        icon = {"icon": record.get("icon", "")}
+        self._resolve_icons([icon])
+        return Transaction.QueueItem(view_id, record.get("name"), icon["icon"], backend, packages, action)
+
+    def _queue_app(self, view_id, action):
+        item = self._get_queue_item(view_id, action)
+        if not item:
+            self.dbg.stdout("Cannot queue unknown application: " + view_id, self.dbg.error)
+            return False
+        if item.packages:
+            item.was_installed = self.installed.is_installed(item.backend, item.packages[0])
+        self.queue.add(item)
+
+    def _queue_add_item(self, data):
+        """
+        Request: User adds an application to the queue.
+        """
+        backends = {
+            "index": "curated",
+            "snapd": "snap",
+            "apt": "apt"
+        }
+        self._queue_app(backends.get(data["backend"], data["backend"]) + ":" + data["id"], data["operation"])
 
     def _queue_clear(self, data):
         """
         Request: User clears all completed items in the queue.
         """
-        pass
+        self.queue.clear()
 
     def _queue_drop_item(self, data):
         """
         Request: User drops a specific application from the queue.
-        If the item is being processed, the changes should abort (or revert) if possible.
+        Items being processed can't be dropped, only stopped with the rest of their batch.
         """
-        pass
+        if not self.queue.drop(data["id"]):
+            self.dbg.stdout("Cannot drop an item that is being processed: " + data["id"], self.dbg.warning, 1)
+
+    def _queue_stop_active(self, data):
+        """
+        Request: User aborts the changes currently being processed.
+        """
+        if not self.queue.stop_active():
+            self.dbg.stdout("The changes being processed can no longer be stopped safely.", self.dbg.warning, 1)
+
+    def _get_installed_version(self, record):
+        """
+        Returns the installed version of a curated application, or None if it
+        is not installed. Applications are identified by their main package.
+        """
+        backend = record.get("backend")
+        if backend == "snap":
+            name = record.get("snap_name")
+        else:
+            packages = record.get("apt_packages")
+            name = packages[0] if packages else None
+
+        if not name:
+            return None
+        return self.installed.get_version(backend, name)
+
+    def _resolve_icons(self, apps):
+        """
+        Applications may specify an icon from the icon theme instead of a path.
+        Find these for a whole list at once, which is quick when cached.
+        """
+        icons = getattr(self.app, "icons", None)
+        names = [app["icon"] for app in apps if app["icon"] and not app["icon"].startswith("/")]
+        if not names:
+            return
+
+        if not icons:
+            paths = {}
+        else:
+            paths = icons.lookup_many([(name, ICON_SIZE) for name in names])
+
+        for app in apps:
+            if app["icon"] and not app["icon"].startswith("/"):
+                app["icon"] = paths.get((app["icon"], ICON_SIZE)) or ""
+
+    def _get_thumbnails(self, view_id, screenshots, details_sent):
+        """
+        Returns the thumbnails to show for an application's screenshots. Those
+        not created yet are None, and are sent to the view when they are ready,
+        after the details page ('details_sent' is set).
+        """
+        thumbnails = getattr(self.app, "thumbnails", None)
+        if not thumbnails:
+            return list(screenshots)
+
+        def _ready(source, path):
+            details_sent.wait(5)
+            for index, screenshot in enumerate(screenshots):
+                if screenshot == source:
+                    self.send_data("update_screenshot_thumbnail", {
+                        "id": view_id,
+                        "index": index,
+                        "thumbnail": path or source
+                    })
+
+        return thumbnails.get_thumbnails(screenshots, _ready)
+
+    def _get_response_key(self, request, *args):
+        """
+        Identifies a response by the request and everything else it depends
+        on. When any of these change, the key does too, so cached responses
+        are never out of date.
+        """
+        icons = getattr(self.app, "icons", None)
+        thumbnails = getattr(self.app, "thumbnails", None)
+        return (
+            request,
+            args,
+            self.index.stats["revision"] if self.index else None,
+            self.facets is not None,
+            self.arch,
+            self.codename,
+            self.installed.generation,
+            self.pref.read("hide_proprietary", False),
+            self.pref.read("compact_list", False),
+            icons.generation if icons else None,
+            thumbnails.generation if thumbnails else None
+        )
+
+    def _get_list_item(self, app_id, record):
+        """
+        Returns the data for an application as shown in a list.
+        """
+        return {
+            "name": record.get("name"),
+            "id": "curated:" + app_id,
+            "backend": "curated",
+            "icon": record.get("icon", ""),
+            "installed": self._get_installed_version(record) is not None,
+            "summary": record.get("summary")
+        }
+
+    def _get_package_list_item(self, package):
+        """
+        Returns the data for a package from apt as shown in a list, using
+        AppStream's name and icon when the package has them.
+        """
+        name = package[AptCache.NAME]
+        component = self.appstream.get_by_package(name) if self.appstream else None
+        return {
+            "name": component["name"] if component and component["name"] else name,
+            "id": "apt:" + name,
+            "backend": "apt",
+            "icon": (component["icon"] or "") if component else "",
+            "installed": self.installed.is_installed("apt", name),
+            "summary": component["summary"] if component and component["summary"] else package[AptCache.SUMMARY]
+        }
+
+    def _get_app_details(self, app_id, record):
+        """
+        Returns the data for an application as shown on the details page.
+        """
+        installed_version = self._get_installed_version(record)
+        return {
+            "name": record.get("name"),
+            "id": "curated:" + app_id,  # This ID is the view's way of telling the model/controller what the source is.
+            "backend": record.get("backend"),
+            "icon": record.get("icon", ""),  # Path to icon, name of a theme icon, or blank for generic icon.
+            "summary": record.get("summary"),
+            "description": record.get("description"),
+            "nonfree": record.get("nonfree"),
+            "free_license": record.get("free_license"),
+            "arch": record.get("arch", []),
+            "developer": record.get("developer"),
+            "developer_url": record.get("developer_url"),
+            "website_url": record.get("website_url"),
+            "support_url": record.get("support_url"),
+            "apt_source": record.get("apt_source"),  # "main", "universe", "multiverse", "restricted", "partner", "ppa:org/name", "https://repo.example.com"
+            "apt_packages": record.get("apt_packages", []),
+            "snap_name": record.get("snap_name"),
+            "launch_cmd": record.get("launch_cmd"),
+            "tags": record.get("tags", []),
+            "screenshots": record.get("screenshots", []),
+            "version": installed_version or record.get("version"),
+            "installed": installed_version is not None,
+            "install_date": None  # [YYYY, MM, DD, HH, MM]
+        }
 
     def _request_category_list(self, data):
         """
         Request: User is listing all the curated applications in a category.
+
+        Lists are sent a page at a time. The first request has no cursor, and
+        the view requests the next page using the cursor from the response
+        when the user scrolls towards the end of the list.
         """
         category = data["category"]
         element = data["element"]
-
-        # FIXME: Dummy response
-        self.send_data("populate_app_list", {
+        cursor = data.get("cursor") or 0
+        page_size = PAGE_SIZE if cursor else FIRST_PAGE_SIZE
+        apps = []
+        app_ids = []
+        filtered = False
+        self.installed.refresh()
+
+        # Filters are only expected to be unavailable for the first few moments after start up.
+        self.facets_ready.wait(10)
+        key = self._get_response_key("populate_app_list", category, element, cursor)
+        response = self.responses.get(key)
+        if response:
+            return self.send_data("populate_app_list", response)
+
+        if self.index:
+            app_ids, filtered = self._get_category_app_ids(category)
+            for app_id in app_ids[cursor:cursor + page_size]:
+                if self.dispatcher.is_cancelled():
+                    return
+                record = self.index.get_app(app_id)
+                if record:
+                    apps.append(self._get_list_item(app_id, record))
+
+        next_cursor = cursor + page_size
+        self._resolve_icons(apps)
+        response = {
             "category": category,
             "element": element,
-            "apps": [
-                {
-                    "name": "Application 1",
-                    "id": "apt:app1",
-                    "backend": "apt",
-                    "icon": "",
-                    "installed": True,
-                    "summary": "This is a short line describing this application"
-                },
-                {
-                    "name": "Application 2",
-                    "id": "snap:app2",
-                    "backend": "snap",
-                    "icon": "",
-                    "installed": False,
-                    "summary": "This is a short line describing this application"
-                },
-                {
-                    "name": "Application 3",
-                    "id": "curated:app3",
-                    "backend": "curated",
-                    "icon": "",
-                    "installed": True,
-                    "summary": "This is a short line describing this application"
-                }
-            ]
-        })
+            "apps": apps,
+            "cursor": cursor,
+            "next_cursor": next_cursor if next_cursor < len(app_ids) else None,
+            "total": len(app_ids)
+        }
+
+        # An unfiltered list is only kept until the filters are ready.
+        if filtered:
+            response = self.responses.put(key, response)
+        self.send_data("populate_app_list", response)
 
     def _app_info(self, data):
         """
         Request: User is viewing details for a specific application.
         """
-        # FIXME: Dummy response
-        self.send_data("open_app_details", {
-            "data": {
-                "name": "Application 1",
-                "id": "apt:app1", # This ID is the view's way of telling the model/controller what the source is.
-                "backend": "apt",
-                "icon": "", # Path to icon, or blank for generic icon.
-                "summary": "Calculator for the GTK desktop",
-                "description": "This is line 1.\nThis is line 2.\nThis is line 3.",
-                "nonfree": False,
-                "free_license": "GNU General Public License",
-                "arch": ["i386", "amd64", "armhf", "arm64", "powerpc"],
-                "developer": "Developer Name",
-                "developer_url": "https://developer.example.com",
-                "website_url": "https://example.com",
-                "support_url": "https://support.example.com",
-                "apt_source": "ppa:org/name", # "main", "universe", "multiverse", "restricted", "partner", "ppa:org/name", "https://repo.example.com"
-                "apt_packages": ["app1", "app1-data", "app1-doc"],
-                "snap_name": "nameofsnap",
-                "launch_cmd": "app1",
-                "tags": [], # TODO: Curated only? may be unused
-                "screenshots": [
-                    "/path/to/screenshot-1.jpg",
-                    "/path/to/screenshot-2.jpg"
-                ],
-                "version": "20.04.1-ubuntu0",
-                "installed": True,
-                "install_date": [2019, 12, 31, 23, 59] # [YYYY, MM, DD, HH, MM]
-            }
-        })
+        backend, app_id = data["id"].split(":", 1)
+
+        # TODO: Details for non-curated applications (apt, snap)
+        record = None
+        if backend == "curated" and self.index:
+            record = self.index.get_app(app_id)
+
+        if not record:
+            self.dbg.stdout("Application not found: " + data["id"], self.dbg.error)
+            return False
+
+        self.installed.refresh()
+        key = self._get_response_key("open_app_details", data["id"])
+        response = self.responses.get(key)
+        if response:
+            return self.send_data("open_app_details", response)
+
+        # The user may have opened another application while this one was waiting.
+        if self.dispatcher.is_cancelled():
+            return
+        details = self._get_app_details(app_id, record)
+        details_sent = threading.Event()
+        details["thumbnails"] = self._get_thumbnails(details["id"], details["screenshots"], details_sent)
+        self._resolve_icons([details])
+
+        # Thumbnails still being created are sent later, so this response can't be used again.
+        response = {"data": details}
+        if None not in details["thumbnails"]:
+            response = self.responses.put(key, response)
+
+        self.send_data("open_app_details", response)
+        details_sent.set()
+
+    def _load_facet_index(self):
+        """
+        Loads the bitsets for filtering categories from the cache, or builds
+        them if the index has changed.
+        """
+        cache_path = os.path.join(self.pref.folder_cache, "facets.cache")
+        try:
+            facets = Facets.get_facet_index(self.index, cache_path)
+
+            # This system may be unknown to the index, e.g. a newer release, so only filter by what the index has.
+            if not self.args.arch and self.arch not in facets.get_values("arch"):
+                self.arch = None
+            if not self.args.codename and self.codename not in facets.get_values("release"):
+                self.codename = None
+
+            self.facets = facets
+            self.dbg.stdout("Filters ready: arch {0}, release {1}".format(self.arch, self.codename), self.dbg.success, 1)
+        except Exception as e:
+            self.dbg.stdout("Failed to prepare filters: " + str(e), self.dbg.error)
+        self.facets_ready.set()
+
+    def _load_appstream(self):
+        """
+        Reads the system's AppStream collections, or loads them from the
+        cache if they haven't changed.
+        """
+        try:
+            with self.profiler.span("Load AppStream"):
+                self.appstream.load()
+        except Exception as e:
+            self.dbg.stdout("Failed to read AppStream metadata: " + str(e), self.dbg.error)
+        self.appstream_ready.set()
+
+    def _load_apt_catalogue(self):
+        """
+        Reads apt's lists of packages, or loads them from the cache if they
+        haven't changed.
+        """
+        try:
+            with self.profiler.span("Load apt catalogue"):
+                self.apt_catalogue.load()
+        except Exception as e:
+            self.dbg.stdout("Failed to read apt lists: " + str(e), self.dbg.error)
+        self.apt_ready.set()
+
+    def _get_category_app_ids(self, category):
+        """
+        Returns (app IDs, whether they were filtered) for a category, showing
+        those for this system and the user's preferences. If the filters
+        aren't available, all of the category's app IDs are returned.
+        """
+        app_ids = self.index.get_category(category)
+
+        # Filters are only expected to be unavailable for the first few moments after start up.
+        self.facets_ready.wait(10)
+        facets = self.facets.categories.get(category) if self.facets else None
+        if not facets or facets.count != len(app_ids):
+            return app_ids, False
+
+        positions = self.facets.filter(category, self.arch, self.codename, None, self.pref.read("hide_proprietary", False))
+        return [app_ids[position] for position in positions], True
+
+    def _load_search_index(self):
+        """
+        Loads the search index for the curated index from the cache, or
+        builds it if the index has changed.
+        """
+        cache_path = os.path.join(self.pref.folder_cache, "search-v{0}-{1}.cache".format(Search.CACHE_VERSION, self.index.locale))
+        try:
+            self.search_index = Search.get_search_index(self.index, cache_path)
+            self.dbg.stdout("Search index ready: {0} applications".format(len(self.search_index)), self.dbg.success, 1)
+        except Exception as e:
+            self.dbg.stdout("Failed to prepare search index: " + str(e), self.dbg.error)
+        self.search_ready.set()
+
+    def _search(self, data):
+        """
+        Request: User is searching for an application.
+        """
+        query = data["query"]
+        element = data["element"]
+        apps = []
+
+        # The index is only expected to be unavailable for the first few moments after start up.
+        self.search_ready.wait(10)
+        self.installed.refresh()
+
+        key = self._get_response_key("populate_search_results", query, element)
+        response = self.responses.get(key)
+        if response:
+            return self.send_data("populate_search_results", response)
+
+        curated_packages = set()
+        if self.search_index:
+            for app_id, score in self.search_index.search(query, limit=100):
+                if self.dispatcher.is_cancelled():
+                    return
+                record = self.index.get_app(app_id)
+                if record:
+                    apps.append(self._get_list_item(app_id, record))
+                    curated_packages.update(record.get("apt_packages", []))
+
+        # Packages from the repositories, except those already listed as curated applications.
+        if self.apt_catalogue and self.apt_ready.is_set():
+            for package in self.apt_catalogue.search(query, limit=50):
+                if self.dispatcher.is_cancelled():
+                    return
+                if package[AptCache.NAME] not in curated_packages:
+                    apps.append(self._get_package_list_item(package))
+
+        self._resolve_icons(apps)
+        response = {
+            "query": query,
+            "element": element,
+            "apps": apps
+        }
+
+        # Until the indexes are ready, there are no results to keep.
+        if self.search_index and self.apt_ready.is_set() and self.appstream_ready.is_set():
+            response = self.responses.put(key, response)
+        self.send_data("populate_search_results", response)
 
     def _app_launch(self, data):
         """
@@ -328,16 +882,25 @@ class SoftwareBoutiqueController(object):
         """
         Request: User would like to re-install this application.
         """
-        pass
+        self._queue_app(data["id"], "reinstall")
 
     def _app_remove(self, data):
         """
         Request: User would like to remove this application.
         """
-        pass
+        self._queue_app(data["id"], "remove")
 
     def _app_install(self, data):
         """
         Request: User would like to install this application.
         """
-        pass
+        self._queue_app(data["id"], "install")
+
+
+def format_locale(string, values):
+    """
+    Substitutes placeholders in a locale string, e.g. "XXX", "1", "2".
+    All placeholders are replaced at once so values cannot be substituted twice.
+    """
+    pattern = "|".join([re.escape(key) for key in sorted(values.keys(), key=len, reverse=True)])
+    return re.sub(pattern, lambda match: str(values[match.group(0)]), string)
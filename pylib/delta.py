@@ -0,0 +1,379 @@
+"""
+Updates the curated index between revisions by applying only the applications
+that changed, instead of replacing the whole index.
+
+A source (e.g. a directory of the index's build output) contains:
+    applications-en.json                Full index, for when a delta can't be used.
+    applications-en.revision            Latest revision number.
+    applications-en.<from>-<to>.delta   Gzipped JSON of changes between two revisions.
+
+Deltas are applied in a chain from the installed revision to the latest. The
+result is verified against a hash of its content, and if anything goes wrong
+the full index is copied instead.
+
+The installed JSON is not rewritten after a delta. Instead, the applications
+that changed since it was written are saved in a patch, which index.py applies
+when opening the index. Once the patch grows to MAX_PATCH_RATIO of the JSON,
+the JSON is written in full and recompiled, and the patch is removed.
+
+Delta structure:
+    {
+        "format": 1,
+        "from_revision": 122,
+        "to_revision": 123,
+        "base_hash": "<sha256 of the index at 'from_revision'>",
+        "result_hash": "<sha256 of the index at 'to_revision'>",
+        "stats": {...},
+        "distro": {...},
+        "changed": {"<app id>": {<record>}},
+        "removed": ["<app id>"]
+    }
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import time
+
+try:
+    from . import index as Index
+except ImportError:
+    # Running as a script, e.g. python3 pylib/delta.py
+    import index as Index
+
+DELTA_FORMAT = 1
+
+# Size of a patch, relative to the JSON, at which the JSON is rewritten instead.
+MAX_PATCH_RATIO = 0.25
+
+
+class DeltaError(Exception):
+    """
+    The delta cannot be applied to this index.
+    """
+    pass
+
+
+class UpdateResult(object):
+    """
+    Describes how an index was updated.
+    """
+    def __init__(self):
+        self.method = None          # "current", "delta" or "full"
+        self.from_revision = None
+        self.to_revision = None
+        self.bytes_read = 0         # Bytes transferred from the source.
+        self.bytes_written = 0      # Bytes written to the index directory.
+        self.duration = 0           # Seconds
+        self.error = None           # Why deltas could not be used, if applicable.
+
+    def __str__(self):
+        return "{0}: revision {1} => {2}, {3} bytes read, {4} bytes written in {5:.3f}s".format(
+            self.method, self.from_revision, self.to_revision, self.bytes_read, self.bytes_written, self.duration)
+
+
+def get_content_hash(data):
+    """
+    Returns a SHA256 hash of the index. The same content always has the same
+    hash, regardless of how the JSON was formatted.
+    """
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def make_delta(old_data, new_data):
+    """
+    Returns a delta (dictionary) to update 'old_data' to 'new_data'.
+    """
+    old_apps = old_data["apps"]
+    new_apps = new_data["apps"]
+
+    changed = {}
+    for app_id in new_apps.keys():
+        if old_apps.get(app_id) != new_apps[app_id]:
+            changed[app_id] = new_apps[app_id]
+
+    return {
+        "format": DELTA_FORMAT,
+        "from_revision": old_data["stats"]["revision"],
+        "to_revision": new_data["stats"]["revision"],
+        "base_hash": get_content_hash(old_data),
+        "result_hash": get_content_hash(new_data),
+        "stats": new_data["stats"],
+        "distro": new_data["distro"],
+        "changed": changed,
+        "removed": sorted([app_id for app_id in old_apps.keys() if app_id not in new_apps])
+    }
+
+
+def apply_delta(data, delta, verify=True):
+    """
+    Applies a delta to an index (dictionary) in place and returns it.
+    Raises DeltaError if the delta is for a different index or the result does not match.
+    """
+    if delta.get("format") != DELTA_FORMAT:
+        raise DeltaError("Unsupported delta format: " + str(delta.get("format")))
+
+    if data["stats"]["revision"] != delta["from_revision"]:
+        raise DeltaError("Delta is for revision {0}, but the index is revision {1}".format(
+            delta["from_revision"], data["stats"]["revision"]))
+
+    if verify and get_content_hash(data) != delta["base_hash"]:
+        raise DeltaError("Index does not match the delta's base")
+
+    apps = data["apps"]
+    for app_id in delta["removed"]:
+        apps.pop(app_id, None)
+    apps.update(delta["changed"])
+    data["stats"] = delta["stats"]
+    data["distro"] = delta["distro"]
+
+    if verify and get_content_hash(data) != delta["result_hash"]:
+        raise DeltaError("Index does not match the delta's result")
+
+    return data
+
+
+def write_delta(delta, path):
+    """
+    Save a delta, compressed. Returns the number of bytes written.
+    """
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(delta, f, ensure_ascii=False, separators=(",", ":"))
+    return os.path.getsize(path)
+
+
+def read_delta(path):
+    """
+    Returns (delta, size of the file).
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        delta = json.load(f)
+    return delta, os.path.getsize(path)
+
+
+def get_delta_path(source_dir, name, from_revision, to_revision):
+    return os.path.join(source_dir, "{0}.{1}-{2}.delta".format(name, from_revision, to_revision))
+
+
+def make_delta_files(old_path, new_path, output_dir, name="applications-en"):
+    """
+    Writes the delta between two JSON indexes to a source directory, and
+    updates the latest revision. Returns the path to the delta.
+    """
+    with open(old_path, "r") as f:
+        old_data = json.load(f)
+    with open(new_path, "r") as f:
+        new_data = json.load(f)
+
+    delta = make_delta(old_data, new_data)
+    path = get_delta_path(output_dir, name, delta["from_revision"], delta["to_revision"])
+    write_delta(delta, path)
+
+    with open(os.path.join(output_dir, name + ".revision"), "w") as f:
+        f.write(str(delta["to_revision"]))
+
+    return path
+
+
+def _find_next_delta(source_dir, name, revision, latest):
+    """
+    Returns the path to the delta from 'revision' that gets closest to 'latest'.
+    """
+    prefix = "{0}.{1}-".format(name, revision)
+    best = None
+    for filename in os.listdir(source_dir):
+        if not filename.startswith(prefix) or not filename.endswith(".delta"):
+            continue
+        try:
+            to_revision = int(filename[len(prefix):-len(".delta")])
+        except ValueError:
+            continue
+        if to_revision <= latest and (best is None or to_revision > best):
+            best = to_revision
+
+    if best is None:
+        return None
+    return get_delta_path(source_dir, name, revision, best)
+
+
+def _get_locale(name):
+    # e.g. applications-pt_BR => pt_BR
+    return Index.get_locale_from_path(name + ".json")
+
+
+def _write_file(path, text):
+    """
+    Write a file atomically. Returns bytes written.
+    """
+    tmp_path = path + ".tmp"
+    raw = text.encode("utf-8")
+    with open(tmp_path, "wb") as f:
+        f.write(raw)
+    os.replace(tmp_path, path)
+    return len(raw)
+
+
+def _save_index(data, index_dir, name):
+    """
+    Write the JSON in full, remove its patch, then compile the base and the
+    text shards for every locale together. Returns bytes written.
+    """
+    json_path = os.path.join(index_dir, name + ".json")
+    written = _write_file(json_path, json.dumps(data, ensure_ascii=False))
+
+    try:
+        os.remove(Index.get_patch_path(index_dir, _get_locale(name)))
+    except FileNotFoundError:
+        pass
+
+    json_paths = [os.path.join(index_dir, filename) for filename in sorted(os.listdir(index_dir))
+                  if filename.startswith("applications-") and filename.endswith(".json")
+                  and not filename.endswith(".patch.json")]
+    compiled = Index.compile_index_files(json_paths, index_dir)
+    return written + sum([os.path.getsize(path) for path in compiled])
+
+
+def get_patch(base_data, data):
+    """
+    Returns the patch (see index.py) that changes 'base_data' into 'data'.
+    """
+    base_apps = base_data["apps"]
+    apps = data["apps"]
+    return {
+        "format": Index.PATCH_FORMAT,
+        "base_revision": base_data["stats"]["revision"],
+        "stats": data["stats"],
+        "distro": data["distro"],
+        "changed": {app_id: apps[app_id] for app_id in apps.keys() if base_apps.get(app_id) != apps[app_id]},
+        "removed": sorted([app_id for app_id in base_apps.keys() if app_id not in apps])
+    }
+
+
+def apply_patch(data, patch):
+    """
+    Applies a patch to an index (dictionary) in place and returns it.
+    """
+    apps = data["apps"]
+    for app_id in patch["removed"]:
+        apps.pop(app_id, None)
+    apps.update(patch["changed"])
+    data["stats"] = patch["stats"]
+    data["distro"] = patch["distro"]
+    return data
+
+
+def _save_patch(base_data, data, index_dir, name):
+    """
+    Save the applications that changed since the JSON was written. If that is
+    most of the index, the JSON is written in full instead. Returns bytes written.
+    """
+    json_path = os.path.join(index_dir, name + ".json")
+    patch = json.dumps(get_patch(base_data, data), ensure_ascii=False)
+    if len(patch) > os.path.getsize(json_path) * MAX_PATCH_RATIO:
+        return _save_index(data, index_dir, name)
+    return _write_file(Index.get_patch_path(index_dir, _get_locale(name)), patch)
+
+
+def _load_installed(json_path, patch_path):
+    """
+    Returns (JSON as last written in full, current index with its patch applied).
+    """
+    with open(json_path, "r") as f:
+        base_data = json.load(f)
+
+    data = {"stats": base_data["stats"], "distro": base_data["distro"], "apps": dict(base_data["apps"])}
+    patch = Index.load_patch(patch_path)
+    if patch and patch["base_revision"] == base_data["stats"]["revision"]:
+        apply_patch(data, patch)
+    return base_data, data
+
+
+def update_index(index_dir, source_dir, name="applications-en", pref=None):
+    """
+    Bring the index in 'index_dir' up to the latest revision in 'source_dir',
+    using deltas where possible.
+
+    Params:
+        index_dir       Directory of the installed index (must be writable)
+        source_dir      Directory containing the latest index and deltas.
+        name            Name of the index, e.g. applications-en
+        pref            Optional Preferences() object to record the new revision.
+
+    Returns an UpdateResult().
+    """
+    result = UpdateResult()
+    start = time.monotonic()
+    json_path = os.path.join(index_dir, name + ".json")
+    patch_path = Index.get_patch_path(index_dir, _get_locale(name))
+    source_path = os.path.join(source_dir, name + ".json")
+
+    with open(os.path.join(source_dir, name + ".revision"), "r") as f:
+        latest = int(f.read().strip())
+    result.bytes_read += len(str(latest))
+    result.to_revision = latest
+
+    base_data = None
+    data = None
+    if os.path.exists(json_path):
+        # A corrupt or partly written index is replaced in full.
+        try:
+            base_data, data = _load_installed(json_path, patch_path)
+            result.from_revision = data["stats"]["revision"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            result.error = "Cannot read the installed index: " + str(e)
+            base_data = None
+            data = None
+
+    if data and result.from_revision == latest:
+        result.method = "current"
+        result.duration = time.monotonic() - start
+        return result
+
+    if data:
+        try:
+            revision = result.from_revision
+            while revision != latest:
+                delta_path = _find_next_delta(source_dir, name, revision, latest)
+                if not delta_path:
+                    raise DeltaError("No delta from revision " + str(revision))
+                delta, size = read_delta(delta_path)
+                result.bytes_read += size
+                apply_delta(data, delta)
+                revision = delta["to_revision"]
+            result.method = "delta"
+        except (DeltaError, OSError, ValueError, KeyError) as e:
+            result.error = str(e)
+            data = None
+
+    if data:
+        result.bytes_written = _save_patch(base_data, data, index_dir, name)
+    else:
+        # Fall back to replacing the whole index.
+        with open(source_path, "r") as f:
+            data = json.load(f)
+        result.method = "full"
+        result.bytes_read += os.path.getsize(source_path)
+        result.bytes_written = _save_index(data, index_dir, name)
+
+    result.to_revision = data["stats"]["revision"]
+    if pref:
+        pref.set_index_revision(result.to_revision)
+
+    result.duration = time.monotonic() - start
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) == 5 and sys.argv[1] == "make":
+        print("Created: " + make_delta_files(sys.argv[2], sys.argv[3], sys.argv[4]))
+    elif len(sys.argv) == 4 and sys.argv[1] == "update":
+        print(update_index(sys.argv[2], sys.argv[3]))
+    else:
+        print("Usage:")
+        print("  delta.py make <old.json> <new.json> <output dir>")
+        print("  delta.py update <index dir> <source dir>")
+        sys.exit(1)
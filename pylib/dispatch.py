@@ -0,0 +1,245 @@
+"""
+Dispatches requests from the view to the controller's handlers.
+
+Handlers that may take some time (e.g. querying a backend) are registered as
+blocking, and run on a bounded pool of worker threads so the GTK main thread
+is never held up. Quick handlers run immediately on the calling thread.
+
+Background tasks (e.g. building indexes at start up) have a smaller pool of
+their own, so they never hold up requests from the view.
+"""
+
+import collections
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from . import profiler as Profiler
+
+# Number of threads shared by all blocking handlers.
+MAX_WORKERS = 4
+
+# Number of threads for background tasks.
+MAX_BACKGROUND_WORKERS = 2
+
+
+class RequestContext(object):
+    """
+    Describes a request while its handler is running.
+    """
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.request_id = data.get("request_id") if type(data) == dict else None
+        self.error = None           # Exception raised by the handler, if it failed.
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def is_done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the handler has finished, or was skipped. Returns False on timeout.
+        """
+        return self._done.wait(timeout)
+
+    def add_done_callback(self, callback):
+        """
+        Call a function with this context when the handler has finished, or was skipped.
+        If that has already happened, it is called immediately.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            callback(self)
+
+
+class _Binding(object):
+    def __init__(self, handler, blocking, concurrency, supersede):
+        self.handler = handler
+        self.blocking = blocking
+        self.concurrency = concurrency
+        self.supersede = supersede
+        self.running = 0
+        self.waiting = collections.deque()
+
+
+class Dispatcher(object):
+    """
+    Routes requests to registered handlers, running blocking handlers on a
+    thread pool with a limit of how many of each can run at once.
+    """
+    def __init__(self, dbg, on_reply=None, max_workers=MAX_WORKERS, max_background_workers=MAX_BACKGROUND_WORKERS):
+        """
+        Params:
+            dbg                     Debugging() object
+            on_reply                Function to call with (context, reply) when a handler returns a dictionary.
+            max_workers             Number of worker threads for blocking handlers.
+            max_background_workers  Number of worker threads for submit().
+        """
+        self.dbg = dbg
+        self.on_reply = on_reply
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="boutique-worker")
+        self._background = ThreadPoolExecutor(max_workers=max_background_workers, thread_name_prefix="boutique-background")
+        self._bindings = {}
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.profiler = Profiler.Profiler()
+
+    def register(self, name, handler, blocking=False, concurrency=1, supersede=None):
+        """
+        Register a handler for a request.
+
+        Params:
+            name            Name of the request, as sent by the view.
+            handler         Function to run, passing the request's data.
+            blocking        True if the handler may take time, and should run on a worker thread.
+            concurrency     For blocking handlers, the maximum number that may run at the same time.
+                            Further requests wait their turn without occupying a worker.
+            supersede       Optional group name. A new request in this group cancels older requests
+                            that have not finished, e.g. the user clicked another category.
+        """
+        self._bindings[name] = _Binding(handler, blocking, max(1, concurrency), supersede)
+
+    def __contains__(self, name):
+        return name in self._bindings
+
+    def current(self):
+        """
+        Returns the RequestContext of the handler running on this thread, if any.
+        """
+        return getattr(self._local, "context", None)
+
+    def is_cancelled(self):
+        """
+        Returns True if the handler running on this thread has been superseded.
+        Long running handlers should check this periodically.
+        """
+        context = self.current()
+        return context is not None and context.is_cancelled()
+
+    def dispatch(self, name, data, supersede=True):
+        """
+        Run the handler for a request. Raises KeyError if there is no handler.
+
+        Params:
+            name        Name of the request.
+            data        Dictionary passed to the handler.
+            supersede   False if the request should not cancel (or be cancelled by)
+                        others in its group, e.g. independent clients in headless mode.
+
+        Returns the RequestContext for the request.
+        """
+        binding = self._bindings[name]
+        context = RequestContext(name, data)
+
+        with self._lock:
+            if binding.supersede and supersede:
+                previous = self._latest.get(binding.supersede)
+                if previous:
+                    previous.cancel()
+                self._latest[binding.supersede] = context
+
+            if binding.blocking:
+                if binding.running < binding.concurrency:
+                    binding.running += 1
+                    self._pool.submit(self._run_blocking, binding, context)
+                else:
+                    binding.waiting.append(context)
+                return context
+
+        self._run(binding, context)
+        return context
+
+    def submit(self, target, *args):
+        """
+        Run a function in the background, on a separate pool to the handlers.
+        Returns a concurrent.futures.Future.
+        """
+        if self.profiler.enabled:
+            return self._background.submit(self._run_task, target, *args)
+        return self._background.submit(target, *args)
+
+    def _run_task(self, target, *args):
+        with self.profiler.span(getattr(target, "__name__", str(target)), "task"):
+            return target(*args)
+
+    def shutdown(self, wait=False):
+        """
+        Stop accepting requests and cancel any that are waiting.
+        """
+        with self._lock:
+            waiting = []
+            for binding in self._bindings.values():
+                waiting += binding.waiting
+                binding.waiting.clear()
+
+        for context in waiting:
+            context.cancel()
+            context._finish()
+        self._pool.shutdown(wait=wait)
+        self._background.shutdown(wait=wait)
+
+    def _run(self, binding, context):
+        if context.is_cancelled():
+            self.dbg.stdout("Skipped superseded request: " + context.name, self.dbg.debug, 1)
+            context._finish()
+            return
+
+        previous = self.current()
+        self._local.context = context
+        try:
+            with self.profiler.span(context.name, "request"):
+                reply = binding.handler(context.data)
+            if type(reply) == dict and self.on_reply and not context.is_cancelled():
+                self.on_reply(context, reply)
+        except Exception as e:
+            context.error = e
+            self.dbg.stdout("Request failed: " + context.name, self.dbg.error)
+            self.dbg.stdout(traceback.format_exc(), self.dbg.error)
+        finally:
+            self._local.context = previous
+            with self._lock:
+                if binding.supersede and self._latest.get(binding.supersede) is context:
+                    del self._latest[binding.supersede]
+            context._finish()
+
+    def _run_blocking(self, binding, context):
+        """
+        Runs on a worker. Afterwards, start the next waiting request for this handler.
+        """
+        while context:
+            self._run(binding, context)
+            skipped = []
+            with self._lock:
+                context = None
+                while binding.waiting:
+                    candidate = binding.waiting.popleft()
+                    if not candidate.is_cancelled():
+                        context = candidate
+                        break
+                    skipped.append(candidate)
+                if not context:
+                    binding.running -= 1
+
+            for candidate in skipped:
+                candidate._finish()
@@ -0,0 +1,207 @@
+"""
+Filters the applications in each category by architecture, release, backend
+and whether they are proprietary.
+
+When the curated index loads, each category gets a bitset per value of each
+facet (e.g. every application in "office" that is available for armhf), with
+one bit per application in the category's list. Filtering a listing is then
+an intersection of bitsets instead of checking every record, so changing a
+setting such as hide_proprietary takes effect straight away.
+
+Bitsets are Python integers. Like the search index, they are cached to disk
+for the revision of the curated index they were built from.
+"""
+
+import os
+import pickle
+import threading
+
+# Increment when the structure of the cache changes.
+CACHE_VERSION = 1
+
+# Facets, and the field of the record they are built from.
+FACETS = {
+    "arch": "arch",
+    "release": "releases",
+    "backend": "backend"
+}
+
+# Applications that don't list any architectures or releases are assumed to support all of them.
+ANY = None
+
+
+class CategoryFacets(object):
+    """
+    Bitsets for the applications in one category.
+    """
+    def __init__(self, count):
+        self.count = count
+        self.all = (1 << count) - 1
+        self.nonfree = 0
+        self.values = {facet: {} for facet in FACETS.keys()}
+
+    def add(self, position, record):
+        bit = 1 << position
+        if record.get("nonfree"):
+            self.nonfree |= bit
+
+        for facet, field in FACETS.items():
+            values = record.get(field)
+            if not values:
+                values = [ANY]
+            elif type(values) != list:
+                values = [values]
+            for value in values:
+                self.values[facet][value] = self.values[facet].get(value, 0) | bit
+
+    def get(self, facet, value):
+        """
+        Returns the bitset of applications with this value, including those that support any.
+        """
+        values = self.values[facet]
+        return values.get(value, 0) | values.get(ANY, 0)
+
+
+class FacetIndex(object):
+    """
+    Per category bitsets for the curated index.
+    """
+    def __init__(self):
+        self.revision = None
+        self.categories = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def add_category(self, category, records):
+        """
+        Params:
+            category    Name of the category.
+            records     List of records, in the same order as the index lists the category.
+        """
+        facets = CategoryFacets(len(records))
+        for position, record in enumerate(records):
+            facets.add(position, record)
+        self.categories[category] = facets
+
+    def get_values(self, facet):
+        """
+        Returns every value of a facet in the index, e.g. all architectures.
+        """
+        values = set()
+        for facets in self.categories.values():
+            values.update(facets.values[facet].keys())
+        values.discard(ANY)
+        return values
+
+    def filter(self, category, arch=None, release=None, backend=None, hide_nonfree=False):
+        """
+        Returns the positions (in the category's list) of the applications
+        that match the filter. Filters that are None are not applied.
+        """
+        key = (category, arch, release, backend, hide_nonfree)
+        with self._lock:
+            positions = self._results.get(key)
+        if positions is not None:
+            return positions
+
+        facets = self.categories.get(category)
+        if not facets:
+            return []
+
+        mask = facets.all
+        if arch is not None:
+            mask &= facets.get("arch", arch)
+        if release is not None:
+            mask &= facets.get("release", release)
+        if backend is not None:
+            mask &= facets.get("backend", backend)
+        if hide_nonfree:
+            mask &= ~facets.nonfree
+
+        positions = get_positions(mask)
+        with self._lock:
+            self._results[key] = positions
+        return positions
+
+    def save(self, path):
+        """
+        Write the bitsets to disk to skip building them next time.
+        """
+        categories = {}
+        for category, facets in self.categories.items():
+            categories[category] = (facets.count, facets.nonfree, facets.values)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((CACHE_VERSION, self.revision, categories), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path, revision):
+        """
+        Load bitsets previously saved to disk. Returns None if the cache is
+        missing or was built for another revision of the curated index.
+        """
+        try:
+            with open(path, "rb") as f:
+                version, cached_revision, categories = pickle.load(f)
+        except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+            return None
+
+        if version != CACHE_VERSION or cached_revision != revision:
+            return None
+
+        facet_index = FacetIndex()
+        facet_index.revision = revision
+        for category, (count, nonfree, values) in categories.items():
+            facets = CategoryFacets(count)
+            facets.nonfree = nonfree
+            facets.values = values
+            facet_index.categories[category] = facets
+        return facet_index
+
+
+def get_positions(mask):
+    """
+    Returns the positions of the bits set in a bitset, lowest first.
+    """
+    positions = []
+    binary = bin(mask)
+    length = len(binary)
+    position = binary.find("1", 2)
+    while position != -1:
+        positions.append(length - 1 - position)
+        position = binary.find("1", position + 1)
+    positions.reverse()
+    return positions
+
+
+def build_facet_index(index):
+    """
+    Returns a FacetIndex for every category in the curated index.
+    """
+    facet_index = FacetIndex()
+    facet_index.revision = index.stats.get("revision")
+    for category in index.get_categories():
+        records = [index.get_record(app_id) or {} for app_id in index.get_category(category)]
+        facet_index.add_category(category, records)
+    return facet_index
+
+
+def get_facet_index(index, cache_path):
+    """
+    Returns a FacetIndex for the curated index, loading it from the cache
+    if it is up-to-date, otherwise building and caching a new one.
+    """
+    revision = index.stats.get("revision")
+    facet_index = FacetIndex.load(cache_path, revision)
+    if facet_index:
+        return facet_index
+
+    facet_index = build_facet_index(index)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        facet_index.save(cache_path)
+    except OSError:
+        pass
+    return facet_index
@@ -0,0 +1,369 @@
+"""
+Runs the controller without the window, for managing software from scripts.
+
+Requests are JSON-RPC 2.0 objects, one per line, read from stdin (--headless)
+or from clients connected to a Unix socket (--listen PATH). The methods are
+the same requests the view sends, with the request's data as "params":
+
+    {"jsonrpc": "2.0", "id": 1, "method": "search", "params": {"query": "caja"}}
+
+When a request's handler has finished, the result lists the messages it sent
+(as the view would have received them) and any reply:
+
+    {"jsonrpc": "2.0", "id": 1, "result": {"messages": [{"function": "populate_search_results", "data": {...}}], "reply": null}}
+
+If the handler failed, the response is an error instead, e.g. for a missing parameter:
+
+    {"jsonrpc": "2.0", "id": 1, "error": {"code": -32602, "message": "Missing parameter: 'category'"}}
+
+Updates that are not a response to a request, such as the progress of the
+queue, are sent to every client as notifications:
+
+    {"jsonrpc": "2.0", "method": "update_queue_state", "params": {...}}
+
+Requests are processed concurrently, so responses may arrive in any order.
+"""
+
+import json
+import os
+import socketserver
+import stat
+import tempfile
+import sys
+import threading
+
+from . import controller as Controller
+from . import responses as Responses
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+class Session(object):
+    """
+    A client that requests are received from and responses are written to.
+    """
+    def __init__(self, write):
+        """
+        Params:
+            write       Function to write a line (str) to the client.
+        """
+        self._write = write
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def send(self, message):
+        line = json.dumps(message, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                self._write(line)
+            except (OSError, ValueError):
+                self.closed = True
+
+
+class _PendingRequest(object):
+    def __init__(self, session, rpc_id):
+        self.session = session
+        self.rpc_id = rpc_id
+        self.messages = []
+        self.reply = None
+
+
+class HeadlessApp(object):
+    """
+    Stands in for the SoftwareBoutique application, providing what the
+    controller needs from it, without a window.
+    """
+    def __init__(self, dbg, version):
+        self.dbg = dbg
+        self.version = version
+        self.icons = None
+        self.variables = {}
+        self.pending = {}
+        self.sessions = []
+        self._lock = threading.Lock()
+
+    def set_view_variable(self, variable, data):
+        self.variables[variable] = data
+
+    def send_data(self, function, data, coalesce=False):
+        """
+        Messages for a request are kept for its response. Others are sent to everyone.
+        """
+        if isinstance(data, Responses.SerializedData):
+            data = data.to_dict()
+
+        request_id = data.get("request_id") if type(data) == dict else None
+        with self._lock:
+            pending = self.pending.get(request_id)
+            if pending:
+                pending.messages.append({"function": function, "data": data})
+                return True
+            sessions = list(self.sessions)
+
+        for session in sessions:
+            session.send({"jsonrpc": "2.0", "method": function, "params": data})
+        return True
+
+    def reply(self, request_id, data):
+        with self._lock:
+            pending = self.pending.get(request_id)
+            if pending:
+                pending.reply = data
+
+
+class HeadlessServer(object):
+    """
+    Accepts JSON-RPC requests and passes them to the controller.
+    """
+    def __init__(self, dbg, version, args):
+        self.dbg = dbg
+        self.app = HeadlessApp(dbg, version)
+        self.controller = Controller.SoftwareBoutiqueController(self.app, args)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._socket_server = None
+        self._stopped = threading.Event()
+        self._active = set()
+
+        # Requests only available in headless mode.
+        self.methods = {
+            "get_settings": self._get_settings,
+            "queue_wait": self._queue_wait
+        }
+
+    def add_session(self, session):
+        with self.app._lock:
+            self.app.sessions.append(session)
+
+    def remove_session(self, session):
+        with self.app._lock:
+            session.closed = True
+            if session in self.app.sessions:
+                self.app.sessions.remove(session)
+
+    def handle_line(self, session, line):
+        """
+        Process a line (JSON-RPC request) from a client. The response is
+        written to the session once the request has finished.
+        """
+        line = line.strip()
+        if not line:
+            return
+
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return self._send_error(session, None, PARSE_ERROR, str(e))
+
+        if type(request) != dict or type(request.get("method")) != str:
+            return self._send_error(session, None, INVALID_REQUEST, "Expected an object with a 'method'")
+
+        rpc_id = request.get("id")
+        method = request["method"]
+        params = request.get("params") or {}
+        if type(params) != dict:
+            return self._send_error(session, rpc_id, INVALID_REQUEST, "Expected 'params' to be an object")
+
+        if method in self.methods:
+            thread = threading.Thread(target=self._run_method, args=(session, rpc_id, method, params), daemon=True)
+            with self._lock:
+                self._active.add(thread)
+            thread.start()
+            return
+
+        if method not in self.controller.dispatcher:
+            return self._send_error(session, rpc_id, METHOD_NOT_FOUND, "Unknown method: " + method)
+
+        with self._lock:
+            self._next_id += 1
+            request_id = "headless-{0}".format(self._next_id)
+
+        # Handlers expect the same data as sent by the view.
+        data = dict(params, request=method, request_id=request_id)
+        data.setdefault("element", "headless")
+
+        pending = _PendingRequest(session, rpc_id)
+        with self.app._lock:
+            self.app.pending[request_id] = pending
+
+        try:
+            context = self.controller.dispatcher.dispatch(method, data, supersede=False)
+        except Exception as e:
+            with self.app._lock:
+                del self.app.pending[request_id]
+            return self._send_error(session, rpc_id, INTERNAL_ERROR, str(e))
+
+        with self._lock:
+            self._active.add(context)
+        context.add_done_callback(lambda context: self._finish(context, request_id))
+
+    def _finish(self, context, request_id):
+        with self._lock:
+            self._active.discard(context)
+        with self.app._lock:
+            pending = self.app.pending.pop(request_id, None)
+        if not pending or pending.rpc_id is None:
+            return
+
+        # Handlers read their parameters from the request's data, so a missing one is a KeyError.
+        if isinstance(context.error, KeyError):
+            return self._send_error(pending.session, pending.rpc_id, INVALID_PARAMS, "Missing parameter: " + str(context.error))
+        if context.error:
+            return self._send_error(pending.session, pending.rpc_id, INTERNAL_ERROR, str(context.error))
+
+        pending.session.send({
+            "jsonrpc": "2.0",
+            "id": pending.rpc_id,
+            "result": {
+                "messages": pending.messages,
+                "reply": pending.reply
+            }
+        })
+
+    def _run_method(self, session, rpc_id, method, params):
+        try:
+            result = self.methods[method](params)
+            if rpc_id is not None:
+                session.send({"jsonrpc": "2.0", "id": rpc_id, "result": result})
+        except Exception as e:
+            self._send_error(session, rpc_id, INTERNAL_ERROR, str(e))
+        finally:
+            with self._lock:
+                self._active.discard(threading.current_thread())
+
+    def wait_for_requests(self):
+        """
+        Block until all requests received so far have finished.
+        """
+        while True:
+            with self._lock:
+                if not self._active:
+                    return
+                active = next(iter(self._active))
+            if isinstance(active, threading.Thread):
+                active.join()
+            else:
+                active.wait()
+
+    def _send_error(self, session, rpc_id, code, message):
+        session.send({
+            "jsonrpc": "2.0",
+            "id": rpc_id,
+            "error": {"code": code, "message": message}
+        })
+
+    def _get_settings(self, params):
+        """
+        Returns the settings that would have been passed to the view.
+        """
+        return self.app.variables.get("SETTINGS")
+
+    def _queue_wait(self, params):
+        """
+        Block until the queue has finished. Returns the items that are left (e.g. failures).
+        """
+        finished = self.controller.queue.wait(params.get("timeout"))
+        return {
+            "finished": finished,
+            "queue": self.controller.queue.get_list()
+        }
+
+    def run_stdio(self, stdin=None, stdout=None):
+        """
+        Read requests from stdin until it is closed, writing responses to stdout.
+        """
+        stdin = stdin or sys.stdin
+        stdout = stdout or sys.stdout
+
+        def _write(line):
+            stdout.write(line)
+            stdout.flush()
+
+        session = Session(_write)
+        self.add_session(session)
+        for line in stdin:
+            self.handle_line(session, line)
+
+        # Let requests and the queue finish before exiting.
+        self.wait_for_requests()
+        self.controller.queue.wait()
+        self.remove_session(session)
+
+    def listen(self, path):
+        """
+        Accept clients on a Unix socket in the background. Raises OSError if
+        the socket can't be created, or the path exists and is not a socket.
+        """
+        server = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                def _write(line):
+                    self.wfile.write(line.encode("utf-8"))
+                    self.wfile.flush()
+
+                session = Session(_write)
+                server.add_session(session)
+                try:
+                    for line in self.rfile:
+                        server.handle_line(session, line.decode("utf-8", "replace"))
+                finally:
+                    server.remove_session(session)
+
+        # Replace a socket left by a previous run, but nothing else.
+        try:
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise OSError("Not a socket: " + path)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        # Only the user may connect. The socket is created in a private folder and made
+        # private before it is moved into place, as the umask is shared by every thread.
+        folder = tempfile.mkdtemp(prefix=".boutique-", dir=os.path.dirname(os.path.abspath(path)))
+        private_path = os.path.join(folder, "socket")
+        socket_server = socketserver.ThreadingUnixStreamServer(private_path, _Handler, bind_and_activate=False)
+        try:
+            socket_server.server_bind()
+            os.chmod(private_path, 0o600)
+            os.rename(private_path, path)
+            socket_server.server_address = path
+            socket_server.server_activate()
+        except OSError:
+            socket_server.server_close()
+            raise
+        finally:
+            if os.path.lexists(private_path):
+                os.remove(private_path)
+            os.rmdir(folder)
+
+        self._socket_server = socket_server
+        self._socket_server.daemon_threads = True
+        thread = threading.Thread(target=self._socket_server.serve_forever, daemon=True)
+        thread.start()
+        self.dbg.stdout("Listening on: " + path, self.dbg.success, 1)
+
+    def wait(self):
+        """
+        Block while the socket server is running.
+        """
+        if self._socket_server:
+            self._stopped.wait()
+
+    def shutdown(self):
+        self._stopped.set()
+        if self._socket_server:
+            self._socket_server.shutdown()
+            self._socket_server.server_close()
+            try:
+                os.remove(self._socket_server.server_address)
+            except OSError:
+                pass
+        return self.controller.shutdown()
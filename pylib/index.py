@@ -0,0 +1,676 @@
+"""
+Reads the curated index of applications.
+
+The index is compiled from JSON (applications-en.json) which is loaded whole
+into memory. For faster start up, the JSON can be converted into a binary
+format which is memory mapped, so only the applications that are requested
+by the view are decoded.
+
+Expected JSON structure:
+    {
+        "stats": {"compiled": 1577836800, "revision": 123},
+        "distro": {"name": "...", "info_url": "...", "support_url": "..."},
+        "apps": {
+            "<app id>": {
+                "category": "accessories",
+                "name": "...",
+                ... (see SoftwareBoutiqueController._get_app_details)
+            }
+        }
+    }
+
+Each locale's JSON (applications-<locale>.json) contains complete records.
+When compiled, the records are split into a locale independent base
+(applications.bin) and a text shard per locale (text-<locale>.bin) which only
+has the TEXT_FIELDS. At run time, the base is combined with the shard for the
+user's locale, falling back to English for each field that is not translated.
+
+After a delta update (see delta.py), the applications that changed since the
+JSON was written are in a patch (applications-<locale>.patch.json), which is
+applied on top of the JSON or compiled index for that locale:
+    {
+        "format": 1,
+        "base_revision": 122,           Revision of the index the patch applies to.
+        "stats": {...},
+        "distro": {...},
+        "changed": {"<app id>": {<record>}},
+        "removed": ["<app id>"]
+    }
+
+Binary layout (little endian, offsets are from the start of the file):
+    Header          See _HEADER
+    Metadata        JSON containing the "stats" and "distro" objects.
+    App table       Entries of _ENTRY, sorted by app ID for binary searching.
+    Category table  Entries of _ENTRY, pointing to a list of app table positions.
+    Data            App IDs, category names and app records (JSON) referenced by the tables.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+
+try:
+    from . import records as Records
+except ImportError:
+    # Running as a script, e.g. python3 pylib/index.py
+    import records as Records
+
+MAGIC = b"SBIX"
+FORMAT_VERSION = 1
+
+# magic, format version, reserved, metadata offset, metadata length,
+# app count, app table offset, category count, category table offset
+_HEADER = struct.Struct("<4sHHIIIIII")
+
+# App table:        ID offset, ID length, record offset, record length
+# Category table:   name offset, name length, app list offset, app count
+_ENTRY = struct.Struct("<IIII")
+
+# Fields of a record that are translated, and stored in the locale's text shard.
+TEXT_FIELDS = ["name", "summary", "description"]
+
+# Locale of the index that is complete, and used when a translation is missing.
+FALLBACK_LOCALE = "en"
+
+PATCH_FORMAT = 1
+
+
+class IndexFormatError(Exception):
+    """
+    The index file is not valid or is not a supported version.
+    """
+    pass
+
+
+class JSONIndex(object):
+    """
+    Curated index that is loaded entirely from the JSON source. Records are
+    kept in memory as compact AppRecord objects.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "r") as f:
+            data = json.load(f)
+
+        try:
+            self.stats = data["stats"]
+            self.distro = data["distro"]
+            apps = data["apps"]
+        except KeyError as e:
+            raise IndexFormatError("Missing key: " + str(e))
+
+        strings = Records.StringTable()
+        self._apps = {}
+        self._categories = {}
+        for app_id in apps.keys():
+            record = Records.AppRecord.from_dict(apps[app_id], strings)
+            self._apps[app_id] = record
+            self._categories.setdefault(record.get("category", ""), []).append(app_id)
+
+    def __len__(self):
+        return len(self._apps)
+
+    def __contains__(self, app_id):
+        return app_id in self._apps
+
+    def get_app(self, app_id):
+        """
+        Returns the record for an application, or None if it does not exist.
+        """
+        record = self._apps.get(app_id)
+        return record.to_dict() if record else None
+
+    def get_record(self, app_id):
+        """
+        Returns the AppRecord for an application, or None. This is shared, so must not be changed.
+        """
+        return self._apps.get(app_id)
+
+    def get_app_ids(self):
+        return list(self._apps.keys())
+
+    def get_categories(self):
+        return list(self._categories.keys())
+
+    def get_category(self, category):
+        """
+        Returns a list of app IDs belonging to a category.
+        """
+        return list(self._categories.get(category, []))
+
+    def close(self):
+        pass
+
+
+class BinaryIndex(object):
+    """
+    Curated index that is memory mapped from the compiled binary format.
+    Records are only decoded when they are requested.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise IndexFormatError("File is empty: " + path)
+
+        try:
+            header = _HEADER.unpack_from(self._mm, 0)
+        except struct.error:
+            self.close()
+            raise IndexFormatError("File is truncated: " + path)
+
+        magic, version, reserved, meta_offset, meta_length, \
+            self._app_count, self._app_table, \
+            self._cat_count, self._cat_table = header
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise IndexFormatError("Unsupported index format: " + path)
+
+        try:
+            meta = json.loads(self._mm[meta_offset:meta_offset + meta_length])
+            self.stats = meta["stats"]
+            self.distro = meta["distro"]
+
+            # Category names are few, so keep their positions in memory.
+            self._categories = {}
+            for position in range(0, self._cat_count):
+                name_off, name_len, list_off, count = _ENTRY.unpack_from(self._mm, self._cat_table + (position * _ENTRY.size))
+                name = self._mm[name_off:name_off + name_len].decode("utf-8")
+                self._categories[name] = (list_off, count)
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return self._app_count
+
+    def __contains__(self, app_id):
+        return self._find(app_id.encode("utf-8")) is not None
+
+    def _get_entry(self, position):
+        return _ENTRY.unpack_from(self._mm, self._app_table + (position * _ENTRY.size))
+
+    def _get_id(self, position):
+        id_off, id_len, rec_off, rec_len = self._get_entry(position)
+        return self._mm[id_off:id_off + id_len]
+
+    def _find(self, raw_id):
+        """
+        Binary search the app table for an ID (in bytes). Returns the position.
+        """
+        low = 0
+        high = self._app_count - 1
+        while low <= high:
+            mid = (low + high) // 2
+            current = self._get_id(mid)
+            if current == raw_id:
+                return mid
+            elif current < raw_id:
+                low = mid + 1
+            else:
+                high = mid - 1
+        return None
+
+    def get_app(self, app_id):
+        """
+        Returns the record for an application, or None if it does not exist.
+        """
+        position = self._find(app_id.encode("utf-8"))
+        if position is None:
+            return None
+        id_off, id_len, rec_off, rec_len = self._get_entry(position)
+        return json.loads(self._mm[rec_off:rec_off + rec_len])
+
+    def get_record(self, app_id):
+        """
+        Same as get_app(), as records are decoded when requested.
+        """
+        return self.get_app(app_id)
+
+    def get_app_ids(self):
+        return [self._get_id(position).decode("utf-8") for position in range(0, self._app_count)]
+
+    def get_categories(self):
+        return list(self._categories.keys())
+
+    def get_category(self, category):
+        """
+        Returns a list of app IDs belonging to a category.
+        """
+        try:
+            list_off, count = self._categories[category]
+        except KeyError:
+            return []
+
+        positions = array("I")
+        positions.frombytes(self._mm[list_off:list_off + (count * positions.itemsize)])
+        return [self._get_id(position).decode("utf-8") for position in positions]
+
+    def close(self):
+        try:
+            self._mm.close()
+        except AttributeError:
+            pass
+        self._file.close()
+
+
+class LocalisedIndex(object):
+    """
+    Combines the locale independent records of an index with the text for
+    a locale. Fields missing a translation use the next shard in the list.
+    """
+    def __init__(self, base, shards, locale):
+        """
+        Params:
+            base        Index of records, possibly without TEXT_FIELDS.
+            shards      List of indexes providing TEXT_FIELDS, most preferred first.
+            locale      Locale of the first shard, e.g. de
+        """
+        self.base = base
+        self.shards = shards
+        self.locale = locale
+        self.path = base.path
+        self.stats = base.stats
+        self.distro = base.distro
+
+    def __len__(self):
+        return len(self.base)
+
+    def __contains__(self, app_id):
+        return app_id in self.base
+
+    def get_app(self, app_id):
+        """
+        Returns the record for an application, or None if it does not exist.
+        """
+        record = self.base.get_app(app_id)
+        if record is None:
+            return None
+
+        missing = list(TEXT_FIELDS)
+        for shard in self.shards:
+            text = shard.get_app(app_id) or {}
+            for field in list(missing):
+                if text.get(field):
+                    record[field] = text[field]
+                    missing.remove(field)
+            if not missing:
+                break
+
+        return record
+
+    def get_record(self, app_id):
+        """
+        Returns the locale independent fields of an application (e.g. for
+        filtering), without looking up its text.
+        """
+        return self.base.get_record(app_id)
+
+    def get_app_ids(self):
+        return self.base.get_app_ids()
+
+    def get_categories(self):
+        return self.base.get_categories()
+
+    def get_category(self, category):
+        return self.base.get_category(category)
+
+    def close(self):
+        self.base.close()
+        for shard in self.shards:
+            shard.close()
+
+
+class PatchedIndex(object):
+    """
+    An index with the changes from delta updates applied on top, so updating
+    only had to write the applications that changed.
+    """
+    def __init__(self, index, patch):
+        """
+        Params:
+            index       Index the patch applies to.
+            patch       Dictionary of the patch, see load_patch()
+        """
+        self.index = index
+        self.path = index.path
+        self.stats = patch["stats"]
+        self.distro = patch["distro"]
+
+        strings = Records.StringTable()
+        self._changed = {}
+        for app_id in patch["changed"].keys():
+            self._changed[app_id] = Records.AppRecord.from_dict(patch["changed"][app_id], strings)
+        self._removed = set(patch["removed"])
+        self._app_ids = None
+        self._categories = None
+        self._lock = threading.Lock()
+
+    def _get_categories(self):
+        """
+        Returns a dictionary of category => app IDs, worked out when first needed.
+        Applications keep their position in the index, and new ones are added at the end.
+        """
+        with self._lock:
+            if self._categories is not None:
+                return self._categories
+
+            categories = {}
+            for category in self.index.get_categories():
+                app_ids = []
+                for app_id in self.index.get_category(category):
+                    if app_id in self._removed:
+                        continue
+                    record = self._changed.get(app_id)
+                    if record and record.get("category", "") != category:
+                        continue
+                    app_ids.append(app_id)
+                categories[category] = app_ids
+
+            for app_id in self._changed.keys():
+                category = self._changed[app_id].get("category", "")
+                app_ids = categories.setdefault(category, [])
+                if app_id not in self.index or self.index.get_record(app_id).get("category", "") != category:
+                    app_ids.append(app_id)
+
+            self._categories = {category: app_ids for category, app_ids in categories.items() if app_ids}
+            self._app_ids = [app_id for app_id in self.index.get_app_ids() if app_id not in self._removed]
+            self._app_ids += [app_id for app_id in self._changed.keys() if app_id not in self.index]
+            return self._categories
+
+    def __len__(self):
+        return len(self.get_app_ids())
+
+    def __contains__(self, app_id):
+        if app_id in self._changed:
+            return True
+        return app_id not in self._removed and app_id in self.index
+
+    def get_app(self, app_id):
+        """
+        Returns the record for an application, or None if it does not exist.
+        """
+        if app_id in self._changed:
+            return self._changed[app_id].to_dict()
+        if app_id in self._removed:
+            return None
+        return self.index.get_app(app_id)
+
+    def get_record(self, app_id):
+        if app_id in self._changed:
+            return self._changed[app_id]
+        if app_id in self._removed:
+            return None
+        return self.index.get_record(app_id)
+
+    def get_app_ids(self):
+        self._get_categories()
+        return list(self._app_ids)
+
+    def get_categories(self):
+        return list(self._get_categories().keys())
+
+    def get_category(self, category):
+        return list(self._get_categories().get(category, []))
+
+    def close(self):
+        self.index.close()
+
+
+def get_patch_path(index_dir, locale):
+    return os.path.join(index_dir, "applications-{0}.patch.json".format(locale))
+
+
+def load_patch(path):
+    """
+    Returns a patch (dictionary) written by a delta update, or None if there
+    isn't one or it can't be read.
+    """
+    try:
+        with open(path, "r") as f:
+            patch = json.load(f)
+        if patch["format"] != PATCH_FORMAT:
+            return None
+        for key in ["base_revision", "stats", "distro", "changed", "removed"]:
+            patch[key]
+        return patch
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _open_patched(index, index_dir, locale):
+    """
+    Returns the index with its patch applied, if there is one for its revision.
+    """
+    patch = load_patch(get_patch_path(index_dir, locale))
+    if patch and patch["base_revision"] == index.stats.get("revision"):
+        return PatchedIndex(index, patch)
+    return index
+
+
+def split_index(data):
+    """
+    Splits an index (dictionary) into the locale independent base and
+    the translated text. Returns (base, text), both in the index structure.
+    """
+    base_apps = {}
+    text_apps = {}
+    for app_id in data["apps"].keys():
+        record = data["apps"][app_id]
+        base_apps[app_id] = {key: record[key] for key in record.keys() if key not in TEXT_FIELDS}
+        text_apps[app_id] = {key: record[key] for key in TEXT_FIELDS if key in record}
+
+    base = {"stats": data["stats"], "distro": data["distro"], "apps": base_apps}
+    text = {"stats": data["stats"], "distro": data["distro"], "apps": text_apps}
+    return base, text
+
+
+def get_locale_from_path(json_path):
+    """
+    Returns the locale of a JSON index from its file name, e.g. applications-pt_BR.json => pt_BR
+    """
+    name = os.path.splitext(os.path.basename(json_path))[0]
+    return name.split("-", 1)[1] if "-" in name else FALLBACK_LOCALE
+
+
+def compile_index(data, bin_path):
+    """
+    Converts the index (as a Python dictionary) into the binary format.
+    The file is written to a temporary path first so a running instance
+    never maps a partially written file.
+
+    Params:
+        data        Dictionary of the index, as loaded from JSON.
+        bin_path    Destination for the binary index.
+    """
+    apps = data["apps"]
+    meta = json.dumps({"stats": data["stats"], "distro": data["distro"]}, ensure_ascii=False).encode("utf-8")
+
+    app_ids = sorted(apps.keys(), key=lambda app_id: app_id.encode("utf-8"))
+    positions = {}
+    for position, app_id in enumerate(app_ids):
+        positions[app_id] = position
+
+    categories = {}
+    for app_id in apps.keys():
+        categories.setdefault(apps[app_id].get("category", ""), []).append(positions[app_id])
+
+    meta_offset = _HEADER.size
+    app_table = meta_offset + len(meta)
+    cat_table = app_table + (len(app_ids) * _ENTRY.size)
+    data_offset = cat_table + (len(categories) * _ENTRY.size)
+
+    blob = bytearray()
+    app_entries = []
+    cat_entries = []
+
+    def _append(raw):
+        offset = data_offset + len(blob)
+        blob.extend(raw)
+        return offset
+
+    for app_id in app_ids:
+        raw_id = app_id.encode("utf-8")
+        record = json.dumps(apps[app_id], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        app_entries.append(_ENTRY.pack(_append(raw_id), len(raw_id), _append(record), len(record)))
+
+    for category in categories.keys():
+        raw_name = category.encode("utf-8")
+        list_offset = _append(array("I", categories[category]).tobytes())
+        cat_entries.append(_ENTRY.pack(_append(raw_name), len(raw_name), list_offset, len(categories[category])))
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, 0, meta_offset, len(meta),
+                          len(app_ids), app_table, len(categories), cat_table)
+
+    tmp_path = bin_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(meta)
+        f.write(b"".join(app_entries))
+        f.write(b"".join(cat_entries))
+        f.write(blob)
+    os.replace(tmp_path, bin_path)
+
+
+def compile_index_file(json_path, bin_path=None):
+    """
+    Converts a JSON index on disk into the binary format.
+    By default, it is saved alongside the JSON file with a .bin extension.
+    """
+    if not bin_path:
+        bin_path = os.path.splitext(json_path)[0] + ".bin"
+
+    with open(json_path, "r") as f:
+        data = json.load(f)
+
+    compile_index(data, bin_path)
+    return bin_path
+
+
+def compile_index_files(json_paths, index_dir=None):
+    """
+    Compiles JSON indexes for each locale (applications-<locale>.json) into
+    a shared base (from the English index) and a text shard for each locale.
+    By default, they are saved alongside the first JSON file.
+
+    Returns a list of paths written.
+    """
+    if not index_dir:
+        index_dir = os.path.dirname(json_paths[0])
+
+    # The base must include all applications, so it comes from the English index.
+    json_paths = sorted(json_paths, key=lambda path: get_locale_from_path(path) != FALLBACK_LOCALE)
+    fallback_text = None
+    written = []
+
+    for json_path in json_paths:
+        with open(json_path, "r") as f:
+            data = json.load(f)
+        base, text = split_index(data)
+
+        if not written:
+            base_path = os.path.join(index_dir, "applications.bin")
+            compile_index(base, base_path)
+            written.append(base_path)
+            fallback_text = text["apps"]
+        else:
+            # Text that was not translated is found in the English shard instead.
+            for app_id in text["apps"].keys():
+                fallback = fallback_text.get(app_id, {})
+                record = text["apps"][app_id]
+                text["apps"][app_id] = {key: record[key] for key in record.keys() if record[key] != fallback.get(key)}
+
+        shard_path = os.path.join(index_dir, "text-{0}.bin".format(get_locale_from_path(json_path)))
+        compile_index(text, shard_path)
+        written.append(shard_path)
+
+    return written
+
+
+def _is_newer(path, other_path):
+    return os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(other_path)
+
+
+def _is_same_revision(index, other):
+    return index.stats.get("revision") == other.stats.get("revision")
+
+
+def open_index(index_dir, locales=None):
+    """
+    Opens the curated index from a directory. The binary format is preferred,
+    unless the JSON source is newer (e.g. recently rebuilt) or the binary
+    file is unreadable.
+
+    Params:
+        index_dir   Directory containing the index.
+        locales     List of locales in order of preference, e.g. ["pt_BR", "pt"]
+                    English is always used for anything not translated.
+
+    Translations for another revision than the base (e.g. after an update that
+    was interrupted) are not used, as they may belong to different records.
+    The compiled base needs the English text, otherwise the JSON is used.
+
+    Returns an index object, or None if there is no index.
+    """
+    locales = [locale for locale in (locales or []) if locale != FALLBACK_LOCALE] + [FALLBACK_LOCALE]
+    fallback_json = os.path.join(index_dir, "applications-{0}.json".format(FALLBACK_LOCALE))
+
+    # Compiled base and text shards
+    base_path = os.path.join(index_dir, "applications.bin")
+    if os.path.exists(base_path) and not _is_newer(fallback_json, base_path):
+        opened = []
+        try:
+            base = _open_patched(BinaryIndex(base_path), index_dir, FALLBACK_LOCALE)
+            opened.append(base)
+            shards = []
+            for locale in locales:
+                shard_path = os.path.join(index_dir, "text-{0}.bin".format(locale))
+                if not os.path.exists(shard_path):
+                    continue
+                shard = _open_patched(BinaryIndex(shard_path), index_dir, locale)
+                opened.append(shard)
+                if _is_same_revision(shard, base):
+                    shards.append((locale, shard))
+                elif locale == FALLBACK_LOCALE:
+                    # The base has no text without it, so use the JSON instead.
+                    raise IndexFormatError("English text is for another revision: " + shard_path)
+
+            # Names and summaries missing from other languages come from English.
+            if FALLBACK_LOCALE not in [locale for locale, shard in shards]:
+                raise IndexFormatError("No English text for the index: " + base_path)
+
+            for index in opened:
+                if index is not base and index not in [shard for locale, shard in shards]:
+                    index.close()
+            return LocalisedIndex(base, [shard for locale, shard in shards], shards[0][0] if shards else FALLBACK_LOCALE)
+        except (IndexFormatError, OSError, ValueError, KeyError, struct.error):
+            for index in opened:
+                index.close()
+
+    # JSON source (e.g. during development), which contains complete records.
+    available = []
+    for locale in locales:
+        json_path = os.path.join(index_dir, "applications-{0}.json".format(locale))
+        if os.path.exists(json_path):
+            available.append((locale, json_path))
+
+    if not available:
+        return None
+
+    indexes = [(locale, _open_patched(JSONIndex(json_path), index_dir, locale)) for locale, json_path in available]
+    base = indexes[-1][1] if available[-1][0] == FALLBACK_LOCALE else indexes[0][1]
+    indexes = [(locale, index) for locale, index in indexes if _is_same_revision(index, base)]
+    return LocalisedIndex(base, [index for locale, index in indexes], indexes[0][0])
+
+
+if __name__ == "__main__":
+    import sys
+    for path in compile_index_files(sys.argv[1:]):
+        print("Compiled: " + path)
@@ -0,0 +1,163 @@
+"""
+Caches which packages and snaps are installed on the system.
+
+The dpkg status file and snapd's directory of snaps are parsed once into a
+dictionary, so checking an application is a single lookup. They are only
+parsed again when their modification time or size changes. When a snapd
+client is given, installed snaps are listed by snapd instead of the directory.
+"""
+
+import os
+import threading
+
+from . import snapd as Snapd
+
+DPKG_STATUS = "/var/lib/dpkg/status"
+SNAPS_DIR = "/var/lib/snapd/snaps"
+
+
+def parse_dpkg_status(path):
+    """
+    Returns a dictionary of package name => version for installed packages.
+    Multi-arch packages (e.g. libfoo:i386) are listed under their name alone.
+    """
+    packages = {}
+    name = None
+    version = None
+    installed = False
+
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.startswith("Package: "):
+                name = line[9:].strip()
+            elif line.startswith("Status: "):
+                installed = line.rstrip().endswith(" installed")
+            elif line.startswith("Version: "):
+                version = line[9:].strip()
+            elif line == "\n":
+                if name and installed:
+                    packages[name] = version
+                name = None
+                version = None
+                installed = False
+
+    if name and installed:
+        packages[name] = version
+
+    return packages
+
+
+def _revision_key(revision):
+    # Revisions are numbers, except for local installs (e.g. x1)
+    return (0, int(revision)) if revision.isdigit() else (1, revision)
+
+
+def parse_snaps_dir(path):
+    """
+    Returns a dictionary of snap name => revision for installed snaps.
+    Files are in the format: <name>_<revision>.snap
+    """
+    snaps = {}
+    for filename in os.listdir(path):
+        if not filename.endswith(".snap") or "_" not in filename:
+            continue
+        name, revision = filename[:-5].rsplit("_", 1)
+        if name not in snaps or _revision_key(revision) > _revision_key(snaps[name]):
+            snaps[name] = revision
+    return snaps
+
+
+class _Source(object):
+    """
+    A file (or directory) that is parsed into a dictionary of name => version.
+    """
+    def __init__(self, path, parser):
+        self.path = path
+        self.parser = parser
+        self.stamp = None
+        self.data = {}
+
+    def refresh(self):
+        """
+        Parse the source again if it has changed. Returns a set of names that
+        were installed, removed or changed version.
+        """
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+
+        if stamp == self.stamp:
+            return set()
+
+        self.stamp = stamp
+        try:
+            data = self.parser(self.path) if stamp else {}
+        except OSError:
+            data = {}
+
+        old = self.data
+        self.data = data
+        changed = set(name for name in data.keys() if old.get(name) != data[name])
+        changed.update(name for name in old.keys() if name not in data)
+        return changed
+
+
+class InstalledState(object):
+    """
+    Answers whether packages are installed, for each backend.
+    """
+    def __init__(self, dpkg_status=DPKG_STATUS, snaps_dir=SNAPS_DIR, snapd=None):
+        """
+        Params:
+            dpkg_status     Path to dpkg's status file.
+            snaps_dir       Directory of installed snaps. Changes to it mean snaps have changed.
+            snapd           Optional SnapdClient() to list installed snaps and their versions.
+        """
+        self.generation = 0
+        self.snapd = snapd
+        self._sources = {
+            "apt": _Source(dpkg_status, parse_dpkg_status),
+            "snap": _Source(snaps_dir, self._parse_snaps)
+        }
+        self._lock = threading.Lock()
+
+    def _parse_snaps(self, path):
+        if self.snapd:
+            try:
+                return self.snapd.get_installed()
+            except Snapd.SnapdError:
+                pass
+        return parse_snaps_dir(path)
+
+    def refresh(self):
+        """
+        Check whether the system has changed since last time. This is cheap
+        when nothing has changed, as only the modification times are checked.
+        The first call parses the sources.
+
+        Returns a dictionary of backend => set of names that changed.
+        """
+        with self._lock:
+            changes = {}
+            for backend in self._sources.keys():
+                changed = self._sources[backend].refresh()
+                if changed:
+                    changes[backend] = changed
+
+            if changes:
+                self.generation += 1
+            return changes
+
+    def get_version(self, backend, name):
+        """
+        Returns the installed version (or snap revision), or None if not installed.
+        """
+        try:
+            return self._sources[backend].data.get(name)
+        except KeyError:
+            return None
+
+    def is_installed(self, backend, name):
+        return self.get_version(backend, name) is not None
@@ -44,7 +44,11 @@ LOCALES = {
     "queue_ready_state": _("Installation progress will appear here."),
     "queue_downloading": _("Downloading XXX (1 of 2)..."), # XXX, 1, 2
     "queue_installing": _("Installing XXX (1 of 2)..."), # XXX, 1, 2
+    "queue_removing": _("Removing XXX (1 of 2)..."), # XXX, 1, 2
+    "queue_reinstalling": _("Reinstalling XXX (1 of 2)..."), # XXX, 1, 2
     "queue_progress": _("1 MB of 2 MB"), # 1, 2
+    "queue_transfer_rate": _("1/s"), # 1 = e.g. 1.5 MB
+    "queue_time_remaining": _("1 remaining"), # 1 = e.g. 30 s
     "queue_success": _("Finished."),
     "queue_success_state": _("1 installed, 2 updated, 3 removed."), # 1, 2, 3
     "queue_error": _("There were problems completing your request."), # XXX
@@ -116,6 +120,10 @@ LOCALES = {
     "group_apt_title": _("Packages"),
     "group_apt_text": _("Available from the Ubuntu archives, or an external repository installed on your system."),
 
+    # Search
+    "search_placeholder": _("Search for applications"),
+    "search_no_results": _("No applications match your search."),
+
     # Application Details
     "no_screenshot": _("No screenshot available"),
     "version": _("Version"),
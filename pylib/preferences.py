@@ -1,15 +1,39 @@
 """
 Handles persistant data for the application.
+
+Changes are kept in memory and saved shortly afterwards on a background
+thread, so several changes in a row are written once. Call flush() before
+exiting to save any pending changes.
 """
 
 import os
 import json
+import threading
+
+# Seconds to wait after a change before saving, in case more changes follow.
+SAVE_DELAY = 1.0
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_preferences(dbg_obj, config_name, project_name):
+    """
+    Returns the shared Preferences() object for a configuration file, so
+    all parts of the application see the same data.
+    """
+    with _instances_lock:
+        key = (config_name, project_name)
+        if key not in _instances:
+            _instances[key] = Preferences(dbg_obj, config_name, project_name)
+        return _instances[key]
 
 
 class Preferences(object):
     def __init__(self, dbg_obj, config_name, project_name):
         """
         Prepares an object for the application to save/load persistance data.
+        Use get_preferences() instead to share the object.
 
         self.dbg_obj = Debug() object from main application.
         """
@@ -18,6 +42,10 @@ class Preferences(object):
         self.folder_cache = os.path.join(os.path.expanduser('~'), ".cache", project_name)
         self.file_path = os.path.join(self.folder_config, config_name + ".json")
         self.data = {}
+        self.dirty = False
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._timer = None
         self.load_from_disk()
 
         if project_name == "software-boutique":
@@ -40,60 +68,89 @@ class Preferences(object):
 
     def save_to_disk(self):
         """
-        Commit the data from memory to disk.
+        Commit the data from memory to disk. The file is replaced atomically,
+        so it is never left half written.
         Returns True or False depending on success/failure.
         """
-        # Create file if it doesn't exist.
-        if not os.path.exists(self.file_path):
-            open(self.file_path, "w").close()
+        # Only one save at a time, as they share the temporary file. The data
+        # is read once it's our turn, so the last save has the newest data.
+        with self._save_lock:
+            with self._lock:
+                contents = json.dumps(self.data, sort_keys=True, indent=4)
+                self.dirty = False
 
-        # Write new data to specified file.
-        if os.access(self.file_path, os.W_OK):
-            f = open(self.file_path, "w+")
-            f.write(json.dumps(self.data, sort_keys=True, indent=4))
-            f.close()
-            return True
-        else:
-            return False
+            temp_path = self.file_path + ".tmp"
+            try:
+                with open(temp_path, "w") as f:
+                    f.write(contents)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.file_path)
+                return True
+            except OSError as e:
+                self.dbg.stdout("Failed to save preferences: " + str(e), self.dbg.error, 1)
+                with self._lock:
+                    self.dirty = True
+                return False
+
+    def _schedule_save(self):
+        """
+        Save in the background after a short delay. Must be called with the lock held.
+        """
+        self.dirty = True
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(SAVE_DELAY, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """
+        Save any pending changes now.
+        """
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self.dirty:
+                return True
+        return self.save_to_disk()
 
     def write(self, key, value):
         """
-        Write new data to memory.
+        Write new data to memory. It is saved to disk shortly afterwards.
         """
-        try:
+        with self._lock:
+            if key in self.data and self.data[key] == value:
+                return
             self.data[key] = value
-            self.save_to_disk()
-        except:
-            self.dbg.stdout("Preferences write failed: '{0}' => '{1}'".format(key, value), self.dbg.error, 1)
+            self._schedule_save()
 
     def read(self, key, default_value=None):
         """
-        Read data from memory.
+        Read data from memory. If the key does not exist, the default value is returned.
         """
-        try:
-            value = self.data[key]
-            return value
-        except:
-            # Should it be non-existent, use the default value instead.
-            print("No preference found for '{0}', so writing '{1}' as default.".format(key, default_value))
-            self.write(key, default_value)
-            return default_value
+        with self._lock:
+            return self.data.get(key, default_value)
 
     def toggle(self, key):
         """
         Toggles a boolean stored key.
         """
-        state = self.read(key, False)
-        state = not state
-        self.write(key, state)
+        with self._lock:
+            state = self.read(key, False)
+            state = not state
+            self.write(key, state)
 
     def init_config(self):
         try:
             os.makedirs(self.folder_config)
         except FileExistsError:
             pass
-        self.data = {}
-        if self.save_to_disk():
+        with self._lock:
+            self.data = {}
+            self.dirty = True
+        if self.flush():
             self.dbg.stdout("Preferences file ready: " + self.file_path, self.dbg.success, 3)
             return True
         else:
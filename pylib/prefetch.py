@@ -0,0 +1,323 @@
+"""
+Downloads the artifacts (e.g. .deb files) for queued software ahead of time.
+
+While one batch in the queue is installing, the artifacts for the next items
+are already downloading into a shared cache. Downloads run a few at a time,
+share a bandwidth budget and resume from partially downloaded files.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 64 * 1024
+
+# Checksum prefixes, as printed by apt-get --print-uris
+HASHES = {
+    "SHA512": "sha512",
+    "SHA256": "sha256",
+    "SHA1": "sha1",
+    "MD5Sum": "md5"
+}
+
+
+class Artifact(object):
+    """
+    A file to download.
+    """
+    def __init__(self, url, filename, size=None, checksum=None):
+        """
+        Params:
+            url         Where to download from (http, https or file)
+            filename    Name to save in the cache, e.g. caja_1.20_amd64.deb
+            size        Expected size in bytes, if known.
+            checksum    Expected checksum, if known, e.g. "SHA256:abcdef..."
+        """
+        self.url = url
+        self.filename = os.path.basename(filename)
+        self.size = size
+        self.checksum = checksum
+
+
+class BandwidthLimiter(object):
+    """
+    Token bucket shared by all downloads. A rate of 0 is unlimited.
+    """
+    def __init__(self, rate=0):
+        self.rate = rate
+        self._tokens = 0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """
+        Block until 'amount' bytes are allowed to be transferred.
+        """
+        if self.rate <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + ((now - self._last) * self.rate))
+            self._last = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class PrefetchJob(object):
+    """
+    Tracks the progress of downloading a group of artifacts.
+    """
+    def __init__(self):
+        self.artifacts = []
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.errors = {}
+        self.cancelled = threading.Event()
+        self._remaining = 1
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def is_done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until all artifacts have downloaded (or failed). Returns False on timeout.
+        """
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _add_artifacts(self, artifacts):
+        with self._lock:
+            self.artifacts += artifacts
+            self.bytes_total += sum([artifact.size or 0 for artifact in artifacts])
+            self._remaining += len(artifacts)
+
+    def _add_bytes(self, amount):
+        with self._lock:
+            self.bytes_done += amount
+
+    def _finish(self, artifact=None, error=None):
+        with self._lock:
+            if error:
+                self.errors[artifact.filename if artifact else None] = error
+            self._remaining -= 1
+            if self._remaining <= 0:
+                self._done.set()
+
+
+class _Download(object):
+    """
+    A file being downloaded for one or more jobs. It is only cancelled when
+    every job that needs it has been cancelled.
+    """
+    def __init__(self, artifact):
+        self.artifact = artifact
+        self.future = None
+        self.bytes_done = 0
+        self._jobs = []
+        self._lock = threading.Lock()
+
+    def add_job(self, job):
+        with self._lock:
+            self._jobs.append(job)
+            bytes_done = self.bytes_done
+        job._add_bytes(bytes_done)
+
+    def add_bytes(self, amount):
+        with self._lock:
+            self.bytes_done += amount
+            jobs = list(self._jobs)
+        for job in jobs:
+            job._add_bytes(amount)
+
+    def reset_bytes(self):
+        """
+        The download started again from the beginning.
+        """
+        with self._lock:
+            amount = self.bytes_done
+            self.bytes_done = 0
+            jobs = list(self._jobs)
+        for job in jobs:
+            job._add_bytes(-amount)
+
+    def is_cancelled(self):
+        with self._lock:
+            return all(job.cancelled.is_set() for job in self._jobs)
+
+
+class Prefetcher(object):
+    """
+    Downloads artifacts into a cache directory with a limit on how many
+    downloads run at once.
+    """
+    def __init__(self, cache_dir, max_concurrent=2, bandwidth=0):
+        """
+        Params:
+            cache_dir       Directory to save artifacts, e.g. ~/.cache/software-boutique/archives
+            max_concurrent  Maximum number of simultaneous downloads.
+            bandwidth       Maximum bytes per second shared by all downloads. 0 is unlimited.
+        """
+        self.cache_dir = cache_dir
+        self.limiter = BandwidthLimiter(bandwidth)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_concurrent), thread_name_prefix="boutique-download")
+        self._resolver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="boutique-resolve")
+        self._active = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "partial"), exist_ok=True)
+
+    def get_path(self, artifact):
+        return os.path.join(self.cache_dir, artifact.filename)
+
+    def is_cached(self, artifact):
+        path = self.get_path(artifact)
+        if not os.path.exists(path):
+            return False
+        return artifact.size is None or os.path.getsize(path) == artifact.size
+
+    def fetch(self, artifacts):
+        """
+        Start downloading artifacts in the background. Those already in the
+        cache are skipped. Returns a PrefetchJob to track progress.
+
+        Params:
+            artifacts   List of Artifact() objects, or a function that returns
+                        them (e.g. if resolving them is slow, it runs in the background
+                        without taking a download slot)
+        """
+        job = PrefetchJob()
+
+        if callable(artifacts):
+            def _resolve():
+                try:
+                    self._start(job, artifacts())
+                    job._finish()
+                except Exception as e:
+                    job._finish(None, str(e))
+            self._resolver.submit(_resolve)
+        else:
+            self._start(job, artifacts)
+            job._finish()
+
+        return job
+
+    def _start(self, job, artifacts):
+        job._add_artifacts(artifacts)
+
+        for artifact in artifacts:
+            if self.is_cached(artifact):
+                job._add_bytes(artifact.size or 0)
+                job._finish(artifact)
+                continue
+
+            # Another job may already be downloading the same file.
+            with self._lock:
+                download = self._active.get(artifact.filename)
+                if not download:
+                    download = _Download(artifact)
+                    self._active[artifact.filename] = download
+                download.add_job(job)
+                if not download.future:
+                    download.future = self._pool.submit(self._download, download)
+                    download.future.add_done_callback(lambda f, name=artifact.filename: self._remove_active(name))
+
+            download.future.add_done_callback(lambda f, artifact=artifact: job._finish(artifact, self._get_error(f)))
+
+    def shutdown(self):
+        self._resolver.shutdown(wait=False)
+        self._pool.shutdown(wait=False)
+
+    def _remove_active(self, filename):
+        with self._lock:
+            self._active.pop(filename, None)
+
+    @staticmethod
+    def _get_error(future):
+        if future.cancelled():
+            return "Cancelled"
+        error = future.exception()
+        return str(error) if error else None
+
+    def _download(self, download):
+        """
+        Download an artifact, resuming a partial download if there is one.
+        """
+        artifact = download.artifact
+        path = self.get_path(artifact)
+        partial_path = os.path.join(self.cache_dir, "partial", artifact.filename)
+        if download.is_cancelled():
+            raise Exception("Cancelled")
+
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        if artifact.size is not None and offset >= artifact.size:
+            # Nothing left to resume, or it was already found to be wrong.
+            os.remove(partial_path)
+            offset = 0
+
+        request = urllib.request.Request(artifact.url)
+        if offset and artifact.url.startswith("http"):
+            request.add_header("Range", "bytes={0}-".format(offset))
+
+        try:
+            response = urllib.request.urlopen(request, timeout=30)
+        except urllib.error.HTTPError as e:
+            if e.code != 416 or not offset:
+                raise
+            # The partial file doesn't match what the server has, so start again.
+            os.remove(partial_path)
+            offset = 0
+            response = urllib.request.urlopen(urllib.request.Request(artifact.url), timeout=30)
+
+        with response:
+            # Server may not support resuming, and sends the whole file instead.
+            if offset and getattr(response, "status", 200) != 206:
+                offset = 0
+            download.add_bytes(offset)
+
+            with open(partial_path, "ab" if offset else "wb") as f:
+                while True:
+                    if download.is_cancelled():
+                        raise Exception("Cancelled")
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.limiter.consume(len(chunk))
+                    f.write(chunk)
+                    download.add_bytes(len(chunk))
+
+        if artifact.size is not None and os.path.getsize(partial_path) != artifact.size:
+            os.remove(partial_path)
+            download.reset_bytes()
+            raise Exception("Size mismatch: " + artifact.filename)
+
+        if not self._verify(partial_path, artifact.checksum):
+            os.remove(partial_path)
+            raise Exception("Checksum mismatch: " + artifact.filename)
+
+        os.replace(partial_path, path)
+
+    @staticmethod
+    def _verify(path, checksum):
+        if not checksum or ":" not in checksum:
+            return True
+
+        name, expected = checksum.split(":", 1)
+        if name not in HASHES:
+            return True
+
+        digest = hashlib.new(HASHES[name])
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest() == expected.lower()
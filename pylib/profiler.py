@@ -0,0 +1,157 @@
+"""
+Records how long each phase of start up and each request from the view takes.
+
+Enabled with --profile. Spans are written as a Chrome trace (open in
+chrome://tracing or https://ui.perfetto.dev) alongside a plain text summary.
+When disabled, recording a span costs a single attribute check.
+"""
+
+import json
+import os
+import threading
+import time
+
+from . import common as Common
+
+
+class Span(object):
+    """
+    A timed section of code. Use as a context manager, or call end().
+    """
+    def __init__(self, profiler, name, category, args):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+        self.thread_id = threading.get_ident()
+        self.start = profiler.clock()
+
+    def end(self):
+        self.profiler._add(self, self.profiler.clock())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end()
+
+
+class _DisabledSpan(object):
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_DISABLED_SPAN = _DisabledSpan()
+
+
+@Common.singleton
+class Profiler(object):
+    """
+    Collects spans from any thread. Only one instance exists, so modules can
+    use Profiler() without passing it around.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.clock = time.perf_counter
+        self.origin = self.clock()
+        self.events = []
+        self.thread_names = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def span(self, name, category="startup", **args):
+        """
+        Start timing a section of code.
+
+        Params:
+            name        Description, e.g. "Load index"
+            category    "startup" or "request"
+            args        Extra details to show in the trace.
+        """
+        if not self.enabled:
+            return _DISABLED_SPAN
+        return Span(self, name, category, args)
+
+    def _add(self, span, end):
+        with self._lock:
+            self.events.append((span.name, span.category, span.thread_id, span.start, end, span.args))
+            if span.thread_id not in self.thread_names:
+                self.thread_names[span.thread_id] = threading.current_thread().name
+
+    def get_trace(self):
+        """
+        Returns the spans in the Chrome trace event format (times in microseconds).
+        """
+        pid = os.getpid()
+        events = []
+        with self._lock:
+            for name, category, thread_id, start, end, args in self.events:
+                events.append({
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": round((start - self.origin) * 1000000, 1),
+                    "dur": round((end - start) * 1000000, 1),
+                    "pid": pid,
+                    "tid": thread_id,
+                    "args": args
+                })
+            for thread_id in self.thread_names.keys():
+                events.append({
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": thread_id,
+                    "args": {"name": self.thread_names[thread_id]}
+                })
+
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms"
+        }
+
+    def get_summary(self):
+        """
+        Returns a table of spans grouped by name, slowest total first.
+        """
+        totals = {}
+        with self._lock:
+            for name, category, thread_id, start, end, args in self.events:
+                key = (category, name)
+                duration = (end - start) * 1000
+                count, total, longest = totals.get(key, (0, 0, 0))
+                totals[key] = (count + 1, total + duration, max(longest, duration))
+
+        rows = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+        width = max([len(name) for (category, name) in totals.keys()] + [4])
+
+        lines = ["{0:<{w}}  {1:<8}  {2:>5}  {3:>10}  {4:>10}  {5:>10}".format(
+            "Span", "Category", "Count", "Total ms", "Mean ms", "Max ms", w=width)]
+        lines.append("-" * len(lines[0]))
+        for (category, name), (count, total, longest) in rows:
+            lines.append("{0:<{w}}  {1:<8}  {2:>5}  {3:>10.2f}  {4:>10.2f}  {5:>10.2f}".format(
+                name, category, count, total, total / count, longest, w=width))
+        return "\n".join(lines)
+
+    def write(self, path):
+        """
+        Save the trace to 'path' and the summary next to it (.txt).
+        Returns the path to the summary.
+        """
+        summary_path = os.path.splitext(path)[0] + ".txt"
+
+        with open(path, "w") as f:
+            json.dump(self.get_trace(), f)
+
+        with open(summary_path, "w") as f:
+            f.write(self.get_summary() + "\n")
+
+        return summary_path
@@ -0,0 +1,137 @@
+"""
+Rate limits progress updates for the queue state shown in the view.
+
+Backends may report progress thousands of times per second. Only the latest
+state is kept and it is sent at most 'rate' times per second, although the
+final state is always delivered. For transfers, a smoothed rate and estimated
+time remaining are calculated from the updates in between.
+"""
+
+import threading
+import time
+
+# Updates sent to the view per second.
+DEFAULT_RATE = 10
+
+# Weight of the newest sample for the exponential moving average of the transfer rate.
+SMOOTHING = 0.3
+
+# Minimum time between samples for the transfer rate, in seconds.
+SAMPLE_INTERVAL = 0.25
+
+
+class ProgressReporter(object):
+    """
+    Throttles progress updates, keeping only the latest.
+    """
+    def __init__(self, callback, rate=DEFAULT_RATE, clock=time.monotonic):
+        """
+        Params:
+            callback    Function to call with a dictionary of the state, see update().
+            rate        Maximum number of updates per second.
+            clock       Function returning the current time in seconds.
+        """
+        self.callback = callback
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._latest = None
+        self._last_sent = None
+        self._timer = None
+
+        # Transfer rate
+        self._transfer = None
+        self._sample_time = None
+        self._sample_value = None
+        self._rate = None
+
+    def update(self, state, action_text, details_text, value, value_end, measure=False):
+        """
+        Report the current state. Parameters are the same as the view's update_queue_state(),
+        see SoftwareBoutiqueController._update_queue_state()
+
+        When 'measure' is True, value/value_end are treated as a transfer (e.g. bytes) and
+        "rate" (units per second) and "eta" (seconds) are included.
+        """
+        now = self.clock()
+        data = {
+            "state": state,
+            "action_text": action_text,
+            "details_text": details_text,
+            "value": value,
+            "value_end": value_end,
+            "rate": None,
+            "eta": None
+        }
+
+        with self._lock:
+            if measure:
+                self._measure(now, action_text, value, value_end)
+                data["rate"] = self._rate
+                if self._rate and value_end and value_end > value:
+                    data["eta"] = int((value_end - value) / self._rate)
+            else:
+                self._transfer = None
+
+            self._latest = data
+
+            # Anything other than "busy" is final and must not be dropped.
+            final = state != "busy"
+            if final or self._last_sent is None or now - self._last_sent >= self.interval:
+                self._cancel_timer()
+                return self._send(now)
+
+            if not self._timer:
+                self._timer = threading.Timer(self.interval - (now - self._last_sent), self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """
+        Send the latest state now, if it has not been sent.
+        """
+        with self._lock:
+            self._timer = None
+            self._send(self.clock())
+
+    def _send(self, now):
+        """
+        Must be called with the lock held.
+        """
+        data = self._latest
+        if not data:
+            return
+        self._latest = None
+        self._last_sent = now
+        self.callback(data)
+
+    def _cancel_timer(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def _measure(self, now, action_text, value, value_end):
+        """
+        Update the exponential moving average of the transfer rate.
+        Restarts when a new transfer begins.
+        """
+        transfer = (action_text, value_end)
+        if transfer != self._transfer or self._sample_value is None or value < self._sample_value:
+            self._transfer = transfer
+            self._sample_time = now
+            self._sample_value = value
+            self._rate = None
+            return
+
+        elapsed = now - self._sample_time
+        if elapsed < SAMPLE_INTERVAL:
+            return
+
+        rate = (value - self._sample_value) / elapsed
+        if self._rate is None:
+            self._rate = rate
+        else:
+            self._rate = (SMOOTHING * rate) + ((1 - SMOOTHING) * self._rate)
+
+        self._sample_time = now
+        self._sample_value = value
@@ -0,0 +1,170 @@
+"""
+Compact in-memory records for applications in the curated index.
+
+Loaded from JSON, each application is a dictionary with its own copies of
+strings that repeat throughout the catalogue, such as the backend, licence,
+repository and developer, and lists like ["i386", "amd64", "armhf"]. An
+AppRecord keeps its fields in slots instead of a dictionary, shares one copy
+of each repeated value between all records of an index, and stores the
+architectures as a bitmask.
+
+Records are converted back to dictionaries when requested, so the rest of the
+program sees the same structure as the JSON.
+"""
+
+import threading
+
+# Fields of a record, in the order they are converted back to a dictionary.
+FIELDS = ["category", "name", "summary", "description", "backend", "icon",
+          "nonfree", "free_license", "arch", "releases", "developer",
+          "developer_url", "website_url", "support_url", "apt_source",
+          "apt_packages", "snap_name", "launch_cmd", "tags", "screenshots",
+          "version"]
+
+# Text that repeats between applications, so only one copy is kept.
+SHARED_FIELDS = ["category", "backend", "free_license", "apt_source", "developer", "developer_url"]
+
+# Lists, kept as tuples. Those in SHARED_LIST_FIELDS also share their items and the tuple itself.
+LIST_FIELDS = ["releases", "apt_packages", "tags", "screenshots"]
+SHARED_LIST_FIELDS = ["releases", "tags"]
+
+# Bits for architectures known in advance. Others are given the next free bit when first seen.
+ARCHITECTURES = ["i386", "amd64", "armhf", "arm64", "ppc64el", "s390x", "powerpc", "riscv64"]
+
+_arch_bits = {}
+_arch_names = []
+_arch_lock = threading.Lock()
+
+
+def get_arch_bit(name):
+    """
+    Returns the bit for an architecture, e.g. "amd64" => 2
+    """
+    bit = _arch_bits.get(name)
+    if bit is not None:
+        return bit
+
+    with _arch_lock:
+        if name not in _arch_bits:
+            _arch_bits[name] = 1 << len(_arch_names)
+            _arch_names.append(name)
+        return _arch_bits[name]
+
+
+def get_arch_mask(names):
+    """
+    Returns a bitmask of a list of architectures, e.g. ["i386", "amd64"] => 3
+    """
+    mask = 0
+    for name in names or []:
+        mask |= get_arch_bit(name)
+    return mask
+
+
+def get_arch_names(mask):
+    """
+    Returns the list of architectures in a bitmask, in the order of their bits.
+    """
+    names = []
+    position = 0
+    while mask:
+        if mask & 1:
+            names.append(_arch_names[position])
+        mask >>= 1
+        position += 1
+    return names
+
+
+for _name in ARCHITECTURES:
+    get_arch_bit(_name)
+
+
+class StringTable(object):
+    """
+    Keeps one copy of each repeated value (strings or tuples) for an index.
+    """
+    def __init__(self):
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, value):
+        if value is None:
+            return None
+        return self._values.setdefault(value, value)
+
+
+class AppRecord(object):
+    """
+    An application from the curated index. Fields that were not present in
+    the JSON are left unset, so they are also absent from to_dict().
+    """
+    __slots__ = [field for field in FIELDS if field != "arch"] + ["arch_mask", "extra"]
+
+    @classmethod
+    def from_dict(cls, data, strings):
+        """
+        Params:
+            data        Record as loaded from JSON.
+            strings     StringTable() shared by all the records of an index.
+        """
+        record = cls()
+        extra = None
+        for key, value in data.items():
+            if key == "arch":
+                record.arch_mask = get_arch_mask(value)
+            elif key in SHARED_LIST_FIELDS and type(value) == list:
+                setattr(record, key, strings.get(tuple(strings.get(item) for item in value)))
+            elif key in LIST_FIELDS and type(value) == list:
+                setattr(record, key, tuple(value))
+            elif key in SHARED_FIELDS:
+                setattr(record, key, strings.get(value))
+            elif key in FIELDS:
+                setattr(record, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+
+        if extra:
+            record.extra = extra
+        return record
+
+    def get(self, key, default=None):
+        """
+        Returns a field, like dict.get() on the record from the JSON.
+        """
+        if key == "arch":
+            try:
+                return get_arch_names(self.arch_mask)
+            except AttributeError:
+                return default
+        if key not in FIELDS:
+            extra = getattr(self, "extra", None)
+            return extra.get(key, default) if extra else default
+        value = getattr(self, key, default)
+        if type(value) == tuple:
+            return list(value)
+        return value
+
+    def to_dict(self):
+        """
+        Returns the record as a new dictionary, like it was in the JSON.
+        """
+        data = {}
+        for field in FIELDS:
+            if field == "arch":
+                if hasattr(self, "arch_mask"):
+                    data["arch"] = get_arch_names(self.arch_mask)
+                continue
+            try:
+                value = getattr(self, field)
+            except AttributeError:
+                continue
+            data[field] = list(value) if type(value) == tuple else value
+
+        extra = getattr(self, "extra", None)
+        if extra:
+            data.update(extra)
+        return data
@@ -0,0 +1,107 @@
+"""
+Keeps responses for the view that were already converted to JSON.
+
+Lists and details pages are requested again whenever the user goes back and
+forth between them. Responses are stored as the final JSON string, so a
+repeated request is sent without building or serialising it again.
+
+Keys include everything the response depends on (e.g. the index revision and
+which software is installed), so a change to any of them means a different
+key and the old response is never used again. The least recently used
+responses are removed once the total size reaches a limit.
+"""
+
+import collections
+import json
+import threading
+
+# Total length of the JSON strings kept, in characters.
+MAX_CACHE_SIZE = 8 * 1024 * 1024
+
+# Responses larger than this are not kept, so one can't displace the rest of the cache.
+MAX_RESPONSE_SIZE = 1024 * 1024
+
+
+class SerializedData(str):
+    """
+    A JSON object that was already serialised, to be sent to the view as it is.
+    """
+    def with_field(self, key, value):
+        """
+        Returns a copy with a field inserted, e.g. the ID of the request being
+        responded to, without serialising the whole object again.
+        """
+        field = "{0}: {1}".format(json.dumps(key), json.dumps(value, ensure_ascii=False))
+        if self == "{}":
+            return SerializedData("{" + field + "}")
+        return SerializedData("{" + field + ", " + self[1:])
+
+    def to_dict(self):
+        return json.loads(self)
+
+
+def serialize(data):
+    """
+    Convert data for the view to JSON, the same way as when it is sent.
+    """
+    return SerializedData(json.dumps(data, ensure_ascii=False))
+
+
+class ResponseCache(object):
+    """
+    Least recently used cache of serialised responses, limited by size.
+    """
+    def __init__(self, max_size=MAX_CACHE_SIZE):
+        """
+        Params:
+            max_size        Total length of the responses to keep.
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._responses = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._responses)
+
+    def get(self, key):
+        """
+        Returns the response (SerializedData) for a key, or None if it isn't cached.
+        """
+        with self._lock:
+            response = self._responses.get(key)
+            if response is None:
+                self.misses += 1
+                return None
+            self._responses.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key, data):
+        """
+        Serialise and store a response. Returns the SerializedData to send.
+        """
+        response = serialize(data)
+        if len(response) > MAX_RESPONSE_SIZE:
+            return response
+
+        with self._lock:
+            previous = self._responses.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+
+            self._responses[key] = response
+            self.size += len(response)
+
+            while self.size > self.max_size:
+                old_key, old_response = self._responses.popitem(last=False)
+                self.size -= len(old_response)
+
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._responses.clear()
+            self.size = 0
@@ -0,0 +1,269 @@
+"""
+Full-text search over the curated index.
+
+An inverted index maps each term to the applications that contain it, with
+a score depending on which field the term appeared in. Query terms are matched
+exactly, by prefix (for search-as-you-type) and by trigrams, which finds terms
+that contain the query (e.g. "office" in "libreoffice") or are misspelt.
+
+The index is built once after the curated index loads and is cached to disk,
+so subsequent launches only need to unpickle it.
+"""
+
+import bisect
+import heapq
+import os
+import pickle
+import re
+
+# Increment when the structure of the cache changes.
+CACHE_VERSION = 2
+
+# Score for each field the term appears in.
+FIELD_WEIGHTS = {
+    "name": 10,
+    "tags": 6,
+    "packages": 4,
+    "summary": 3,
+    "description": 1
+}
+
+# Fields that are matched by prefix and trigram as well as exact terms. Long
+# text (the description) is only matched exactly, as expanding it would mostly
+# add noise and slow down each keystroke.
+EXPANDED_FIELDS = ["name", "tags", "packages", "summary"]
+
+# Multiplier for terms that were not an exact match of the query.
+PREFIX_WEIGHT = 0.6
+TRIGRAM_WEIGHT = 0.3
+
+# Avoid expanding very short prefixes (e.g. "a") to most of the vocabulary.
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_TERMS = 200
+
+# Proportion of trigrams a term must share with the query to be considered.
+MIN_TRIGRAM_SIMILARITY = 0.5
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenise(text):
+    """
+    Returns a list of lowercase terms from a string.
+    """
+    if not text:
+        return []
+    return _WORD_PATTERN.findall(text.lower())
+
+
+def get_trigrams(term):
+    """
+    Returns the set of trigrams for a term, padded so the start and end of
+    the term are also matched.
+    """
+    padded = " " + term + " "
+    return set(padded[i:i + 3] for i in range(0, len(padded) - 2))
+
+
+def get_searchable_fields(record):
+    """
+    Returns the text of an index record for each field in FIELD_WEIGHTS.
+    """
+    packages = list(record.get("apt_packages") or [])
+    if record.get("snap_name"):
+        packages.append(record.get("snap_name"))
+
+    return {
+        "name": record.get("name"),
+        "tags": " ".join(record.get("tags") or []),
+        "packages": " ".join(packages),
+        "summary": record.get("summary"),
+        "description": record.get("description")
+    }
+
+
+class SearchIndex(object):
+    """
+    Inverted index of terms to documents (app IDs).
+    """
+    def __init__(self, trigrams=True):
+        """
+        Params:
+            trigrams    Also match terms that contain the query or are misspelt.
+                        Large vocabularies (e.g. every package from apt) may turn this off,
+                        as a common trigram can match most of the terms.
+        """
+        self.revision = None
+        self.trigrams = trigrams
+        self._docs = []             # Position => app ID
+        self._postings = {}         # Term => {doc position: score}
+        self._expanded = {}         # Same as above, for EXPANDED_FIELDS only
+        self._terms = []            # Sorted list of expandable terms, for prefix matching
+        self._trigrams = {}         # Trigram => set of terms
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, doc_id, fields):
+        """
+        Add a document to the index. finalise() must be called once all
+        documents have been added.
+
+        Params:
+            doc_id      ID to return when this document matches, e.g. app ID.
+            fields      Dictionary of field name => text, see FIELD_WEIGHTS.
+        """
+        position = len(self._docs)
+        self._docs.append(doc_id)
+
+        for field in fields.keys():
+            weight = FIELD_WEIGHTS.get(field, 1)
+            for term in set(tokenise(fields[field])):
+                postings = self._postings.setdefault(term, {})
+                postings[position] = postings.get(position, 0) + weight
+                if field in EXPANDED_FIELDS:
+                    postings = self._expanded.setdefault(term, {})
+                    postings[position] = postings.get(position, 0) + weight
+
+    def finalise(self):
+        """
+        Builds the structures used for prefix and trigram matching.
+        """
+        self._terms = sorted(self._expanded.keys())
+        self._trigrams = {}
+        if not self.trigrams:
+            return
+        for term in self._terms:
+            for trigram in get_trigrams(term):
+                self._trigrams.setdefault(trigram, set()).add(term)
+
+    def _expand_term(self, token):
+        """
+        Returns a dictionary of expandable terms that match a token of the
+        query (excluding the exact term), and the multiplier for their score.
+        """
+        matches = {}
+
+        if len(token) >= MIN_PREFIX_LENGTH:
+            start = bisect.bisect_left(self._terms, token)
+            for term in self._terms[start:start + MAX_PREFIX_TERMS]:
+                if not term.startswith(token):
+                    break
+                if term != token:
+                    matches[term] = PREFIX_WEIGHT
+
+        if self.trigrams and len(token) >= 3:
+            query_trigrams = get_trigrams(token)
+            counts = {}
+            for trigram in query_trigrams:
+                for term in self._trigrams.get(trigram, ()):
+                    counts[term] = counts.get(term, 0) + 1
+
+            for term in counts.keys():
+                if term in matches or term == token:
+                    continue
+                similarity = counts[term] / len(query_trigrams)
+                if similarity >= MIN_TRIGRAM_SIMILARITY:
+                    matches[term] = TRIGRAM_WEIGHT * similarity
+
+        return matches
+
+    def search(self, query, limit=50):
+        """
+        Returns a list of (doc_id, score) tuples that match every word in the
+        query, with the highest score first.
+        """
+        tokens = tokenise(query)
+        if not tokens:
+            return []
+
+        results = None
+        for token in set(tokens):
+            scores = dict(self._postings.get(token, {}))
+            matches = self._expand_term(token)
+            for term in matches.keys():
+                multiplier = matches[term]
+                for position, score in self._expanded[term].items():
+                    score = score * multiplier
+                    if score > scores.get(position, 0):
+                        scores[position] = score
+
+            if results is None:
+                results = scores
+            else:
+                results = {position: results[position] + scores[position] for position in results.keys() if position in scores}
+
+            if not results:
+                return []
+
+        ranked = heapq.nsmallest(limit, results.items(), key=lambda item: (-item[1], item[0]))
+        return [(self._docs[position], score) for position, score in ranked]
+
+    def save(self, path):
+        """
+        Write the index to disk to skip building it next time.
+        """
+        tmp_path = path + ".tmp"
+        key = (CACHE_VERSION, self.revision, self.trigrams)
+        with open(tmp_path, "wb") as f:
+            pickle.dump((key, self._docs, self._postings, self._expanded), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path, revision, trigrams=True):
+        """
+        Load an index previously saved to disk. Returns None if the cache is
+        missing, unreadable or was built for another revision of the curated
+        index or version of this module.
+        """
+        try:
+            with open(path, "rb") as f:
+                cached = pickle.load(f)
+            cached_key, docs, postings, expanded = cached
+        except Exception:
+            # Any damaged or outdated cache is rebuilt.
+            return None
+
+        if cached_key != (CACHE_VERSION, revision, trigrams):
+            return None
+
+        search_index = SearchIndex(trigrams)
+        search_index.revision = revision
+        search_index._docs = docs
+        search_index._postings = postings
+        search_index._expanded = expanded
+        search_index.finalise()
+        return search_index
+
+
+def build_search_index(index):
+    """
+    Returns a SearchIndex for every application in the curated index.
+    """
+    search_index = SearchIndex()
+    search_index.revision = index.stats.get("revision")
+    for app_id in index.get_app_ids():
+        record = index.get_app(app_id)
+        if record:
+            search_index.add(app_id, get_searchable_fields(record))
+    search_index.finalise()
+    return search_index
+
+
+def get_search_index(index, cache_path):
+    """
+    Returns a SearchIndex for the curated index, loading it from the cache
+    if it is up-to-date, otherwise building and caching a new one.
+    """
+    revision = index.stats.get("revision")
+    search_index = SearchIndex.load(cache_path, revision)
+    if search_index:
+        return search_index
+
+    search_index = build_search_index(index)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        search_index.save(cache_path)
+    except OSError:
+        pass
+    return search_index
@@ -0,0 +1,315 @@
+"""
+Client for snapd's REST API, which is served on a local Unix socket.
+
+Requests reuse a small pool of keep-alive connections instead of running the
+snap command for each application. Information for many snaps is requested at
+once, and changes (e.g. installing) are started asynchronously and polled for
+their progress.
+
+API reference: https://snapcraft.io/docs/snapd-api
+"""
+
+import http.client
+import json
+import queue
+import re
+import socket
+import threading
+import time
+import urllib.parse
+
+SNAPD_SOCKET = "/run/snapd.socket"
+
+# Connections kept open for reuse.
+POOL_SIZE = 2
+
+# Snap names per request when asking about many snaps.
+BATCH_SIZE = 50
+
+# Seconds between checking the progress of a change.
+POLL_INTERVAL = 0.25
+
+TIMEOUT = 30
+
+# Seconds to wait when checking whether snapd is running.
+PROBE_TIMEOUT = 2
+
+# Errors meaning an idle connection was closed by snapd before it read the request.
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+# Snap names in task summaries, e.g. Download snap "caja" (12) from channel "stable"
+_SNAP_NAME_PATTERN = re.compile(r'"([^"]+)"')
+
+
+class SnapdError(Exception):
+    """
+    snapd could not be reached, or it returned an error.
+    """
+    def __init__(self, message, kind=None, status=None):
+        Exception.__init__(self, message)
+        self.kind = kind            # e.g. "snap-not-found", see snapd's error kinds.
+        self.status = status        # HTTP status code
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection to a Unix socket instead of a TCP port.
+    """
+    def __init__(self, socket_path, timeout):
+        http.client.HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class SnapdClient(object):
+    """
+    Sends requests to snapd. Can be shared between threads.
+    """
+    def __init__(self, socket_path=SNAPD_SOCKET, pool_size=POOL_SIZE, timeout=TIMEOUT):
+        """
+        Params:
+            socket_path     Path to snapd's socket, or a stand-in server for testing.
+            pool_size       Number of idle connections to keep open.
+            timeout         Seconds to wait for snapd to respond.
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    def _get_connection(self, reuse=True):
+        """
+        Returns (connection, whether it was used before).
+        """
+        if reuse:
+            try:
+                return self._idle.get_nowait(), True
+            except queue.Empty:
+                pass
+        return _UnixHTTPConnection(self.socket_path, self.timeout), False
+
+    def _put_connection(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method, path, query=None, body=None, interactive=False):
+        """
+        Send a request and return the response's "result" for synchronous
+        requests, or the change ID for asynchronous ones.
+
+        Params: see send()
+        """
+        data = self.send(method, path, query, body, interactive)
+        if data.get("type") == "async":
+            return data.get("change")
+        return data.get("result")
+
+    def send(self, method, path, query=None, body=None, interactive=False):
+        """
+        Send a request and return snapd's whole response, e.g.
+        {"type": "async", "change": "12", ...}. Raises SnapdError for errors.
+
+        Params:
+            method          HTTP method, e.g. "GET"
+            path            e.g. /v2/snaps
+            query           Dictionary of query parameters.
+            body            Object to send as JSON.
+            interactive     Allow snapd to ask the user for authorisation (polkit).
+        """
+        if query:
+            path = path + "?" + urllib.parse.urlencode(query)
+
+        headers = {"Accept": "application/json"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        if interactive:
+            headers["X-Allow-Interaction"] = "true"
+
+        # Other requests (e.g. starting a change) must never be sent twice, so they
+        # use a new connection rather than one that snapd may have closed.
+        idempotent = method == "GET"
+
+        while True:
+            connection, reused = self._get_connection(reuse=idempotent)
+            responded = False
+            try:
+                connection.request(method, path, payload, headers)
+                response = connection.getresponse()
+                responded = True
+                raw = response.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                # snapd may have closed an idle connection, so try again with a new one.
+                if reused and idempotent and not responded and isinstance(e, _STALE_CONNECTION_ERRORS):
+                    continue
+                raise SnapdError("Cannot connect to snapd: " + str(e))
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._put_connection(connection)
+
+        try:
+            data = json.loads(raw.decode("utf-8"))
+        except ValueError:
+            raise SnapdError("Invalid response from snapd", status=response.status)
+
+        if data.get("type") == "error":
+            result = data.get("result") or {}
+            raise SnapdError(result.get("message", "Unknown error"), result.get("kind"), data.get("status-code"))
+
+        return data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def is_available(self, timeout=PROBE_TIMEOUT):
+        """
+        Returns True if snapd responds within 'timeout' seconds.
+        """
+        connection = _UnixHTTPConnection(self.socket_path, timeout)
+        try:
+            connection.request("GET", "/v2/system-info", headers={"Accept": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            return response.status == 200
+        except (http.client.HTTPException, OSError):
+            return False
+        finally:
+            connection.close()
+
+    def get_snaps(self, names=None):
+        """
+        Returns a dictionary of snap name => snapd's details for installed
+        snaps. Without names, returns all installed snaps.
+        """
+        if names is None:
+            batches = [None]
+        else:
+            names = list(names)
+            batches = [names[start:start + BATCH_SIZE] for start in range(0, len(names), BATCH_SIZE)]
+
+        snaps = {}
+        for batch in batches:
+            query = {"snaps": ",".join(batch)} if batch else None
+            for snap in self.request("GET", "/v2/snaps", query) or []:
+                snaps[snap["name"]] = snap
+        return snaps
+
+    def get_installed(self):
+        """
+        Returns a dictionary of snap name => version for installed snaps.
+        """
+        snaps = self.get_snaps()
+        return {name: snaps[name].get("version") for name in snaps.keys()}
+
+    def find(self, name):
+        """
+        Returns the details of a snap from the store, or None if it doesn't exist.
+        """
+        try:
+            results = self.request("GET", "/v2/find", {"name": name})
+        except SnapdError as e:
+            if e.kind == "snap-not-found" or e.status == 404:
+                return None
+            raise
+        return results[0] if results else None
+
+    def find_many(self, names):
+        """
+        Returns a dictionary of snap name => details from the store. The store
+        is asked about one snap at a time, over the same connection.
+        """
+        snaps = {}
+        for name in names:
+            snap = self.find(name)
+            if snap:
+                snaps[name] = snap
+        return snaps
+
+    def change(self, action, names):
+        """
+        Start installing, removing or refreshing snaps. Returns the change ID,
+        or None if snapd had nothing to do (e.g. no refresh was available).
+
+        Params:
+            action      "install", "remove" or "refresh"
+            names       List of snap names, changed in one transaction.
+        """
+        data = self.send("POST", "/v2/snaps", body={"action": action, "snaps": list(names)}, interactive=True)
+        if data.get("type") != "async":
+            return None
+        return data.get("change")
+
+    def get_change(self, change_id):
+        return self.request("GET", "/v2/changes/" + urllib.parse.quote(str(change_id)))
+
+    def abort_change(self, change_id):
+        return self.request("POST", "/v2/changes/" + urllib.parse.quote(str(change_id)), body={"action": "abort"})
+
+    def wait_for_change(self, change_id, on_progress=None, abort=None, interval=POLL_INTERVAL):
+        """
+        Poll a change until it is ready. Returns the change's final details.
+
+        Params:
+            change_id       ID returned by change()
+            on_progress     Function called with (done, total, snap name) after each poll.
+            abort           threading.Event() that is set to abort the change.
+            interval        Seconds between polls.
+        """
+        abort = abort or threading.Event()
+        aborted = False
+        while True:
+            change = self.get_change(change_id)
+            if on_progress:
+                on_progress(*get_change_progress(change))
+            if change.get("ready"):
+                return change
+
+            if abort.is_set() and not aborted:
+                aborted = True
+                try:
+                    self.abort_change(change_id)
+                except SnapdError:
+                    pass
+
+            if aborted:
+                time.sleep(interval)
+            else:
+                abort.wait(interval)
+
+
+def get_change_progress(change):
+    """
+    Returns (done, total, name of the snap being worked on) for a change,
+    adding up the progress of its tasks.
+    """
+    done = 0
+    total = 0
+    current = None
+    for task in change.get("tasks", []):
+        progress = task.get("progress") or {}
+        done += progress.get("done", 0)
+        total += progress.get("total", 0)
+        if current is None and task.get("status") == "Doing":
+            match = _SNAP_NAME_PATTERN.search(task.get("summary", ""))
+            if match:
+                current = match.group(1)
+    return done, total, current
@@ -0,0 +1,633 @@
+"""
+Processes the queue of software to install, remove or reinstall.
+
+Instead of running one transaction per application, pending items are
+grouped into batches: one per backend and action. Removals run before
+reinstalls, which run before installs, so that conflicting packages are out
+of the way first.
+
+Backends implement the Backend interface. FakeBackend can be used to exercise
+the queue without touching the system.
+
+When a Prefetcher is given, artifacts for pending items are downloaded while
+the current batch is being processed.
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from . import prefetch as Prefetch
+from . import snapd as Snapd
+
+# Batches are processed in this order.
+ACTIONS = ["remove", "reinstall", "install"]
+
+# apt's own cache. Prefetched archives are copied here as root, as apt (and its
+# '_apt' sandbox user) must not share a folder with the user's processes.
+APT_ARCHIVES_DIR = "/var/cache/apt/archives"
+
+# Runs as root before apt-get. Arguments are groups of: <path> <filename> <size> <checksum>,
+# then "--" and apt-get's arguments. An archive is only copied if the copy's size and
+# checksum match what apt expects, otherwise apt downloads it as usual.
+_COPY_ARCHIVES_SCRIPT = """
+umask 022
+archives="$0"
+while [ "$#" -gt 0 ] && [ "$1" != "--" ]; do
+    path="$1"; name="$2"; size="$3"; checksum="$4"
+    shift 4
+    case "$checksum" in
+        SHA512:*) tool=sha512sum ;;
+        SHA256:*) tool=sha256sum ;;
+        SHA1:*) tool=sha1sum ;;
+        MD5Sum:*) tool=md5sum ;;
+        *) continue ;;
+    esac
+    case "$name" in
+        */*|.*|"") continue ;;
+    esac
+    tmp="$archives/partial/$name.boutique"
+    if cp -- "$path" "$tmp" 2>/dev/null && [ "$(stat -c %s "$tmp")" = "$size" ] && \
+       echo "${checksum#*:}  $tmp" | "$tool" -c --status 2>/dev/null; then
+        mv -f -- "$tmp" "$archives/$name"
+    else
+        rm -f -- "$tmp"
+    fi
+done
+shift
+exec apt-get "$@"
+"""
+
+
+class QueueItem(object):
+    """
+    An application waiting in (or processed by) the queue.
+    """
+    def __init__(self, item_id, name, icon, backend, packages, action):
+        """
+        Params:
+            item_id     ID used by the view, e.g. "curated:caja" or "apt:caja"
+            name        Human readable name of the application.
+            icon        Path to the icon, or empty for a generic icon.
+            backend     Name of the backend to process this item, e.g. "apt" or "snap"
+            packages    List of package names (or snap names) for the backend.
+            action      Either: "install", "remove", "reinstall"
+        """
+        self.id = item_id
+        self.name = name
+        self.icon = icon
+        self.backend = backend
+        self.packages = packages
+        self.action = action
+        self.state = "pending"
+        self.success = False
+        self.error = None
+        self.was_installed = None   # Whether the main package was installed when queued.
+        self.abortable = True       # False once the backend has started changes that cannot be stopped safely.
+
+    def to_dict(self):
+        """
+        Returns the data for this item as used by the view's queue page.
+        """
+        return {
+            "id": self.id,
+            "name": self.name,
+            "icon": self.icon,
+            "action": self.action,
+            "state": self.state,
+            "success": self.success,
+            "abortable": self.abortable
+        }
+
+
+class Backend(object):
+    """
+    Interface for a backend that performs the transactions for a batch.
+    """
+    name = None
+
+    def is_available(self):
+        """
+        Returns True if this backend can be used on this system.
+        """
+        return False
+
+    def run(self, action, items, progress, abort):
+        """
+        Perform one transaction for all the items.
+
+        Params:
+            action      Either: "install", "remove", "reinstall"
+            items       List of QueueItem() objects in this batch.
+            progress    Function to call with (value, value_end, item) as the transaction
+                        progresses. value is -1 if progress is unknown.
+            abort       threading.Event() that is set if the user wishes to stop. Backends
+                        that reach a point where stopping would damage the system set
+                        'abortable' to False on the items and carry on.
+
+        Returns a dictionary of item ID => error message, or None if successful.
+        Items missing from the dictionary are assumed to be successful.
+        """
+        raise NotImplementedError
+
+    def get_artifacts(self, action, items):
+        """
+        Returns a list of prefetch.Artifact() objects that need downloading
+        before the transaction can run, so they can be prefetched.
+        """
+        return []
+
+
+class FakeBackend(Backend):
+    """
+    Backend that does not change the system. Records each transaction, and
+    fails packages listed in 'failures'.
+    """
+    def __init__(self, name="fake", delay=0, failures=None, artifacts=None):
+        """
+        Params:
+            name        Name of the backend.
+            delay       Seconds to spend 'processing' each item.
+            failures    List of package names that fail.
+            artifacts   Dictionary of package name => list of Artifact() objects to prefetch.
+        """
+        self.name = name
+        self.delay = delay
+        self.failures = failures or []
+        self.artifacts = artifacts or {}
+        self.transactions = []
+
+    def get_artifacts(self, action, items):
+        artifacts = []
+        for item in items:
+            for package in item.packages:
+                artifacts += self.artifacts.get(package, [])
+        return artifacts
+
+    def is_available(self):
+        return True
+
+    def run(self, action, items, progress, abort):
+        packages = []
+        for item in items:
+            packages += item.packages
+        self.transactions.append((action, packages))
+
+        results = {}
+        for position, item in enumerate(items):
+            if abort.is_set():
+                results[item.id] = "Aborted"
+                continue
+
+            progress(position, len(items), item)
+            time.sleep(self.delay)
+
+            for package in item.packages:
+                if package in self.failures:
+                    results[item.id] = "Failed to {0} {1}".format(action, package)
+        progress(len(items), len(items), None)
+        return results
+
+
+class AptBackend(Backend):
+    """
+    Performs transactions using apt-get (as root via PolicyKit).
+    """
+    name = "apt"
+
+    def __init__(self, prefetcher=None):
+        """
+        Params:
+            prefetcher      Optional prefetch.Prefetcher() whose downloaded .deb files
+                            are copied into apt's cache before installing.
+        """
+        self.prefetcher = prefetcher
+
+    def is_available(self):
+        return shutil.which("apt-get") is not None and shutil.which("pkexec") is not None
+
+    def get_artifacts(self, action, items):
+        """
+        Asks apt which archives need downloading. Lines are in the format:
+            'http://archive.ubuntu.com/.../caja_1.20_amd64.deb' caja_1.20_amd64.deb 123456 SHA256:abcdef...
+        """
+        if action == "remove":
+            return []
+
+        packages = []
+        for item in items:
+            packages += item.packages
+
+        command = ["apt-get", "-qq", "--print-uris", "install"]
+        if action == "reinstall":
+            command.append("--reinstall")
+
+        output = subprocess.run(command + packages, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True).stdout
+
+        artifacts = []
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) < 3 or not parts[0].startswith("'"):
+                continue
+            try:
+                size = int(parts[2])
+            except ValueError:
+                size = None
+            checksum = parts[3] if len(parts) > 3 else None
+            artifacts.append(Prefetch.Artifact(parts[0].strip("'"), parts[1], size, checksum))
+        return artifacts
+
+    def get_prefetched(self, action, items):
+        """
+        Returns the artifacts for a batch that the prefetcher has already
+        downloaded, and have a size and checksum to check them against.
+        """
+        if not self.prefetcher or action == "remove":
+            return []
+        try:
+            artifacts = self.get_artifacts(action, items)
+        except OSError:
+            return []
+        return [artifact for artifact in artifacts
+                if artifact.size is not None and artifact.checksum and self.prefetcher.is_cached(artifact)]
+
+    def get_command(self, action, packages, prefetched=None):
+        """
+        Returns the command to run the transaction as root. Prefetched
+        artifacts are copied into apt's cache by the same command.
+        """
+        arguments = ["-y", "-q", "-o", "APT::Status-Fd=1"]
+        if action == "install":
+            arguments += ["install"]
+        elif action == "reinstall":
+            arguments += ["install", "--reinstall"]
+        elif action == "remove":
+            arguments += ["remove"]
+        arguments += packages
+
+        if not prefetched:
+            return ["pkexec", "apt-get"] + arguments
+
+        command = ["pkexec", "/bin/sh", "-c", _COPY_ARCHIVES_SCRIPT, APT_ARCHIVES_DIR]
+        for artifact in prefetched:
+            command += [os.path.abspath(self.prefetcher.get_path(artifact)), artifact.filename,
+                        str(artifact.size), artifact.checksum]
+        return command + ["--"] + arguments
+
+    def run(self, action, items, progress, abort):
+        owners = {}
+        packages = []
+        for item in items:
+            for package in item.packages:
+                owners[package] = item
+                packages.append(package)
+
+        command = self.get_command(action, packages, self.get_prefetched(action, items))
+        process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, universal_newlines=True)
+        output = []
+        aborted = False
+        progress(-1, 100, items[0])
+
+        for line in process.stdout:
+            # Once dpkg starts (pmstatus), stopping it would leave packages half configured.
+            if line.startswith("pmstatus:") and items[0].abortable:
+                for item in items:
+                    item.abortable = False
+
+            if abort.is_set() and items[0].abortable and not aborted:
+                # apt runs as root, so this only works when the user is allowed to signal it.
+                try:
+                    process.terminate()
+                    aborted = True
+                    break
+                except (PermissionError, ProcessLookupError):
+                    for item in items:
+                        item.abortable = False
+
+            # Status lines are in the format: pmstatus:<package>:<percent>:<description>
+            if line.startswith("pmstatus:") or line.startswith("dlstatus:"):
+                try:
+                    status, package, percent, description = line.split(":", 3)
+                    package = package.split(":")[0]
+                    progress(int(float(percent)), 100, owners.get(package))
+                except ValueError:
+                    pass
+            else:
+                output.append(line.strip())
+
+        if process.wait() == 0 and not aborted:
+            return None
+
+        error = "Aborted" if aborted else "\n".join(output[-10:])
+        results = {}
+        for item in items:
+            results[item.id] = error
+        return results
+
+
+class SnapBackend(Backend):
+    """
+    Performs transactions through snapd's REST API. snapd handles privileges.
+    """
+    name = "snap"
+
+    def __init__(self, client=None):
+        """
+        Params:
+            client      SnapdClient() to use, shared with the rest of the application.
+        """
+        self.client = client or Snapd.SnapdClient()
+
+    def is_available(self):
+        return self.client.is_available()
+
+    def run(self, action, items, progress, abort):
+        owners = {}
+        names = []
+        for item in items:
+            for name in item.packages:
+                owners[name] = item
+                names.append(name)
+
+        # snapd cannot reinstall. Refreshing doesn't reinstall anything, and removing
+        # first would lose the snap's data, so this is reported instead.
+        if action == "reinstall":
+            return {item.id: "Reinstalling snaps is not supported" for item in items}
+
+        def _progress(done, total, name):
+            if total > 0:
+                progress(done, total, owners.get(name))
+            else:
+                progress(-1, 100, owners.get(name))
+
+        progress(-1, 100, items[0])
+        try:
+            change_id = self.client.change(action, names)
+            if change_id is None:
+                return None
+            change = self.client.wait_for_change(change_id, _progress, abort)
+        except Snapd.SnapdError as e:
+            change = {"status": "Error", "err": str(e)}
+
+        if change.get("status") == "Done":
+            return None
+
+        error = "Aborted" if abort.is_set() else change.get("err") or change.get("status")
+        results = {}
+        for item in items:
+            results[item.id] = error
+        return results
+
+
+class TransactionQueue(object):
+    """
+    Schedules batches of queued items to the backends, one batch at a time.
+    """
+    def __init__(self, backends, on_list_changed, on_progress, on_finished, submit=None,
+                 prefetcher=None, on_download=None):
+        """
+        Params:
+            backends            Dictionary of backend name => Backend() object.
+            on_list_changed     Function to call with the queue (list of dictionaries) when items change.
+            on_progress         Function to call with (item, value, value_end, position, total) when the
+                                active item changes or progresses. position/total count items in this run.
+            on_finished         Function to call with a list of the QueueItem() objects processed
+                                when the queue becomes idle.
+            submit              Function to run the worker in the background. Defaults to a new thread.
+            prefetcher          Optional prefetch.Prefetcher() to download artifacts ahead of processing.
+            on_download         Function to call with (item, bytes_done, bytes_total, position, total)
+                                while waiting for a batch's artifacts to download.
+        """
+        self.backends = backends
+        self.on_list_changed = on_list_changed
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.on_download = on_download
+        self.submit = submit
+        self.prefetcher = prefetcher
+        self.items = []
+        self._downloads = {}
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._running = False
+
+        # Counts for the current run of the queue, reset when the queue becomes idle.
+        self._processed = []
+        self._total = 0
+
+    def is_busy(self):
+        return self._running
+
+    def wait(self, timeout=None):
+        """
+        Block until the queue has finished processing. Returns False on timeout.
+        """
+        return self._idle.wait(timeout)
+
+    def get_list(self):
+        with self._lock:
+            return [item.to_dict() for item in self.items]
+
+    def add(self, item):
+        """
+        Add an item to the queue and start processing if the queue is idle.
+        Returns False if the same application is already waiting.
+        """
+        with self._lock:
+            for existing in self.items:
+                if existing.id == item.id and existing.state != "processed":
+                    return False
+
+            if item.backend not in self.backends:
+                item.state = "processed"
+                item.error = "Backend unavailable: " + str(item.backend)
+                self.items.append(item)
+                start = False
+            else:
+                self.items.append(item)
+                self._total += 1
+                start = not self._running
+                if start:
+                    self._running = True
+                    self._idle.clear()
+                else:
+                    # Another batch is processing, so start downloading now.
+                    self._prefetch(item)
+
+        self._notify_list()
+        if start:
+            self._start_worker()
+        return True
+
+    def drop(self, item_id):
+        """
+        Remove an item from the queue. Items being processed are part of a
+        batch with other items, so they cannot be dropped (see stop_active()).
+        Returns False if the item is being processed.
+        """
+        with self._lock:
+            for item in list(self.items):
+                if item.id != item_id:
+                    continue
+                if item.state == "processing":
+                    return False
+                if item.state == "pending":
+                    self._total -= 1
+                    download = self._downloads.pop(item.id, None)
+                    if download:
+                        download.cancel()
+                self.items.remove(item)
+        self._notify_list()
+        return True
+
+    def clear(self):
+        """
+        Remove all items that have been processed.
+        """
+        with self._lock:
+            self.items = [item for item in self.items if item.state != "processed"]
+        self._notify_list()
+
+    def stop_active(self):
+        """
+        Abort the batch that is currently being processed. Returns False if
+        the backend has reached a point where it cannot stop.
+        """
+        with self._lock:
+            active = [item for item in self.items if item.state == "processing"]
+        if active and not all(item.abortable for item in active):
+            return False
+        self._abort.set()
+        return True
+
+    def _prefetch(self, item):
+        """
+        Start downloading the artifacts for an item, if they are not already.
+        Must be called with the lock held.
+        """
+        if not self.prefetcher or item.id in self._downloads or item.action == "remove":
+            return
+
+        backend = self.backends[item.backend]
+        self._downloads[item.id] = self.prefetcher.fetch(lambda: backend.get_artifacts(item.action, [item]))
+
+    def _wait_for_downloads(self, items):
+        """
+        Block until the artifacts for a batch have downloaded, reporting progress.
+        Returns False if the user aborted.
+        """
+        with self._lock:
+            downloads = [(item, self._downloads.get(item.id)) for item in items]
+        downloads = [(item, download) for item, download in downloads if download]
+        offset = len(self._processed)
+
+        for position, (item, download) in enumerate(downloads):
+            while not download.wait(0.1):
+                if self._abort.is_set():
+                    for item, download in downloads:
+                        download.cancel()
+                    return False
+                if self.on_download:
+                    bytes_done = sum([d.bytes_done for i, d in downloads])
+                    bytes_total = sum([d.bytes_total for i, d in downloads])
+                    self.on_download(item, bytes_done, bytes_total, offset + items.index(item) + 1, self._total)
+
+        # Anything that failed to prefetch will be downloaded by the backend itself.
+        return True
+
+    def _notify_list(self):
+        self.on_list_changed(self.get_list())
+
+    def _start_worker(self):
+        if self.submit:
+            self.submit(self._process)
+        else:
+            thread = threading.Thread(target=self._process)
+            thread.daemon = True
+            thread.start()
+
+    def _next_batch(self):
+        """
+        Returns (backend name, action, items) for the next batch to process,
+        or None if there are no pending items. Must be called with the lock held.
+        """
+        pending = [item for item in self.items if item.state == "pending"]
+        if not pending:
+            return None
+
+        # Removals first. Within an action, the backend queued first goes first.
+        for action in ACTIONS:
+            for item in pending:
+                if item.action == action:
+                    backend = item.backend
+                    batch = [i for i in pending if i.action == action and i.backend == backend]
+                    return (backend, action, batch)
+
+        # Unknown action
+        for item in pending:
+            item.state = "processed"
+            item.error = "Unknown action: " + str(item.action)
+        return None
+
+    def _process(self):
+        """
+        Worker: process batches until the queue is empty.
+        """
+        while True:
+            with self._lock:
+                batch = self._next_batch()
+                if not batch:
+                    # Reset in the same step, so a new run started by add() from now on is counted separately.
+                    self._running = False
+                    processed = self._processed
+                    self._processed = []
+                    self._total = 0
+                    self._idle.set()
+                    break
+                backend_name, action, items = batch
+                for item in items:
+                    item.state = "processing"
+                for item in self.items:
+                    if item.state != "processed":
+                        self._prefetch(item)
+                self._abort.clear()
+
+            self._notify_list()
+            if self._wait_for_downloads(items):
+                results = self._run_batch(backend_name, action, items)
+            else:
+                results = {item.id: "Aborted" for item in items}
+
+            with self._lock:
+                for item in items:
+                    self._downloads.pop(item.id, None)
+                    error = results.get(item.id) if results else None
+                    item.state = "processed"
+                    item.success = error is None
+                    item.error = error
+                self._processed += items
+            self._notify_list()
+
+        self.on_finished(processed)
+
+    def _run_batch(self, backend_name, action, items):
+        backend = self.backends[backend_name]
+        offset = len(self._processed)
+
+        def _progress(value, value_end, item):
+            position = offset + (items.index(item) if item in items else 0) + 1
+            self.on_progress(item or items[0], value, value_end, position, self._total)
+
+        try:
+            return backend.run(action, items, _progress, self._abort)
+        except Exception as e:
+            results = {}
+            for item in items:
+                results[item.id] = str(e)
+            return results
@@ -0,0 +1,24 @@
+"""
+GTK and WebKit interface. Like the rest of Software Boutique's modules, these
+are imported when they are first used.
+"""
+
+import importlib
+
+_MODULES = [
+    "app_window",
+    "icons",
+    "notification",
+    "thumbnails",
+    "web_view"
+]
+
+
+def __getattr__(name):
+    if name in _MODULES:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module '{0}' has no attribute '{1}'".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + _MODULES)
@@ -0,0 +1,163 @@
+"""
+Caches where icons from the current GTK icon theme are found.
+
+Looking up an icon walks the theme's directories, which adds up when a list
+shows hundreds of applications. Resolved paths are saved to the cache folder
+and reused on the next start, as long as the icon theme name and the
+modification time of its directory are unchanged.
+"""
+
+import json
+import os
+import threading
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import GLib, Gtk
+
+CACHE_VERSION = 1
+
+
+class IconCache(object):
+    """
+    Resolves GTK icon names to file paths, remembering the results on disk.
+    """
+    def __init__(self, dbg, cache_path):
+        """
+        Params:
+            dbg             Debugging() object
+            cache_path      File to save the cache, e.g. ~/.cache/software-boutique/icons.json
+        """
+        self.dbg = dbg
+        self.cache_path = cache_path
+        self.theme = Gtk.IconTheme.get_default()
+        self.theme_key = None
+        self.icons = {}
+        self.generation = 0                 # Increases when paths may have changed.
+        self._lock = threading.Lock()
+        self._main_thread = threading.current_thread()
+
+        self.theme_key = self._get_theme_key()
+        self._load()
+        self.theme.connect("changed", self._theme_changed)
+
+    def _get_theme_key(self):
+        """
+        Returns [theme name, modification time] to identify the current theme.
+        Changes when the user switches themes or the theme is updated.
+        """
+        name = Gtk.Settings.get_default().get_property("gtk-icon-theme-name")
+        mtime = 0
+        for folder in self.theme.get_search_path():
+            try:
+                mtime = max(mtime, os.stat(os.path.join(folder, name)).st_mtime_ns)
+            except OSError:
+                pass
+        return [name, mtime]
+
+    def _load(self):
+        try:
+            with open(self.cache_path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION and data.get("theme") == self.theme_key:
+                self.icons = data.get("icons", {})
+                self.dbg.stdout("Icon cache loaded: {0} icons".format(len(self.icons)), self.dbg.success, 1)
+                return
+            self.dbg.stdout("Icon theme changed, icon cache invalidated.", self.dbg.debug, 1)
+        except (OSError, ValueError):
+            pass
+        self.icons = {}
+
+    def _save(self):
+        """
+        Must be called with the lock held.
+        """
+        data = {
+            "version": CACHE_VERSION,
+            "theme": self.theme_key,
+            "icons": self.icons
+        }
+        temp_path = self.cache_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(temp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            self.dbg.stdout("Failed to save icon cache: " + str(e), self.dbg.warning, 1)
+
+    def _theme_changed(self, theme):
+        with self._lock:
+            self.theme_key = self._get_theme_key()
+            self.icons = {}
+            self.generation += 1
+        self.dbg.stdout("Icon theme changed, icon cache cleared.", self.dbg.debug, 1)
+
+    def _lookup_gtk(self, requests):
+        """
+        Look up icons in the GTK theme. Returns a list of paths (or None).
+        GTK is only used from the main thread, so other threads wait for it.
+        """
+        def _lookup():
+            paths = []
+            for icon_name, size in requests:
+                info = self.theme.lookup_icon(icon_name, size, 0)
+                paths.append(info.get_filename() if info else None)
+            return paths
+
+        if threading.current_thread() is self._main_thread:
+            return _lookup()
+
+        result = []
+        done = threading.Event()
+
+        def _idle():
+            try:
+                result.extend(_lookup())
+            finally:
+                done.set()
+            return GLib.SOURCE_REMOVE
+
+        GLib.idle_add(_idle)
+        done.wait()
+        return result
+
+    def lookup_many(self, icons, fallback_path=None):
+        """
+        Returns a dictionary of (icon_name, size) => path for a batch of icons,
+        e.g. all those in an application list. Icons not in the cache are
+        looked up together and the cache is saved once.
+
+        Params:
+            icons           List of (icon_name, size) tuples.
+            fallback_path   Path to use if an icon is not in the current theme.
+        """
+        results = {}
+        missing = []
+
+        with self._lock:
+            for icon_name, size in icons:
+                key = "{0}:{1}".format(icon_name, size)
+                if key in self.icons:
+                    results[(icon_name, size)] = self.icons[key]
+                elif (icon_name, size) not in missing:
+                    missing.append((icon_name, size))
+
+        if missing:
+            paths = self._lookup_gtk(missing)
+            with self._lock:
+                for request, path in zip(missing, paths):
+                    self.icons["{0}:{1}".format(request[0], request[1])] = path
+                    results[request] = path
+                self._save()
+
+        for request in results.keys():
+            if not results[request]:
+                results[request] = fallback_path
+
+        return results
+
+    def lookup(self, icon_name, size, fallback_path=None):
+        """
+        Returns a path to a GTK icon. See lookup_many().
+        """
+        return self.lookup_many([(icon_name, size)], fallback_path)[(icon_name, size)]
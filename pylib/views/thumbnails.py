@@ -0,0 +1,230 @@
+"""
+Creates small versions of application screenshots for the details page.
+
+Screenshots are often several megabytes and much larger than the space they
+are shown in. Decoding and scaling them down happens on worker threads, and
+the results are kept in a cache folder that is limited in size. When the
+cache is full, the thumbnails used least recently are removed first.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import gi
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository import GdkPixbuf
+
+# Thumbnails fit within this box, matching the largest screenshot on the details page.
+THUMBNAIL_WIDTH = 300
+THUMBNAIL_HEIGHT = 300
+JPEG_QUALITY = "85"
+
+MAX_CACHE_SIZE = 50 * 1024 * 1024
+WORKERS = 2
+DOWNLOAD_TIMEOUT = 15
+
+
+class ThumbnailCache(object):
+    """
+    Scales screenshots down in the background and remembers them on disk.
+    """
+    def __init__(self, dbg, cache_dir, max_size=MAX_CACHE_SIZE, workers=WORKERS):
+        """
+        Params:
+            dbg             Debugging() object
+            cache_dir       Folder for thumbnails, e.g. ~/.cache/software-boutique/thumbnails
+            max_size        Total size of the thumbnails to keep, in bytes.
+            workers         Number of screenshots to decode at once.
+        """
+        self.dbg = dbg
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.size = 0
+        self.generation = 0                 # Increases when thumbnails are removed.
+        self._entries = OrderedDict()       # Filename => size, least recently used first.
+        self._pending = {}                  # Filename => callbacks waiting for it.
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """
+        Find thumbnails from previous runs. Their modification time is
+        updated when used, so it gives their order of use.
+        """
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, filename)
+            if filename.endswith(".tmp"):
+                self._remove(path)
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, filename, stat.st_size))
+
+        for mtime, filename, size in sorted(entries):
+            self._entries[filename] = size
+            self.size += size
+
+        self.dbg.stdout("Thumbnail cache: {0} thumbnails, {1} KiB".format(len(self._entries), self.size // 1024), self.dbg.debug, 1)
+
+    def _get_filename(self, source):
+        """
+        Thumbnails are named by a hash of where the screenshot came from. Local
+        files include their modification time and size, so a thumbnail is
+        recreated when the screenshot changes.
+        """
+        key = source
+        if not _is_remote(source):
+            try:
+                stat = os.stat(_get_local_path(source))
+                key = "{0}:{1}:{2}".format(source, stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                pass
+        key = "{0}:{1}x{2}".format(key, THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jpg"
+
+    def get_thumbnails(self, sources, callback):
+        """
+        Returns a list of thumbnail paths for screenshots, in the same order.
+        Thumbnails that do not exist yet are None, and are created in the
+        background. 'callback' is then called from a worker thread.
+
+        Params:
+            sources         List of screenshot paths or URLs.
+            callback        Function called with (source, thumbnail_path) when a thumbnail
+                            is created. The path is None if the screenshot could not be read.
+        """
+        thumbnails = []
+        for source in sources:
+            filename = self._get_filename(source)
+            path = os.path.join(self.cache_dir, filename)
+
+            with self._lock:
+                if filename in self._entries and os.path.exists(path):
+                    self._entries.move_to_end(filename)
+                    thumbnails.append(path)
+                    self._touch(path)
+                    continue
+
+                thumbnails.append(None)
+                if filename in self._pending:
+                    self._pending[filename].append(callback)
+                    continue
+                self._pending[filename] = [callback]
+
+            self._pool.submit(self._create, source, filename)
+
+        return thumbnails
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _create(self, source, filename):
+        """
+        Worker: Decode, scale and save a thumbnail, then tell those waiting for it.
+        """
+        path = os.path.join(self.cache_dir, filename)
+        try:
+            self._save_thumbnail(source, path)
+            size = os.path.getsize(path)
+            with self._lock:
+                # The entry may already exist if its file went missing, so replace its size.
+                self.size += size - self._entries.pop(filename, 0)
+                self._entries[filename] = size
+                self._evict(filename)
+        except Exception as e:
+            self.dbg.stdout("Failed to create thumbnail for {0}: {1}".format(source, str(e)), self.dbg.warning, 1)
+            path = None
+
+        with self._lock:
+            callbacks = self._pending.pop(filename, [])
+
+        for callback in callbacks:
+            try:
+                callback(source, path)
+            except Exception as e:
+                self.dbg.stdout("Thumbnail callback failed: " + str(e), self.dbg.error)
+
+    def _save_thumbnail(self, source, path):
+        temp_path = path + ".tmp"
+        download_path = None
+        try:
+            if _is_remote(source):
+                download_path = path + ".download.tmp"
+                with urllib.request.urlopen(source, timeout=DOWNLOAD_TIMEOUT) as response:
+                    with open(download_path, "wb") as f:
+                        shutil.copyfileobj(response, f)
+                local_path = download_path
+            else:
+                local_path = _get_local_path(source)
+
+            # Decoding at the smaller size uses less memory than scaling afterwards.
+            image_format, width, height = GdkPixbuf.Pixbuf.get_file_info(local_path)
+            if not image_format:
+                raise ValueError("Unrecognised image format")
+            if width <= THUMBNAIL_WIDTH and height <= THUMBNAIL_HEIGHT:
+                pixbuf = GdkPixbuf.Pixbuf.new_from_file(local_path)
+            else:
+                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(local_path, THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT, True)
+
+            # JPEG has no transparency, so place the image on white.
+            if pixbuf.get_has_alpha():
+                pixbuf = pixbuf.composite_color_simple(pixbuf.get_width(), pixbuf.get_height(),
+                                                       GdkPixbuf.InterpType.NEAREST, 255, 32, 0xffffff, 0xffffff)
+
+            pixbuf.savev(temp_path, "jpeg", ["quality"], [JPEG_QUALITY])
+            os.replace(temp_path, path)
+        finally:
+            for leftover in [temp_path, download_path]:
+                if leftover and os.path.exists(leftover):
+                    self._remove(leftover)
+
+    def _evict(self, keep):
+        """
+        Remove the least recently used thumbnails until the cache is within its
+        size. Must be called with the lock held.
+        """
+        while self.size > self.max_size and len(self._entries) > 1:
+            filename, size = next(iter(self._entries.items()))
+            if filename == keep:
+                self._entries.move_to_end(filename)
+                continue
+            del self._entries[filename]
+            self.size -= size
+            self.generation += 1
+            self._remove(os.path.join(self.cache_dir, filename))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def shutdown(self):
+        """
+        Stop the workers once the thumbnails being created are saved.
+        """
+        self._pool.shutdown(wait=False)
+
+
+def _is_remote(source):
+    return source.startswith("http://") or source.startswith("https://")
+
+
+def _get_local_path(source):
+    if source.startswith("file://"):
+        return urllib.request.url2pathname(source[len("file://"):])
+    return source
@@ -2,10 +2,77 @@
 Handles the setting up and processing of data sent from WebView (WebKitGTK)
 """
 
+import threading
+
 import gi
 gi.require_version("WebKit2", "4.0")
 from gi.repository import GLib, WebKit2
 
+
+class MessageBatcher(object):
+    """
+    Collects JavaScript to run on the page from any thread, and runs them
+    together as a single evaluation.
+
+    Messages can be given a key for 'latest wins' coalescing, so a burst of
+    updates (e.g. progress) only runs the most recent one, in the position
+    of the first.
+    """
+    def __init__(self, run_javascript, frame_rate=0):
+        """
+        :param run_javascript: Function that evaluates a string of JavaScript (main thread only)
+        :param frame_rate: Maximum flushes per second. Use 0 to flush on the next main loop iteration.
+        """
+        self._run_javascript = run_javascript
+        self._lock = threading.Lock()
+        self._messages = []
+        self._keys = {}
+        self._scheduled = False
+        self.frame_rate = frame_rate
+
+    def add(self, script, key=None):
+        """
+        Queue JavaScript to run on the next flush.
+
+        :param script: String of JavaScript to run.
+        :param key: Optional key. If a message with the same key is waiting, it is replaced.
+        """
+        with self._lock:
+            if key is not None and key in self._keys:
+                self._messages[self._keys[key]] = script
+            else:
+                if key is not None:
+                    self._keys[key] = len(self._messages)
+                self._messages.append(script)
+
+            if self._scheduled:
+                return
+            self._scheduled = True
+
+        if self.frame_rate > 0:
+            GLib.timeout_add(int(1000 / self.frame_rate), self._flush)
+        else:
+            GLib.idle_add(self._flush)
+
+    def flush(self):
+        """
+        Runs all queued messages now. Must be called from the main thread.
+        """
+        with self._lock:
+            messages = self._messages
+            self._messages = []
+            self._keys = {}
+            self._scheduled = False
+
+        if messages:
+            # Isolate each message so one failing does not prevent the rest.
+            self._run_javascript("\n".join(["try {" + script + "} catch (e) { console.error(e); }" for script in messages]))
+
+    def _flush(self):
+        self.flush()
+        return GLib.SOURCE_REMOVE
+
+
 class WebView(WebKit2.WebView):
     """
     Setting up the program's web browser and processing WebKit operations
@@ -20,9 +87,18 @@ class WebView(WebKit2.WebView):
         self.webkit.WebView.__init__(self)
         self.app = app
         self.inspector = False
+        self.batcher = MessageBatcher(self.run_javascript)
 
         # Python <--> WebView communication
-        self.connect("notify::title", self._recv_data)
+        # Newer WebKit has a dedicated channel, otherwise the page title is used.
+        self.message_channel = False
+        if hasattr(WebKit2.JavascriptResult, "get_js_value"):
+            manager = self.get_user_content_manager()
+            manager.connect("script-message-received::boutique", self._recv_message)
+            self.message_channel = manager.register_script_message_handler("boutique")
+
+        if not self.message_channel:
+            self.connect("notify::title", self._recv_data)
         self.connect("context-menu", self._on_context_menu)
         self.connect("load-changed", self.on_finish_load)
 
@@ -39,19 +115,23 @@ class WebView(WebKit2.WebView):
             self.get_settings().set_property("enable-developer-extras", True)
             self.inspector = True
 
-    def run_js(self, function):
+    def run_js(self, function, coalesce_key=None):
         """
         Runs a JavaScript function on the page, regardless of which thread it is called from.
         GTK+ operations must be performed on the same thread to prevent crashes.
+
+        Calls made together are batched into one evaluation on the next main
+        loop iteration (or frame, see set_frame_rate).
+
+        :param coalesce_key: Optional key. Only the latest call with this key runs per batch.
         """
-        GLib.idle_add(self._run_js, function)
+        self.batcher.add(function, coalesce_key)
 
-    def _run_js(self, function):
+    def set_frame_rate(self, frame_rate):
         """
-        Runs a JavaScript function on the page when invoked from run_js()
+        Limit how often batched JavaScript runs. Use 0 to run as soon as the main loop is idle.
         """
-        self.run_javascript(function)
-        return GLib.SOURCE_REMOVE
+        self.batcher.frame_rate = frame_rate
 
     def on_finish_load(self, view, frame):
         """
@@ -60,6 +140,13 @@ class WebView(WebKit2.WebView):
         if not self.is_loading():
             self.app.start()
 
+    def _recv_message(self, manager, js_result):
+        """
+        Callback: Used to receive data from view (JS) to controller (Python)
+        via the script message handler.
+        """
+        self.app.incoming_request(js_result.get_js_value().to_string())
+
     def _recv_data(self, view, frame):
         """
         Callback: Used to recieve data from view (JS) to controller (Python)
@@ -70,14 +157,25 @@ class WebView(WebKit2.WebView):
             # Reset title afterwards so another request can be sent again.
             self.run_js("document.title = ''")
 
-    def send_data(self, function, data):
+    def send_data(self, function, data, coalesce=False):
         """
         Used to communicate from controller (Python) to view (JS).
 
         :parm function: Name of the JavaScript function to execute, passing this data.
         :parm data: String containing data stream.
+        :parm coalesce: Only send the latest data for this function when updates are batched.
+        """
+        self.run_js("{0}({1})".format(function, str(data)), function if coalesce else None)
+
+    def send_reply(self, request_id, data):
+        """
+        Replies to a specific request from the view (JS), which may have a
+        callback waiting for this data.
+
+        :parm request_id: ID of the request sent from the view.
+        :parm data: String containing data stream.
         """
-        self.run_js("{0}({1})".format(function, str(data)))
+        self.run_js("recv_reply({0}, {1})".format(int(request_id), str(data)))
 
     def _on_context_menu(self, webview, menu, event, htr, user_data=None):
         """
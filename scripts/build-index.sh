@@ -27,3 +27,12 @@ if [ $? != 0 ]; then
 fi
 
 cp -r dist/* "$SB_DIR/data/index/"
+
+# Compile the binary index for faster start up.
+cd "$SB_DIR"
+echo "Compiling binary index..."
+python3 pylib/index.py data/index/applications-*.json
+if [ $? != 0 ]; then
+    echo "Binary index failed to build."
+    exit 1
+fi
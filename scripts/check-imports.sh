@@ -0,0 +1,41 @@
+#!/bin/bash
+#
+# Checks that command line options which don't open the window (--version and
+# --help) do not import GTK, WebKit or the controller. These are used by
+# provisioning scripts, so they should return quickly.
+#
+cd "$(dirname $0)/../"
+
+heavy_modules="gi requests pylib.controller pylib.views.app_window pylib.views.icons pylib.views.notification pylib.views.web_view"
+max_ms=100
+result=0
+
+for param in --version --help; do
+    start=$(date +%s%N)
+    imports=$(python3 -X importtime ./software-boutique $param 2>&1 >/dev/null)
+    elapsed=$(( ($(date +%s%N) - start) / 1000000 ))
+
+    for module in $heavy_modules; do
+        pattern="\| +${module//./\\.}$"
+        if echo "$imports" | grep -qE "$pattern"; then
+            echo "FAIL: '$param' imported $module"
+            result=1
+        fi
+    done
+
+    # Time spent importing, excluding the interpreter's own start up. Each module's
+    # own (self) time is added up, as the cumulative time would count nested imports again.
+    import_us=$(echo "$imports" | grep -E "\| +[a-zA-Z_]" | grep -vE "\| +(site|encodings|_frozen_importlib_external|zipimport)$" | sed "s/^import time://" | awk -F'|' '{total += $1} END {print total + 0}')
+    import_ms=$(( import_us / 1000 ))
+    if [ $import_ms -gt $max_ms ]; then
+        echo "FAIL: '$param' spent ${import_ms} ms importing modules (limit ${max_ms} ms)"
+        result=1
+    fi
+
+    echo "$param: ${elapsed} ms total, ${import_ms} ms importing"
+done
+
+if [ $result == 0 ]; then
+    echo "OK: No heavy modules were imported."
+fi
+exit $result
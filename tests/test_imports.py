@@ -0,0 +1,60 @@
+"""
+Checks that command line options which don't open the window stay quick,
+as in scripts/check-imports.sh.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["gi", "requests", "pylib.controller", "pylib.views.app_window", "pylib.views.icons",
+                 "pylib.views.notification", "pylib.views.web_view"]
+
+# Milliseconds spent importing modules, excluding the interpreter's own start up.
+MAX_IMPORT_MS = 100
+
+_STARTUP_MODULES = ["site", "encodings", "_frozen_importlib_external", "zipimport"]
+
+
+def get_imports(param):
+    """
+    Returns a dictionary of module name => microseconds spent importing it
+    (excluding its own imports) when running the program with 'param'.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", os.path.join(ROOT, "software-boutique"), param],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, cwd=ROOT)
+    imports = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        try:
+            imports[name.strip()] = int(self_us)
+        except ValueError:
+            continue
+    return imports
+
+
+class ImportBudgetTest(unittest.TestCase):
+    def _check(self, param):
+        imports = get_imports(param)
+        self.assertTrue(imports, "No imports were reported for " + param)
+
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, imports, "'{0}' imported {1}".format(param, module))
+
+        import_ms = sum([imports[name] for name in imports.keys() if name not in _STARTUP_MODULES]) / 1000
+        self.assertLessEqual(import_ms, MAX_IMPORT_MS, "'{0}' spent {1:.0f} ms importing modules".format(param, import_ms))
+
+    def test_version(self):
+        self._check("--version")
+
+    def test_help(self):
+        self._check("--help")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+"""
+Tests for the prefetcher, downloading from a local HTTP server.
+"""
+
+import http.server
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from pylib import prefetch as Prefetch
+
+DATA = bytes(range(256)) * 1000
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves DATA for any path, supporting "Range: bytes=<start>-" requests.
+    """
+    ranges = []
+    delay = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start = 0
+        header = self.headers.get("Range")
+        _Handler.ranges.append(header)
+        if header:
+            start = int(header[len("bytes="):-1])
+            if start >= len(DATA):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+        else:
+            self.send_response(200)
+
+        body = DATA[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            for position in range(0, len(body), Prefetch.CHUNK_SIZE):
+                self.wfile.write(body[position:position + Prefetch.CHUNK_SIZE])
+                time.sleep(_Handler.delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class PrefetcherTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = "http://127.0.0.1:{0}/".format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _Handler.ranges = []
+        _Handler.delay = 0
+        self.cache_dir = tempfile.mkdtemp()
+        self.prefetcher = Prefetch.Prefetcher(self.cache_dir)
+
+    def tearDown(self):
+        self.prefetcher.shutdown()
+        shutil.rmtree(self.cache_dir)
+
+    def _artifact(self, filename, size=len(DATA)):
+        return Prefetch.Artifact(self.url + filename, filename, size)
+
+    def _partial_path(self, filename):
+        return os.path.join(self.cache_dir, "partial", filename)
+
+    def _read(self, filename):
+        with open(os.path.join(self.cache_dir, filename), "rb") as f:
+            return f.read()
+
+    def test_download(self):
+        job = self.prefetcher.fetch([self._artifact("caja.deb")])
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.errors, {})
+        self.assertEqual(job.bytes_done, len(DATA))
+        self.assertEqual(self._read("caja.deb"), DATA)
+
+    def test_resume_partial_download(self):
+        with open(self._partial_path("caja.deb"), "wb") as f:
+            f.write(DATA[:1000])
+
+        job = self.prefetcher.fetch([self._artifact("caja.deb")])
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.errors, {})
+        self.assertEqual(_Handler.ranges, ["bytes=1000-"])
+        self.assertEqual(self._read("caja.deb"), DATA)
+
+    def test_restart_when_range_not_satisfiable(self):
+        with open(self._partial_path("caja.deb"), "wb") as f:
+            f.write(b"x" * (len(DATA) + 10))
+
+        job = self.prefetcher.fetch([self._artifact("caja.deb", None)])
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.errors, {})
+        self.assertEqual(_Handler.ranges, ["bytes={0}-".format(len(DATA) + 10), None])
+        self.assertEqual(self._read("caja.deb"), DATA)
+
+    def test_size_mismatch_discards_partial(self):
+        job = self.prefetcher.fetch([self._artifact("caja.deb", len(DATA) + 1)])
+        self.assertTrue(job.wait(10))
+        self.assertIn("caja.deb", job.errors)
+        self.assertFalse(os.path.exists(self._partial_path("caja.deb")))
+        self.assertFalse(self.prefetcher.is_cached(self._artifact("caja.deb")))
+
+    def test_rate_limit(self):
+        # Takes about a second at this rate.
+        self.prefetcher.limiter = Prefetch.BandwidthLimiter(len(DATA))
+        start = time.monotonic()
+        job = self.prefetcher.fetch([self._artifact("caja.deb")])
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.errors, {})
+        self.assertGreaterEqual(time.monotonic() - start, 0.6)
+
+    def test_cancel(self):
+        _Handler.delay = 0.1
+        job = self.prefetcher.fetch([self._artifact("caja.deb")])
+        job.cancel()
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.errors, {"caja.deb": "Cancelled"})
+        self.assertFalse(self.prefetcher.is_cached(self._artifact("caja.deb")))
+
+    def test_shared_download_continues_for_other_job(self):
+        _Handler.delay = 0.05
+        first = self.prefetcher.fetch([self._artifact("caja.deb")])
+        second = self.prefetcher.fetch([self._artifact("caja.deb")])
+        first.cancel()
+        self.assertTrue(second.wait(10))
+        self.assertEqual(second.errors, {})
+        self.assertEqual(len(_Handler.ranges), 1)
+        self.assertEqual(self._read("caja.deb"), DATA)
+
+    def test_resolve_does_not_take_download_slot(self):
+        self.prefetcher.shutdown()
+        self.prefetcher = Prefetch.Prefetcher(self.cache_dir, max_concurrent=1)
+        resolving = threading.Event()
+        release = threading.Event()
+
+        def _resolve():
+            resolving.set()
+            release.wait(10)
+            return []
+
+        slow = self.prefetcher.fetch(_resolve)
+        self.assertTrue(resolving.wait(10))
+        job = self.prefetcher.fetch([self._artifact("caja.deb")])
+        self.assertTrue(job.wait(10))
+        self.assertFalse(slow.is_done())
+        release.set()
+        self.assertTrue(slow.wait(10))
+
+
+if __name__ == "__main__":
+    unittest.main()
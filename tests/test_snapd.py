@@ -0,0 +1,186 @@
+"""
+Tests for the snapd client, using a stand-in server on a Unix socket.
+"""
+
+import http.server
+import json
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import unittest
+import urllib.parse
+
+from pylib import snapd as Snapd
+from pylib import transaction as Transaction
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers like snapd. Changes are done after three polls.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        http.server.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def _send(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        # Close without telling the client, as snapd does with idle connections.
+        if self.server.drop_after_response:
+            self.server.drop_after_response = False
+            self.close_connection = True
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path))
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+
+        if url.path == "/v2/system-info":
+            return self._send({"type": "sync", "result": {"version": "2.45"}})
+
+        if url.path == "/v2/snaps":
+            names = query["snaps"][0].split(",") if "snaps" in query else ["core", "caja"]
+            return self._send({"type": "sync", "result": [{"name": name, "version": "1.0"} for name in names]})
+
+        if url.path == "/v2/find":
+            if query["name"][0] == "missing":
+                return self._send({"type": "error", "status-code": 404,
+                                   "result": {"message": "snap not found", "kind": "snap-not-found"}}, 404)
+            return self._send({"type": "sync", "result": [{"name": query["name"][0], "version": "2.0"}]})
+
+        if url.path.startswith("/v2/changes/"):
+            change = self.server.changes[url.path.split("/")[-1]]
+            change["polls"] += 1
+            ready = change["polls"] >= 3 or change["aborted"]
+            status = "Undone" if change["aborted"] else ("Done" if ready else "Doing")
+            tasks = [{"status": "Done" if ready else "Doing",
+                      "summary": 'Download snap "{0}"'.format(change["snaps"][0]),
+                      "progress": {"done": min(change["polls"], 3), "total": 3}}]
+            return self._send({"type": "sync", "result": {"id": change["id"], "status": status, "ready": ready, "tasks": tasks}})
+
+        self._send({"type": "error", "status-code": 404, "result": {"message": "not found"}}, 404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+        self.server.requests.append(("POST", self.path))
+
+        if self.server.drop_post:
+            self.close_connection = True
+            return
+
+        # Nothing to refresh, so snapd answers straight away.
+        if self.path == "/v2/snaps" and body["action"] == "refresh":
+            return self._send({"type": "sync", "result": []})
+
+        if self.path == "/v2/snaps":
+            change_id = str(len(self.server.changes) + 1)
+            self.server.changes[change_id] = {"id": change_id, "snaps": body["snaps"], "polls": 0, "aborted": False}
+            return self._send({"type": "async", "status-code": 202, "change": change_id}, 202)
+
+        self.server.changes[self.path.split("/")[-1]]["aborted"] = True
+        self._send({"type": "sync", "result": {}})
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        socketserver.ThreadingUnixStreamServer.__init__(self, path, _Handler)
+        self.connections = 0
+        self.requests = []
+        self.changes = {}
+        self.drop_after_response = False
+        self.drop_post = False
+
+
+class SnapdClientTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.folder, "snapd.socket")
+        self.server = _Server(self.socket_path)
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.client = Snapd.SnapdClient(self.socket_path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.folder)
+
+    def test_is_available(self):
+        self.assertTrue(self.client.is_available())
+        self.assertFalse(Snapd.SnapdClient(os.path.join(self.folder, "missing.socket")).is_available())
+
+    def test_requests_share_connection(self):
+        self.assertEqual(self.client.get_installed(), {"core": "1.0", "caja": "1.0"})
+        self.assertEqual(list(self.client.find_many(["caja", "missing", "pluma"]).keys()), ["caja", "pluma"])
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_get_snaps_in_batches(self):
+        names = ["snap{0}".format(number) for number in range(Snapd.BATCH_SIZE + 1)]
+        self.assertEqual(sorted(self.client.get_snaps(names).keys()), sorted(names))
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_retry_closed_connection(self):
+        self.server.drop_after_response = True
+        self.client.get_installed()
+        self.assertEqual(self.client.get_installed(), {"core": "1.0", "caja": "1.0"})
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_post_is_never_resent(self):
+        self.client.get_installed()
+        self.server.drop_post = True
+        with self.assertRaises(Snapd.SnapdError):
+            self.client.change("install", ["caja"])
+        self.assertEqual([request for request in self.server.requests if request[0] == "POST"], [("POST", "/v2/snaps")])
+
+    def test_wait_for_change(self):
+        change_id = self.client.change("install", ["caja"])
+        progress = []
+        change = self.client.wait_for_change(change_id, lambda *args: progress.append(args), interval=0.01)
+
+        self.assertEqual(change["status"], "Done")
+        self.assertEqual(progress, [(1, 3, "caja"), (2, 3, "caja"), (3, 3, None)])
+
+    def test_abort_change(self):
+        change_id = self.client.change("install", ["caja"])
+        abort = threading.Event()
+        abort.set()
+        change = self.client.wait_for_change(change_id, abort=abort, interval=0.01)
+
+        self.assertEqual(change["status"], "Undone")
+        self.assertIn(("POST", "/v2/changes/" + change_id), self.server.requests)
+
+    def test_change_without_work(self):
+        self.assertIsNone(self.client.change("refresh", ["caja"]))
+        self.assertEqual([request for request in self.server.requests if request[0] == "GET"], [])
+
+    def test_backend(self):
+        backend = Transaction.SnapBackend(self.client)
+        items = [Transaction.QueueItem("snap:" + name, name, "", "snap", [name], "install") for name in ["caja", "pluma"]]
+        progress = []
+        self.assertIsNone(backend.run("install", items, lambda *args: progress.append(args), threading.Event()))
+        self.assertEqual(self.server.changes["1"]["snaps"], ["caja", "pluma"])
+        self.assertTrue(progress)
+
+        results = backend.run("reinstall", items[:1], lambda *args: None, threading.Event())
+        self.assertEqual(list(results.keys()), ["snap:caja"])
+        self.assertEqual(len(self.server.changes), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
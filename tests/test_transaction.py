@@ -0,0 +1,168 @@
+"""
+Tests for the transaction queue, using FakeBackend so the system isn't changed.
+"""
+
+import threading
+import unittest
+
+from pylib import transaction as Transaction
+
+
+class BlockingBackend(Transaction.FakeBackend):
+    """
+    Waits in run() until the test releases it.
+    """
+    def __init__(self):
+        Transaction.FakeBackend.__init__(self)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def run(self, action, items, progress, abort):
+        self.started.set()
+        self.release.wait(5)
+        return Transaction.FakeBackend.run(self, action, items, progress, abort)
+
+
+def _item(name, action="install", backend="fake"):
+    return Transaction.QueueItem("fake:" + name, name, "", backend, [name], action)
+
+
+class TransactionQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = Transaction.FakeBackend()
+        self.lists = []
+        self.progress = []
+        self.finished = []
+        self.finished_changed = threading.Condition()
+        self.workers = []
+
+    def _make_queue(self, backend=None, deferred=True):
+        """
+        With 'deferred', the worker only runs when the test calls _run_workers().
+        """
+        return Transaction.TransactionQueue({"fake": backend or self.backend},
+                                            self.lists.append,
+                                            lambda *args: self.progress.append(args),
+                                            self._on_finished,
+                                            self.workers.append if deferred else None)
+
+    def _on_finished(self, items):
+        with self.finished_changed:
+            self.finished.append(items)
+            self.finished_changed.notify_all()
+
+    def _wait_finished(self, count):
+        """
+        on_finished is called just after the queue becomes idle, so wait for it.
+        """
+        with self.finished_changed:
+            self.assertTrue(self.finished_changed.wait_for(lambda: len(self.finished) >= count, 5))
+
+    def _run_workers(self):
+        while self.workers:
+            self.workers.pop(0)()
+
+    def test_merges_items_into_batches(self):
+        queue = self._make_queue()
+        queue.add(_item("caja"))
+        queue.add(_item("pluma"))
+        queue.add(_item("atril", "remove"))
+        self._run_workers()
+
+        self.assertEqual(self.backend.transactions, [("remove", ["atril"]), ("install", ["caja", "pluma"])])
+        self.assertEqual(len(self.finished), 1)
+        self.assertEqual(sorted([item.id for item in self.finished[0]]), ["fake:atril", "fake:caja", "fake:pluma"])
+        self.assertTrue(all([item.success for item in self.finished[0]]))
+
+    def test_rejects_duplicates_and_reports_failures(self):
+        self.backend.failures = ["pluma"]
+        queue = self._make_queue()
+        self.assertTrue(queue.add(_item("caja")))
+        self.assertFalse(queue.add(_item("caja")))
+        queue.add(_item("pluma"))
+        self._run_workers()
+
+        results = {item.id: item.error for item in self.finished[0]}
+        self.assertEqual(results, {"fake:caja": None, "fake:pluma": "Failed to install pluma"})
+
+    def test_unknown_backend(self):
+        queue = self._make_queue()
+        queue.add(_item("caja", backend="missing"))
+        self.assertEqual(self.workers, [])
+        self.assertEqual(queue.get_list()[0]["state"], "processed")
+
+    def test_drop_pending_item(self):
+        queue = self._make_queue()
+        queue.add(_item("caja"))
+        queue.add(_item("pluma"))
+        self.assertTrue(queue.drop("fake:pluma"))
+        self._run_workers()
+
+        self.assertEqual(self.backend.transactions, [("install", ["caja"])])
+        self.assertEqual([item["id"] for item in queue.get_list()], ["fake:caja"])
+
+    def test_drop_processing_item_is_refused(self):
+        backend = BlockingBackend()
+        queue = self._make_queue(backend, deferred=False)
+        queue.add(_item("caja"))
+        self.assertTrue(backend.started.wait(5))
+
+        self.assertFalse(queue.drop("fake:caja"))
+        backend.release.set()
+        self.assertTrue(queue.wait(5))
+        self._wait_finished(1)
+        self.assertTrue(self.finished[0][0].success)
+
+    def test_abort_stops_rest_of_batch(self):
+        queue = self._make_queue()
+
+        def _on_progress(item, value, value_end, position, total):
+            if item.id == "fake:caja" and value == 0:
+                self.assertTrue(queue.stop_active())
+        queue.on_progress = _on_progress
+
+        queue.add(_item("caja"))
+        queue.add(_item("pluma"))
+        self._run_workers()
+
+        results = {item.id: item.error for item in self.finished[0]}
+        self.assertEqual(results, {"fake:caja": None, "fake:pluma": "Aborted"})
+
+    def test_abort_refused_once_not_abortable(self):
+        queue = self._make_queue()
+        refused = []
+
+        def _on_progress(item, value, value_end, position, total):
+            if item.state == "processing" and not refused:
+                item.abortable = False
+                refused.append(queue.stop_active())
+        queue.on_progress = _on_progress
+
+        queue.add(_item("caja"))
+        queue.add(_item("pluma"))
+        self._run_workers()
+
+        self.assertEqual(refused, [False])
+        self.assertTrue(all([item.success for item in self.finished[0]]))
+
+    def test_idle_and_runs_counted_separately(self):
+        queue = self._make_queue(deferred=False)
+        queue.add(_item("caja"))
+        queue.add(_item("pluma"))
+        self.assertTrue(queue.wait(5))
+        self.assertFalse(queue.is_busy())
+
+        self.progress = []
+        queue.on_progress = lambda *args: self.progress.append(args)
+        self._wait_finished(1)
+        queue.add(_item("atril"))
+        self.assertTrue(queue.wait(5))
+        self._wait_finished(2)
+
+        self.assertEqual(len(self.finished), 2)
+        self.assertEqual([item.id for item in self.finished[1]], ["fake:atril"])
+        self.assertEqual(set([(position, total) for item, value, value_end, position, total in self.progress]), {(1, 1)})
+
+
+if __name__ == "__main__":
+    unittest.main()